@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+from config import (
+    ADAPTIVE_VARIANTS,
+    MIN_VARIANTS,
+    NUM_VARIANTS,
+    VARIANT_LOAD_TARGET,
+    VARIANT_MAX_QUEUE_DEPTH,
+)
+from metrics.core import counter, gauge
+from models.scheduler import ProviderScheduler, provider_scheduler
+
+variant_decisions = counter(
+    "generation_variant_count_decisions_total",
+    "Generation requests by the number of variants they were given",
+    ("variants",),
+)
+variants_shed = counter(
+    "generation_variants_shed_total",
+    "Variants not generated because the server was under load",
+)
+variants_in_flight = gauge(
+    "generation_variants_in_flight", "Variant generations currently admitted"
+)
+
+
+class AdmissionController:
+    """Chooses how many variants each generation request gets
+
+    Every request gets `max_variants` while there is headroom. As the
+    variants in flight across all connections approach `load_target`, new
+    requests get fewer of them, down to `min_variants`. While the provider
+    scheduler has more than `max_queue_depth` requests waiting, new requests
+    get `min_variants` straight away.
+    """
+
+    def __init__(
+        self,
+        max_variants: int = NUM_VARIANTS,
+        min_variants: int = MIN_VARIANTS,
+        load_target: int = VARIANT_LOAD_TARGET,
+        max_queue_depth: int = VARIANT_MAX_QUEUE_DEPTH,
+        enabled: bool = ADAPTIVE_VARIANTS,
+        scheduler: ProviderScheduler = provider_scheduler,
+    ):
+        self.max_variants = max_variants
+        self.min_variants = min(min_variants, max_variants)
+        self.load_target = load_target
+        self.max_queue_depth = max_queue_depth
+        self.enabled = enabled
+        self.scheduler = scheduler
+        self.in_flight = 0
+
+    def choose_variant_count(self, pages: int = 1) -> int:
+        """Variants per page for a new request generating `pages` pages"""
+        if not self.enabled:
+            count = self.max_variants
+        elif self.scheduler.total_stats()["queued"] > self.max_queue_depth:
+            count = self.min_variants
+        else:
+            headroom = self.load_target - self.in_flight
+            count = max(
+                self.min_variants, min(self.max_variants, headroom // max(pages, 1))
+            )
+
+        variant_decisions.inc(variants=str(count))
+        if count < self.max_variants:
+            variants_shed.inc((self.max_variants - count) * pages)
+            print(
+                f"[ADMISSION] Serving {count} of {self.max_variants} variants "
+                f"({self.in_flight} in flight, target {self.load_target})"
+            )
+        return count
+
+    @contextmanager
+    def admit(self, variants: int) -> Iterator[None]:
+        """Count `variants` generations as in flight while the body runs"""
+        self.in_flight += variants
+        variants_in_flight.set(self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= variants
+            variants_in_flight.set(self.in_flight)
+
+
+admission_controller = AdmissionController()
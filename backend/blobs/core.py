@@ -0,0 +1,187 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List
+
+from config import BLOB_CACHE_MAX_BYTES, BLOB_DIR, BLOB_DISK_MAX_BYTES
+from metrics.core import counter, gauge
+
+# Prefix of the references clients send in place of content the server has
+BLOB_REF_PREFIX = "blob:"
+
+blob_hits = counter("blob_store_hits_total", "Blob lookups served", ("tier",))
+blob_misses = counter("blob_store_misses_total", "Blob lookups for unknown content")
+blob_evictions = counter(
+    "blob_store_evictions_total", "Blobs evicted to stay within budget", ("tier",)
+)
+blob_bytes = gauge("blob_store_bytes", "Bytes held by the blob store", ("tier",))
+
+
+class BlobMissingError(ValueError):
+    def __init__(self, digests: List[str]):
+        super().__init__(f"Unknown blob references: {', '.join(digests)}")
+        self.digests = digests
+
+
+def blob_digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def blob_ref(content: str) -> str:
+    return BLOB_REF_PREFIX + blob_digest(content)
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_REF_PREFIX)
+
+
+class BlobStore:
+    """Strings (HTML, data URLs) keyed by the SHA-256 of their UTF-8 bytes
+
+    Recently used blobs stay in memory up to `max_memory_bytes`. Older ones
+    spill to files in `directory` and are dropped least-recently-used first
+    once the directory holds more than `max_disk_bytes`. A blob read from
+    disk moves back into memory. `put` and `get` may block on disk I/O, so
+    async code calls them in a thread.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = BLOB_CACHE_MAX_BYTES,
+        directory: str = BLOB_DIR,
+        max_disk_bytes: int = BLOB_DISK_MAX_BYTES,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, content: str) -> str:
+        """Store content and return its digest"""
+        with self._lock:
+            return self._put(content)
+
+    def get(self, digest: str) -> str | None:
+        with self._lock:
+            return self._get(digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._memory or digest in self._disk
+
+    def missing(self, digests: Iterable[str]) -> List[str]:
+        return [digest for digest in dict.fromkeys(digests) if digest not in self]
+
+    def resolve(self, value: str) -> str:
+        """Content for a "blob:<digest>" reference; other values are returned as is"""
+        if not is_blob_ref(value):
+            return value
+        digest = value[len(BLOB_REF_PREFIX) :]
+        content = self.get(digest)
+        if content is None:
+            raise BlobMissingError([digest])
+        return content
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self.memory_bytes = 0
+            self.disk_bytes = 0
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._update_gauges()
+
+    def _put(self, content: str) -> str:
+        digest = blob_digest(content)
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return digest
+        self._remove_from_disk(digest)
+        self._memory[digest] = content
+        self.memory_bytes += len(content)
+        self._enforce_memory_budget()
+        return digest
+
+    def _get(self, digest: str) -> str | None:
+        content = self._memory.get(digest)
+        if content is not None:
+            self._memory.move_to_end(digest)
+            blob_hits.inc(tier="memory")
+            return content
+
+        if digest not in self._disk:
+            blob_misses.inc()
+            return None
+        try:
+            with open(self._path(digest), "r", encoding="utf-8") as blob_file:
+                content = blob_file.read()
+        except FileNotFoundError:
+            self._forget_disk_entry(digest)
+            blob_misses.inc()
+            return None
+        blob_hits.inc(tier="disk")
+        self._put(content)
+        return content
+
+    def _enforce_memory_budget(self) -> None:
+        while self.memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            digest, content = self._memory.popitem(last=False)
+            self.memory_bytes -= len(content)
+            blob_evictions.inc(tier="memory")
+            self._spill_to_disk(digest, content)
+        self._update_gauges()
+
+    def _spill_to_disk(self, digest: str, content: str) -> None:
+        size = len(content)
+        if size > self.max_disk_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(digest), "w", encoding="utf-8") as blob_file:
+            blob_file.write(content)
+        self._disk[digest] = size
+        self.disk_bytes += size
+        while self.disk_bytes > self.max_disk_bytes:
+            evicted = next(iter(self._disk))
+            self._remove_from_disk(evicted)
+            blob_evictions.inc(tier="disk")
+
+    def _remove_from_disk(self, digest: str) -> None:
+        if digest not in self._disk:
+            return
+        self._forget_disk_entry(digest)
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _forget_disk_entry(self, digest: str) -> None:
+        self.disk_bytes -= self._disk.pop(digest)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        blob_bytes.set(self.memory_bytes, tier="memory")
+        blob_bytes.set(self.disk_bytes, tier="disk")
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+
+blob_store = BlobStore()
+
+
+def collect_blob_refs(values: Iterable[Any]) -> List[str]:
+    """Digests of every blob reference in `values`"""
+    return [value[len(BLOB_REF_PREFIX) :] for value in values if is_blob_ref(value)]
@@ -6,6 +6,7 @@ import re
 from dataclasses import dataclass
 from typing import Any, Awaitable, Callable
 
+from codegen.html_document import IndexedHtmlDocument
 
 logger = logging.getLogger(__name__)
 
@@ -14,53 +15,49 @@ class BlockUpdateError(ValueError):
     pass
 
 
-def _find_whitespace_insensitive_span(text: str, snippet: str) -> tuple[int, int]:
-    text_stripped = []
-    text_index_map = []
-    for index, char in enumerate(text):
-        if not char.isspace():
-            text_stripped.append(char)
-            text_index_map.append(index)
-
-    snippet_stripped = "".join(char for char in snippet if not char.isspace())
-    if not snippet_stripped:
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+def _find_whitespace_insensitive_span(
+    document: IndexedHtmlDocument, snippet: str
+) -> tuple[int, int]:
+    if not any(not char.isspace() for char in snippet):
         raise BlockUpdateError("Original snippet is empty after whitespace stripping.")
 
-    stripped_text = "".join(text_stripped)
-    start_stripped = stripped_text.find(snippet_stripped)
-    if start_stripped == -1:
+    span = document.find_whitespace_insensitive(snippet)
+    if span is None:
         raise BlockUpdateError(
             "Original snippet not found for replacement (whitespace-insensitive)."
         )
-
-    end_stripped = start_stripped + len(snippet_stripped) - 1
-    start_index = text_index_map[start_stripped]
-    end_index = text_index_map[end_stripped] + 1
-    return start_index, end_index
+    return span
 
 
-def replace_first_occurrence(html: str, old: str, new: str) -> tuple[str, int]:
-    start_index = html.find(old)
+def _first_occurrence_span(document: IndexedHtmlDocument, old: str) -> tuple[int, int]:
+    start_index = document.find(old)
     if start_index == -1:
-        start_index, end_index = _find_whitespace_insensitive_span(html, old)
-        updated_html = html[:start_index] + new + html[end_index:]
-        end_index = start_index + len(new)
-        return updated_html, end_index
-    updated_html = html[:start_index] + new + html[start_index + len(old) :]
-    end_index = start_index + len(new)
-    return updated_html, end_index
+        return _find_whitespace_insensitive_span(document, old)
+    return start_index, start_index + len(old)
 
 
-def replace_tag_by_data_cid(
-    html: str, data_cid: str, new_html: str
-) -> tuple[str, int]:
-    pattern = re.compile(
-        r"<(?P<tag>[a-zA-Z][\w:-]*)\b[^>]*\bdata-cid=(\"|')"
-        + re.escape(data_cid)
-        + r"(\"|')[^>]*(?P<selfclosing>/?)>",
-        re.IGNORECASE,
-    )
-    matches = list(pattern.finditer(html))
+def _data_cid_element_span(
+    document: IndexedHtmlDocument, data_cid: str, new_html: str
+) -> tuple[int, int]:
+    matches = document.find_data_cid(data_cid)
     if not matches:
         raise BlockUpdateError(
             f"Element with data-cid '{data_cid}' not found."
@@ -71,65 +68,41 @@ def replace_tag_by_data_cid(
         )
 
     match = matches[0]
-    start_index = match.start()
-    tag_name = match.group("tag")
-    self_closing = match.group("selfclosing") == "/"
-
-    void_tags = {
-        "area",
-        "base",
-        "br",
-        "col",
-        "embed",
-        "hr",
-        "img",
-        "input",
-        "link",
-        "meta",
-        "param",
-        "source",
-        "track",
-        "wbr",
-    }
-    if self_closing or tag_name.lower() in void_tags:
+    tag_name = match.tag
+
+    if match.self_closing or tag_name.lower() in VOID_TAGS:
         if not _is_full_tag_replacement(tag_name, new_html, is_void=True):
             raise BlockUpdateError(
                 f"Replacement html does not fully cover <{tag_name}> element."
             )
-        end_index = match.end()
-    else:
-        if not _is_full_tag_replacement(tag_name, new_html, is_void=False):
-            raise BlockUpdateError(
-                f"Replacement html does not fully cover <{tag_name}> element."
-            )
-        tag_pattern = re.compile(
-            rf"<(/?){re.escape(tag_name)}\b[^>]*>", re.IGNORECASE
+        return match.start, match.end
+
+    if not _is_full_tag_replacement(tag_name, new_html, is_void=False):
+        raise BlockUpdateError(
+            f"Replacement html does not fully cover <{tag_name}> element."
+        )
+    end_index = document.find_element_end(match)
+    if end_index is None:
+        raise BlockUpdateError(
+            f"Closing </{tag_name}> not found for data-cid '{data_cid}'."
         )
-        depth = 0
-        end_index = None
+    return match.start, end_index
 
-        for tag_match in tag_pattern.finditer(html, match.start()):
-            if tag_match.start() == match.start():
-                depth = 1
-                continue
-            if depth == 0:
-                continue
-            if tag_match.group(1) == "/":
-                depth -= 1
-            else:
-                depth += 1
-            if depth == 0:
-                end_index = tag_match.end()
-                break
 
-        if end_index is None:
-            raise BlockUpdateError(
-                f"Closing </{tag_name}> not found for data-cid '{data_cid}'."
-            )
+def replace_first_occurrence(html: str, old: str, new: str) -> tuple[str, int]:
+    document = IndexedHtmlDocument(html)
+    start_index, end_index = _first_occurrence_span(document, old)
+    document.splice(start_index, end_index, new)
+    return document.text, start_index + len(new)
 
-    updated_html = html[:start_index] + new_html + html[end_index:]
-    replacement_end_index = start_index + len(new_html)
-    return updated_html, replacement_end_index
+
+def replace_tag_by_data_cid(
+    html: str, data_cid: str, new_html: str
+) -> tuple[str, int]:
+    document = IndexedHtmlDocument(html)
+    start_index, end_index = _data_cid_element_span(document, data_cid, new_html)
+    document.splice(start_index, end_index, new_html)
+    return document.text, start_index + len(new_html)
 
 
 def _is_full_tag_replacement(tag_name: str, new_html: str, is_void: bool) -> bool:
@@ -151,7 +124,7 @@ def _is_full_tag_replacement(tag_name: str, new_html: str, is_void: bool) -> boo
 
 @dataclass
 class BlockUpdateState:
-    current_html: str
+    document: IndexedHtmlDocument
     streamed_length: int = 0
     applied_ops: int = 0
 
@@ -162,24 +135,34 @@ class BlockUpdateStreamProcessor:
         base_html: str,
         send_chunk: Callable[[str], Awaitable[None]],
     ) -> None:
-        self._state = BlockUpdateState(current_html=base_html)
+        self._state = BlockUpdateState(document=IndexedHtmlDocument(base_html))
         self._send_chunk = send_chunk
         self._buffer = ""
         self._is_capturing = False
+        self._is_cancelled = False
 
     @property
     def current_html(self) -> str:
-        return self._state.current_html
+        return self._state.document.text
 
     @property
     def applied_ops(self) -> int:
         return self._state.applied_ops
 
+    def cancel(self) -> None:
+        """Stop applying ops; chunks that still arrive afterwards are dropped"""
+        self._is_cancelled = True
+        self._buffer = ""
+
     async def process_chunk(self, content: str) -> None:
+        if self._is_cancelled:
+            return
         self._buffer += content
         await self._extract_ops_from_buffer()
 
     async def process_full_response(self, content: str) -> None:
+        if self._is_cancelled:
+            return
         self._buffer += content
         await self._extract_ops_from_buffer(flush=True)
 
@@ -225,8 +208,8 @@ class BlockUpdateStreamProcessor:
             if not data_cid or not isinstance(new_html, str):
                 raise BlockUpdateError("dataCid ops must include an html field.")
             try:
-                updated_html, end_index = replace_tag_by_data_cid(
-                    self._state.current_html, str(data_cid), new_html
+                start_index, end_index = _data_cid_element_span(
+                    self._state.document, str(data_cid), new_html
                 )
             except BlockUpdateError as exc:
                 logger.warning(
@@ -239,8 +222,8 @@ class BlockUpdateStreamProcessor:
             if not isinstance(old_html, str) or not isinstance(new_html, str):
                 raise BlockUpdateError("replace ops must include old and new strings.")
             try:
-                updated_html, end_index = replace_first_occurrence(
-                    self._state.current_html, old_html, new_html
+                start_index, end_index = _first_occurrence_span(
+                    self._state.document, old_html
                 )
             except BlockUpdateError as exc:
                 logger.warning("Block update old/new failed: %s", exc)
@@ -248,16 +231,16 @@ class BlockUpdateStreamProcessor:
         else:
             raise BlockUpdateError("Unknown block update operation.")
 
-        self._state.current_html = updated_html
+        self._state.document.splice(start_index, end_index, new_html)
         self._state.applied_ops += 1
-        await self._stream_until(end_index)
+        await self._stream_until(start_index + len(new_html))
 
     async def _stream_until(self, end_index: int) -> None:
         if end_index < self._state.streamed_length:
             self._state.streamed_length = 0
         if end_index <= self._state.streamed_length:
             return
-        delta = self._state.current_html[self._state.streamed_length : end_index]
+        delta = self._state.document.slice(self._state.streamed_length, end_index)
         if delta:
             await self._send_chunk(delta)
         self._state.streamed_length = end_index
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import bisect
+import re
+from dataclasses import dataclass, replace
+from typing import Iterator
+
+from codegen.piece_table import PieceTable
+
+
+_DATA_CID_TAG_PATTERN = re.compile(
+    r"<(?P<tag>[a-zA-Z][\w:-]*)\b[^>]*\bdata-cid=(\"|')(?P<cid>[^\"']*)(\"|')[^>]*(?P<selfclosing>/?)>",
+    re.IGNORECASE,
+)
+
+
+@dataclass(eq=False)
+class TagSpan:
+    """Opening tag of an element carrying a data-cid attribute"""
+
+    start: int
+    end: int
+    tag: str
+    data_cid: str
+    self_closing: bool
+
+
+def find_whitespace_insensitive(text: str, snippet: str, start: int = 0) -> tuple[int, int] | None:
+    """Find `snippet` in `text` ignoring all whitespace, returning offsets into `text`
+
+    The span starts at the first and ends after the last non-whitespace character
+    of the match. Runs a single regex with optional whitespace between every
+    character, so no whitespace-stripped copy of the document is needed.
+    """
+    chars = [re.escape(char) for char in snippet if not char.isspace()]
+    if not chars:
+        return None
+    match = re.compile(r"\s*".join(chars)).search(text, start)
+    if match is None:
+        return None
+    return match.start(), match.end()
+
+
+class IndexedHtmlDocument:
+    """HTML document with an incrementally maintained index of data-cid elements
+
+    `splice` updates the index locally: spans overlapping the edit are dropped,
+    spans after it are shifted, and only the edited region is rescanned. Looking
+    up an element by data-cid therefore doesn't rescan the whole document.
+
+    The text lives in a PieceTable, so edits and slices don't copy the page;
+    `text` builds the full string on demand.
+    """
+
+    def __init__(self, html: str):
+        self._buffer = PieceTable(html)
+        self._spans: list[TagSpan] = []
+        self._starts: list[int] = []
+        self._by_cid: dict[str, list[TagSpan]] = {}
+        self._shift_from = 0
+        self._shift = 0
+        self._index_region(0, len(html))
+
+    @property
+    def text(self) -> str:
+        return self._buffer.text
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def slice(self, start: int, end: int) -> str:
+        return self._buffer.slice(start, end)
+
+    def find(self, sub: str, start: int = 0) -> int:
+        return self._buffer.find(sub, start)
+
+    def find_whitespace_insensitive(self, snippet: str) -> tuple[int, int] | None:
+        # Rare fallback, so it's fine to materialize the document here
+        return find_whitespace_insensitive(self._buffer.text, snippet)
+
+    def find_data_cid(self, data_cid: str) -> list[TagSpan]:
+        """Opening tags with the given data-cid (case-insensitive), in document order"""
+        matches = []
+        for span in self._by_cid.get(data_cid.lower(), []):
+            shift = self._resolve(self._index_of(span))
+            matches.append(replace(span, start=span.start + shift, end=span.end + shift))
+        return sorted(matches, key=lambda span: span.start)
+
+    def find_element_end(self, span: TagSpan) -> int | None:
+        """End offset of the element opened by `span`, or None if it isn't closed"""
+        tag_pattern = re.compile(rf"<(/?){re.escape(span.tag)}\b[^>]*>", re.IGNORECASE)
+        depth = 0
+        for tag_start, tag_end, is_closing in self._iter_tag_matches(tag_pattern, span.start):
+            if tag_start == span.start:
+                depth = 1
+                continue
+            if depth == 0:
+                continue
+            if is_closing:
+                depth -= 1
+            else:
+                depth += 1
+            if depth == 0:
+                return tag_end
+        return None
+
+    def _iter_tag_matches(
+        self, tag_pattern: re.Pattern[str], start: int
+    ) -> Iterator[tuple[int, int, bool]]:
+        """Yield (start, end, is_closing) for tag matches at or after `start`
+
+        Tags can't contain '>', so each piece is searched in place up to its
+        last '>' and only the unterminated remainder is carried into the next.
+        """
+        carry = ""
+        carry_offset = start
+        for offset, source, lo, hi in self._buffer.iter_spans(start):
+            if carry:
+                close = source.find(">", lo, hi)
+                if close == -1:
+                    carry += source[lo:hi]
+                    continue
+                window = carry + source[lo : close + 1]
+                for tag_match in tag_pattern.finditer(window):
+                    yield (
+                        carry_offset + tag_match.start(),
+                        carry_offset + tag_match.end(),
+                        tag_match.group(1) == "/",
+                    )
+                offset += close + 1 - lo
+                lo = close + 1
+                carry = ""
+            cut = source.rfind(">", lo, hi) + 1
+            if cut > lo:
+                for tag_match in tag_pattern.finditer(source, lo, cut):
+                    yield (
+                        offset + tag_match.start() - lo,
+                        offset + tag_match.end() - lo,
+                        tag_match.group(1) == "/",
+                    )
+            else:
+                cut = lo
+            carry = source[cut:hi]
+            carry_offset = offset + cut - lo
+
+    def splice(self, start: int, end: int, new_text: str) -> None:
+        """Replace html[start:end] with `new_text` and update the index around it"""
+        delta = len(new_text) - (end - start)
+        self._buffer.splice(start, end, new_text)
+
+        # Drop spans the edit touched, then shift everything after it
+        first = self._bisect(start)
+        while first > 0 and self._span_end(first - 1) > start:
+            first -= 1
+        last = self._bisect(end)
+        self._remove_spans(first, last)
+        self._shift_spans(first, delta)
+
+        # Rescan from the tag the edit may have started in to the end of the
+        # tag it may have finished in
+        region_start = self._buffer.rfind("<", 0, start)
+        if region_start == -1:
+            region_start = start
+        region_end = self._buffer.find(">", start + len(new_text))
+        region_end = len(self._buffer) if region_end == -1 else region_end + 1
+        self._index_region(region_start, region_end)
+
+    # Shifting every span after an edit would make each op linear in the
+    # number of elements. Instead spans from index `_shift_from` onwards are
+    # stored `_shift` characters behind their real position; the pending shift
+    # is only applied to the spans the next edit passes over, which for the
+    # mostly top-to-bottom order of block updates is close to free.
+
+    def _resolve(self, index: int) -> int:
+        return self._shift if index >= self._shift_from else 0
+
+    def _span_start(self, index: int) -> int:
+        return self._starts[index] + self._resolve(index)
+
+    def _span_end(self, index: int) -> int:
+        return self._spans[index].end + self._resolve(index)
+
+    def _bisect(self, offset: int) -> int:
+        """Index of the first span starting at or after `offset`"""
+        index = bisect.bisect_left(self._starts, offset, 0, self._shift_from)
+        if index < self._shift_from:
+            return index
+        return bisect.bisect_left(self._starts, offset - self._shift, self._shift_from)
+
+    def _index_of(self, span: TagSpan) -> int:
+        index = bisect.bisect_left(self._starts, span.start, 0, self._shift_from)
+        if index < self._shift_from and self._spans[index] is span:
+            return index
+        return bisect.bisect_left(self._starts, span.start, self._shift_from)
+
+    def _materialize(self, index: int) -> None:
+        """Apply the pending shift to spans before `index`"""
+        if self._shift_from < index:
+            if self._shift:
+                for position in range(self._shift_from, index):
+                    self._apply_shift(position, self._shift)
+            self._shift_from = index
+        self._clear_empty_shift()
+
+    def _clear_empty_shift(self) -> None:
+        if self._shift_from >= len(self._spans):
+            self._shift_from = len(self._spans)
+            self._shift = 0
+
+    def _shift_spans(self, first: int, delta: int) -> None:
+        """Move spans from `first` onwards by `delta`"""
+        if first >= self._shift_from:
+            self._materialize(first)
+        elif self._shift_from - first <= len(self._spans) - self._shift_from:
+            for position in range(first, self._shift_from):
+                self._apply_shift(position, delta)
+        else:
+            # Cheaper to settle the tail and start a new pending shift here
+            self._materialize(len(self._spans))
+            self._shift_from = first
+        self._shift += delta
+        self._clear_empty_shift()
+
+    def _apply_shift(self, index: int, delta: int) -> None:
+        self._spans[index].start += delta
+        self._spans[index].end += delta
+        self._starts[index] += delta
+
+    def _remove_spans(self, first: int, last: int) -> None:
+        self._materialize(last)
+        for span in self._spans[first:last]:
+            key = span.data_cid.lower()
+            spans = self._by_cid[key]
+            spans.remove(span)
+            if not spans:
+                del self._by_cid[key]
+        del self._spans[first:last]
+        del self._starts[first:last]
+        self._shift_from -= last - first
+
+    def _index_region(self, region_start: int, region_end: int) -> None:
+        first = self._bisect(region_start)
+        last = self._bisect(region_end)
+        self._remove_spans(first, last)
+
+        new_spans: list[TagSpan] = []
+        region = self._buffer.slice(region_start, region_end)
+        for match in _DATA_CID_TAG_PATTERN.finditer(region):
+            new_spans.append(
+                TagSpan(
+                    start=region_start + match.start(),
+                    end=region_start + match.end(),
+                    tag=match.group("tag"),
+                    data_cid=match.group("cid"),
+                    self_closing=match.group("selfclosing") == "/",
+                )
+            )
+        self._materialize(first)
+        self._spans[first:first] = new_spans
+        self._starts[first:first] = [span.start for span in new_spans]
+        self._shift_from += len(new_spans)
+        for span in new_spans:
+            self._by_cid.setdefault(span.data_cid.lower(), []).append(span)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import bisect
+from typing import Iterator
+
+
+class PieceTable:
+    """Editable text stored as a list of (source, start, end) pieces
+
+    A splice splits at most two pieces and swaps the pieces between them for
+    one that points at the inserted text, so it never copies the document.
+    Offsets are located by bisecting cumulative piece ends. The full string
+    is only built when `text` is read, and is cached until the next splice.
+    """
+
+    def __init__(self, text: str = ""):
+        self._pieces: list[tuple[str, int, int]] = [(text, 0, len(text))] if text else []
+        self._ends: list[int] = [len(text)] if text else []
+        self._length = len(text)
+        self._text: str | None = text
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def piece_count(self) -> int:
+        return len(self._pieces)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.slice(0, self._length)
+        return self._text
+
+    def splice(self, start: int, end: int, new_text: str) -> None:
+        """Replace [start, end) with `new_text`"""
+        if not 0 <= start <= end <= self._length:
+            raise IndexError(f"Invalid splice range [{start}, {end})")
+        first = self._split(start)
+        last = self._split(end)
+        self._pieces[first:last] = [(new_text, 0, len(new_text))] if new_text else []
+        self._length += len(new_text) - (end - start)
+        self._text = None
+
+        del self._ends[first:]
+        offset = self._ends[-1] if self._ends else 0
+        for source_piece in self._pieces[first:]:
+            offset += source_piece[2] - source_piece[1]
+            self._ends.append(offset)
+
+    def iter_spans(
+        self, start: int = 0, end: int | None = None
+    ) -> Iterator[tuple[int, str, int, int]]:
+        """Yield (offset, source, lo, hi) for each piece overlapping [start, end)
+
+        `source[lo:hi]` is the piece's text and `offset` its position in the
+        document. Nothing is copied, so callers can search `source` in place.
+        """
+        end = self._length if end is None else min(end, self._length)
+        if start >= end:
+            return
+        index = bisect.bisect_right(self._ends, start)
+        while index < len(self._pieces):
+            source, piece_start, piece_end = self._pieces[index]
+            offset = self._ends[index] - (piece_end - piece_start)
+            if offset >= end:
+                break
+            lo = piece_start + max(start - offset, 0)
+            hi = piece_end - max(self._ends[index] - end, 0)
+            yield max(offset, start), source, lo, hi
+            index += 1
+
+    def slice(self, start: int, end: int) -> str:
+        if self._text is not None:
+            return self._text[start:end]
+        return "".join(source[lo:hi] for _, source, lo, hi in self.iter_spans(start, end))
+
+    def find(self, sub: str, start: int = 0) -> int:
+        if self._text is not None:
+            return self._text.find(sub, start)
+        if not sub:
+            return min(start, self._length)
+        # Keep the last len(sub) - 1 characters seen so matches spanning
+        # piece boundaries are found too
+        tail = ""
+        tail_offset = start
+        for offset, source, lo, hi in self.iter_spans(start):
+            if tail:
+                window = tail + source[lo : min(hi, lo + len(sub) - 1)]
+                index = window.find(sub)
+                if index != -1:
+                    return tail_offset + index
+            index = source.find(sub, lo, hi)
+            if index != -1:
+                return offset + index - lo
+            if len(sub) > 1:
+                tail = (tail + source[max(lo, hi - len(sub) + 1) : hi])[-(len(sub) - 1) :]
+                tail_offset = offset + (hi - lo) - len(tail)
+        return -1
+
+    def rfind(self, sub: str, start: int = 0, end: int | None = None) -> int:
+        end = self._length if end is None else end
+        if self._text is not None or len(sub) != 1:
+            return self.text.rfind(sub, start, end)
+        for offset, source, lo, hi in reversed(list(self.iter_spans(start, end))):
+            index = source.rfind(sub, lo, hi)
+            if index != -1:
+                return offset + index - lo
+        return -1
+
+    def _split(self, offset: int) -> int:
+        """Ensure a piece boundary at `offset` and return the index of the piece starting there"""
+        index = bisect.bisect_right(self._ends, offset)
+        if index == len(self._pieces):
+            return index
+        source, piece_start, piece_end = self._pieces[index]
+        split_at = piece_start + offset - (self._ends[index] - (piece_end - piece_start))
+        if split_at == piece_start:
+            return index
+        self._pieces[index : index + 1] = [
+            (source, piece_start, split_at),
+            (source, split_at, piece_end),
+        ]
+        self._ends.insert(index, offset)
+        return index + 1
@@ -1,5 +1,9 @@
 import unittest
-from codegen.utils import extract_html_content
+from codegen.utils import (
+    extract_html_content,
+    iter_restored_base64_placeholders,
+    restore_base64_placeholders,
+)
 
 
 class TestUtils(unittest.TestCase):
@@ -53,5 +57,45 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestRestoreBase64Placeholders(unittest.TestCase):
+
+    def test_restores_all_known_placeholders(self):
+        text = '<img src="__IMG_BASE64_1__"><img src="__IMG_BASE64_12__">'
+        mapping = {
+            "__IMG_BASE64_1__": "data:image/png;base64,AAA",
+            "__IMG_BASE64_12__": "data:image/png;base64,BBB",
+        }
+        result = restore_base64_placeholders(text, mapping)
+        self.assertEqual(
+            result,
+            '<img src="data:image/png;base64,AAA"><img src="data:image/png;base64,BBB">',
+        )
+
+    def test_unknown_placeholders_are_left_alone(self):
+        text = "__IMG_BASE64_3__ and __IMG_BASE64_1__"
+        mapping = {"__IMG_BASE64_1__": "data:image/png;base64,AAA"}
+        result = restore_base64_placeholders(text, mapping)
+        self.assertEqual(result, "__IMG_BASE64_3__ and data:image/png;base64,AAA")
+
+    def test_iterator_yields_same_output_in_pieces(self):
+        mapping = {
+            f"__IMG_BASE64_{i}__": f"data:image/png;base64,{i}" for i in range(1, 6)
+        }
+        text = "".join(f'<p>filler</p><img src="{placeholder}" />' for placeholder in mapping)
+        pieces = list(iter_restored_base64_placeholders(text, mapping))
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), restore_base64_placeholders(text, mapping))
+
+    def test_matches_replacing_each_placeholder_in_turn(self):
+        mapping = {
+            f"__IMG_BASE64_{i}__": f"data:image/png;base64,{i}" for i in range(1, 51)
+        }
+        text = "".join(f'<p>filler</p><img src="{placeholder}" />' for placeholder in mapping)
+        expected = text
+        for placeholder, data_url in mapping.items():
+            expected = expected.replace(placeholder, data_url)
+        self.assertEqual(restore_base64_placeholders(text, mapping), expected)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,15 @@
 import re
-from typing import Dict, Tuple
+from typing import Dict, Iterator, Tuple
 
 
 _BASE64_DATA_URL_PATTERN = re.compile(
     r"data:image/[^;\s]+;base64,[A-Za-z0-9+/=]+"
 )
+_BASE64_PLACEHOLDER_PATTERN = re.compile(r"__IMG_BASE64_\d+__")
+_BASE64_PLACEHOLDER_PREFIX = "__IMG_BASE64_"
+_PARTIAL_PLACEHOLDER_SUFFIX_PATTERN = re.compile(r"\d*_?")
+# Longest tail we might hold back: prefix + index digits + "__"
+_MAX_PLACEHOLDER_LENGTH = len(_BASE64_PLACEHOLDER_PREFIX) + 20
 
 
 def extract_html_content(text: str):
@@ -41,8 +46,78 @@ def replace_base64_data_urls(
     return scrubbed_text, placeholder_mapping
 
 
+def iter_restored_base64_placeholders(
+    text: str, mapping: Dict[str, str]
+) -> Iterator[str]:
+    """Yield `text` in pieces with every known placeholder replaced by its data URL
+
+    Scans the text once for the `__IMG_BASE64_n__` pattern, so the cost is
+    O(len(text)) regardless of how many images there are.
+    """
+    last_end = 0
+    for match in _BASE64_PLACEHOLDER_PATTERN.finditer(text):
+        data_url = mapping.get(match.group(0))
+        if data_url is None:
+            continue
+        if match.start() > last_end:
+            yield text[last_end : match.start()]
+        yield data_url
+        last_end = match.end()
+    if last_end < len(text):
+        yield text[last_end:]
+
+
 def restore_base64_placeholders(text: str, mapping: Dict[str, str]) -> str:
-    restored = text
-    for placeholder, data_url in mapping.items():
-        restored = restored.replace(placeholder, data_url)
-    return restored
+    if not mapping:
+        return text
+    return "".join(iter_restored_base64_placeholders(text, mapping))
+
+
+def _is_partial_placeholder(text: str) -> bool:
+    """Whether `text` could be the start of a placeholder that isn't complete yet"""
+    prefix_length = len(_BASE64_PLACEHOLDER_PREFIX)
+    if len(text) <= prefix_length:
+        return _BASE64_PLACEHOLDER_PREFIX.startswith(text)
+    if not text.startswith(_BASE64_PLACEHOLDER_PREFIX):
+        return False
+    return bool(_PARTIAL_PLACEHOLDER_SUFFIX_PATTERN.fullmatch(text[prefix_length:]))
+
+
+class StreamingPlaceholderRestorer:
+    """Restores base64 placeholders in streamed chunks as they arrive
+
+    A placeholder can be split across chunk boundaries, so a trailing fragment
+    that might still become a placeholder is held back until the next chunk
+    (or `flush`) shows whether it is one.
+    """
+
+    def __init__(self, mapping: Dict[str, str]):
+        self.mapping = mapping
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+
+        # A partial placeholder can only start in the last _MAX_PLACEHOLDER_LENGTH
+        # characters, and only after the last complete placeholder
+        search_start = max(0, len(text) - _MAX_PLACEHOLDER_LENGTH)
+        window_start = max(0, len(text) - 2 * _MAX_PLACEHOLDER_LENGTH)
+        for match in _BASE64_PLACEHOLDER_PATTERN.finditer(text, window_start):
+            search_start = max(search_start, match.end())
+
+        hold_index = len(text)
+        index = text.find("_", search_start)
+        while index != -1:
+            if _is_partial_placeholder(text[index:]):
+                hold_index = index
+                break
+            index = text.find("_", index + 1)
+
+        self._pending = text[hold_index:]
+        return restore_base64_placeholders(text[:hold_index], self.mapping)
+
+    def flush(self) -> str:
+        """Return whatever is still held back once the stream has ended"""
+        text = self._pending
+        self._pending = ""
+        return restore_base64_placeholders(text, self.mapping)
@@ -2,15 +2,226 @@
 # Setting to True will stream a mock response instead of calling the OpenAI API
 # TODO: Should only be set to true when value is 'True', not any abitrary truthy value
 import os
+import tempfile
 
 NUM_VARIANTS = 4
 
+# Adaptive variant fan-out (opt-in). Under load each request gets fewer
+# variants (down to MIN_VARIANTS) so the variant generations in flight across
+# all connections stay within VARIANT_LOAD_TARGET. Requests also drop to
+# MIN_VARIANTS while more than VARIANT_MAX_QUEUE_DEPTH provider requests are
+# queued, i.e. when the provider concurrency limits are saturated
+ADAPTIVE_VARIANTS = os.environ.get("ADAPTIVE_VARIANTS", "false").lower() == "true"
+MIN_VARIANTS = int(os.environ.get("MIN_VARIANTS", 2))
+VARIANT_LOAD_TARGET = int(os.environ.get("VARIANT_LOAD_TARGET", 48))
+VARIANT_MAX_QUEUE_DEPTH = int(os.environ.get("VARIANT_MAX_QUEUE_DEPTH", 16))
+
 # LLM-related
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", None)
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", None)
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", None)
 OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", None)
 
+# Provider client pooling
+# Clients are shared across requests and keep their connections alive so each
+# variant doesn't pay for DNS, TCP and TLS setup again
+PROVIDER_POOL_MAX_CONNECTIONS = int(os.environ.get("PROVIDER_POOL_MAX_CONNECTIONS", 100))
+PROVIDER_POOL_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("PROVIDER_POOL_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+PROVIDER_POOL_KEEPALIVE_EXPIRY = float(
+    os.environ.get("PROVIDER_POOL_KEEPALIVE_EXPIRY", 60)
+)
+# Clients that haven't been used for this many seconds are closed
+PROVIDER_CLIENT_IDLE_TTL = float(os.environ.get("PROVIDER_CLIENT_IDLE_TTL", 600))
+
+# Process-wide scheduling of provider requests across all connections.
+# Requests beyond these concurrency limits wait in fair per-connection queues.
+# 0 means unlimited; set them (e.g. 16 per provider, 8 per model) to keep a
+# busy server within what its provider accounts allow
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("PROVIDER_MAX_CONCURRENCY", 0))
+PROVIDER_MODEL_MAX_CONCURRENCY = int(
+    os.environ.get("PROVIDER_MODEL_MAX_CONCURRENCY", 0)
+)
+# Per-provider rate budgets such as "openai=500,anthropic=50"; providers that
+# aren't listed are unlimited
+PROVIDER_RPM_LIMITS = os.environ.get("PROVIDER_RPM_LIMITS", "")
+PROVIDER_TPM_LIMITS = os.environ.get("PROVIDER_TPM_LIMITS", "")
+# Seconds between status updates sent to clients waiting in the queue
+PROVIDER_QUEUE_STATUS_INTERVAL = float(
+    os.environ.get("PROVIDER_QUEUE_STATUS_INTERVAL", 5)
+)
+
+# Variant models are routed from a rolling window of per-model telemetry.
+# "latency" avoids models whose median time-to-first-token is over budget,
+# whose error rate is too high or that were recently rate limited; "static"
+# keeps the configured order
+ROUTING_POLICY = os.environ.get("ROUTING_POLICY", "latency")
+ROUTING_TELEMETRY_WINDOW_SECONDS = float(
+    os.environ.get("ROUTING_TELEMETRY_WINDOW_SECONDS", 300)
+)
+ROUTING_TTFT_BUDGET_SECONDS = float(os.environ.get("ROUTING_TTFT_BUDGET_SECONDS", 15))
+ROUTING_MAX_ERROR_RATE = float(os.environ.get("ROUTING_MAX_ERROR_RATE", 0.5))
+# Models with fewer recent requests than this are treated as healthy
+ROUTING_MIN_SAMPLES = int(os.environ.get("ROUTING_MIN_SAMPLES", 3))
+# A degraded model gets traffic again once it hasn't been sent a request for
+# this long, so it can show that it recovered
+ROUTING_DEGRADED_COOLDOWN_SECONDS = float(
+    os.environ.get("ROUTING_DEGRADED_COOLDOWN_SECONDS", 30)
+)
+# Consecutive failures (not counting rate limits) that open a provider's
+# circuit breaker, and how long it stays open before the provider is tried again
+ROUTING_BREAKER_FAILURES = int(os.environ.get("ROUTING_BREAKER_FAILURES", 5))
+ROUTING_BREAKER_COOLDOWN_SECONDS = float(
+    os.environ.get("ROUTING_BREAKER_COOLDOWN_SECONDS", 60)
+)
+# Append every request outcome to this JSONL file for offline policy replay
+ROUTING_TRACE_PATH = os.environ.get("ROUTING_TRACE_PATH", "")
+
+# Hedged requests for the first variant (opt-in). If it hasn't streamed a
+# token by this percentile of the model's recent time-to-first-token, a
+# duplicate request is raced against it and the slower one is cancelled.
+# HEDGE_MODEL is "fallback" (a model from another provider among the variants)
+# or "same"
+HEDGE_FIRST_VARIANT = os.environ.get("HEDGE_FIRST_VARIANT", "false").lower() == "true"
+HEDGE_TTFT_PERCENTILE = float(os.environ.get("HEDGE_TTFT_PERCENTILE", 0.95))
+# Recent TTFT samples needed before hedging kicks in
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 10))
+HEDGE_MODEL = os.environ.get("HEDGE_MODEL", "fallback")
+
+# Provider streams that fail part way are retried this many times. The retry
+# continues from the partial output instead of starting over
+STREAM_MAX_RETRIES = int(os.environ.get("STREAM_MAX_RETRIES", 2))
+# Base delay before a retry; doubles per attempt, with +/-50% jitter
+STREAM_RETRY_BACKOFF_SECONDS = float(
+    os.environ.get("STREAM_RETRY_BACKOFF_SECONDS", 1)
+)
+
+# WebSocket chunk coalescing
+# Streamed chunks for the same variant/page are merged and sent at most once per
+# interval (or sooner once the buffer reaches the size limit). 0 disables coalescing.
+WS_CHUNK_FLUSH_INTERVAL_MS = float(os.environ.get("WS_CHUNK_FLUSH_INTERVAL_MS", 40))
+WS_CHUNK_FLUSH_MAX_BYTES = int(os.environ.get("WS_CHUNK_FLUSH_MAX_BYTES", 16384))
+
+# Resumable generation sessions (opt-in per request with "resumable": true).
+# Sent frames are kept in per-variant replay buffers so a client that
+# reconnects can resume from its last acknowledged frame; the generation keeps
+# running for the grace period after a disconnect
+SESSION_RESUME_GRACE_SECONDS = float(
+    os.environ.get("SESSION_RESUME_GRACE_SECONDS", 30)
+)
+SESSION_BUFFER_MAX_BYTES = int(
+    os.environ.get("SESSION_BUFFER_MAX_BYTES", 2 * 1024 * 1024)
+)
+SESSION_STORE_MAX_BYTES = int(
+    os.environ.get("SESSION_STORE_MAX_BYTES", 64 * 1024 * 1024)
+)
+# Finished or abandoned sessions are dropped after this many seconds
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", 300))
+
+# Exact-match completion cache (opt-in). A variant whose model, stack,
+# temperature and prompt match an earlier generation replays the stored
+# completion instead of calling the provider. Entries live in memory and in a
+# SQLite file (set RESPONSE_CACHE_PATH to "" for memory only)
+RESPONSE_CACHE_ENABLED = (
+    os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+)
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "screenshot-to-code-responses.sqlite3"),
+)
+RESPONSE_CACHE_DISK_MAX_BYTES = int(
+    os.environ.get("RESPONSE_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024)
+)
+RESPONSE_CACHE_TTL_SECONDS = float(
+    os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+)
+# Speed cached completions are streamed back at; 0 sends them in one chunk
+RESPONSE_CACHE_REPLAY_CHARS_PER_SECOND = float(
+    os.environ.get("RESPONSE_CACHE_REPLAY_CHARS_PER_SECOND", 4000)
+)
+
+# Near-duplicate screenshot index (opt-in). Screenshots are indexed by their
+# 64-bit difference hash along with the HTML generated for them. A new
+# screenshot within SCREENSHOT_INDEX_MAX_DISTANCE bits of an earlier one gets
+# that HTML offered as a starting point for a cheaper update, but only if
+# their 1024-bit detail hashes are within SCREENSHOT_INDEX_MAX_DETAIL_DISTANCE
+# bits too. The coarse hash only captures layout, so pages that share a layout
+# but differ in their text would otherwise match
+SCREENSHOT_INDEX_ENABLED = (
+    os.environ.get("SCREENSHOT_INDEX_ENABLED", "false").lower() == "true"
+)
+SCREENSHOT_INDEX_MAX_DISTANCE = int(os.environ.get("SCREENSHOT_INDEX_MAX_DISTANCE", 4))
+SCREENSHOT_INDEX_MAX_DETAIL_DISTANCE = int(
+    os.environ.get("SCREENSHOT_INDEX_MAX_DETAIL_DISTANCE", 48)
+)
+SCREENSHOT_INDEX_MAX_ENTRIES = int(
+    os.environ.get("SCREENSHOT_INDEX_MAX_ENTRIES", 50_000)
+)
+
+# Every generation request records latency spans per pipeline stage and per
+# variant into the histograms served at /metrics. Set a directory here to also
+# write each request's spans there as JSON
+PIPELINE_TRACE_DIR = os.environ.get("PIPELINE_TRACE_DIR", "")
+
+# Event loop health. The lag sampler records how late the loop runs a timer
+# every LOOP_LAG_INTERVAL_SECONDS and logs lags over LOOP_LAG_WARN_SECONDS.
+# The slow callback detector (opt-in) logs the stack of any code that holds
+# the loop for longer than SLOW_CALLBACK_THRESHOLD_SECONDS
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("LOOP_LAG_INTERVAL_SECONDS", 0.5))
+LOOP_LAG_WARN_SECONDS = float(os.environ.get("LOOP_LAG_WARN_SECONDS", 0.1))
+SLOW_CALLBACK_DETECTOR = (
+    os.environ.get("SLOW_CALLBACK_DETECTOR", "false").lower() == "true"
+)
+SLOW_CALLBACK_THRESHOLD_SECONDS = float(
+    os.environ.get("SLOW_CALLBACK_THRESHOLD_SECONDS", 0.25)
+)
+
+# CPU-bound image work (PIL) runs off the event loop in this executor
+# "thread" or "process"; process pools avoid the GIL for very large screenshots
+IMAGE_EXECUTOR_KIND = os.environ.get("IMAGE_EXECUTOR_KIND", "thread")
+IMAGE_EXECUTOR_MAX_WORKERS = int(
+    os.environ.get("IMAGE_EXECUTOR_MAX_WORKERS", min(4, os.cpu_count() or 1))
+)
+
+# Provider-ready encodings of prompt images are cached by content hash so each
+# screenshot is only processed once per process
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Video frames whose 16x16 difference hash is within this many bits of the
+# previously kept frame are dropped as near-duplicates. 0 disables it
+VIDEO_FRAME_DEDUP_THRESHOLD = int(os.environ.get("VIDEO_FRAME_DEDUP_THRESHOLD", 6))
+# Candidate frames considered per screenshot slot when deduplicating, so
+# scene changes between evenly spaced sample points can still be picked up
+VIDEO_FRAME_OVERSAMPLE = int(os.environ.get("VIDEO_FRAME_OVERSAMPLE", 4))
+
+# Videos and large screenshots can be uploaded over HTTP and referenced from
+# the generation request as "upload:<id>" instead of being inlined as data URLs
+UPLOAD_DIR = os.environ.get(
+    "UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "screenshot-to-code-uploads")
+)
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 200 * 1024 * 1024))
+UPLOAD_TTL_SECONDS = int(os.environ.get("UPLOAD_TTL_SECONDS", 3600))
+# Disk space all unexpired uploads may use together; new uploads are rejected
+# once it's reached
+UPLOAD_MAX_TOTAL_BYTES = int(
+    os.environ.get("UPLOAD_MAX_TOTAL_BYTES", 2 * 1024 * 1024 * 1024)
+)
+
+# Content-addressed store for history HTML and prompt images, so clients can
+# send "blob:<sha256>" references for content the server has already seen.
+# Blobs evicted from memory spill over to disk
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+BLOB_DIR = os.environ.get(
+    "BLOB_DIR", os.path.join(tempfile.gettempdir(), "screenshot-to-code-blobs")
+)
+BLOB_DISK_MAX_BYTES = int(os.environ.get("BLOB_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+# How long to wait for the client to send content the blob store is missing
+BLOB_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("BLOB_REQUEST_TIMEOUT_SECONDS", 30))
+
 # Image generation (optional)
 REPLICATE_API_KEY = os.environ.get("REPLICATE_API_KEY", None)
 
@@ -1,10 +1,10 @@
 import asyncio
 import re
 from typing import Dict, List, Literal, Union
-from openai import AsyncOpenAI
 from bs4 import BeautifulSoup
 
 from image_generation.replicate import call_replicate
+from models.clients import provider_clients
 
 
 async def process_tasks(
@@ -39,16 +39,15 @@ async def process_tasks(
 async def generate_image_dalle(
     prompt: str, api_key: str, base_url: str | None
 ) -> Union[str, None]:
-    client = AsyncOpenAI(api_key=api_key, base_url=base_url)
-    res = await client.images.generate(
-        model="dall-e-3",
-        quality="standard",
-        style="natural",
-        n=1,
-        size="1024x1024",
-        prompt=prompt,
-    )
-    await client.close()
+    async with provider_clients.openai(api_key, base_url) as client:
+        res = await client.images.generate(
+            model="dall-e-3",
+            quality="standard",
+            style="natural",
+            n=1,
+            size="1024x1024",
+            prompt=prompt,
+        )
     return res.data[0].url
 
 
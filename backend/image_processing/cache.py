@@ -0,0 +1,182 @@
+import asyncio
+import base64
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from config import IMAGE_CACHE_MAX_BYTES
+from image_processing.executor import run_image_task
+from image_processing.utils import process_image
+from metrics.core import counter, gauge
+
+T = TypeVar("T")
+
+# Provider-specific encodings stored per image
+CLAUDE_JPEG = "claude"
+RAW_BYTES = "raw"
+
+cache_hits = counter(
+    "image_cache_hits_total", "Image encodings served from the cache", ("encoding",)
+)
+cache_misses = counter(
+    "image_cache_misses_total", "Image encodings computed on a cache miss", ("encoding",)
+)
+cache_evictions = counter(
+    "image_cache_evictions_total", "Image encodings evicted to stay within budget"
+)
+cache_bytes = gauge("image_cache_bytes", "Bytes held by the image encoding cache")
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+
+
+class ImageEncodingCache:
+    """LRU cache of provider-ready image encodings keyed by (image digest, encoding)
+
+    Entries are evicted least-recently-used first once the total size exceeds
+    `max_bytes`. Concurrent misses for the same key share a single computation.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str, encoding: str) -> Any | None:
+        entry = self._entries.get((digest, encoding))
+        if entry is None:
+            return None
+        self._entries.move_to_end((digest, encoding))
+        self.hits += 1
+        cache_hits.inc(encoding=encoding)
+        return entry.value
+
+    def put(self, digest: str, encoding: str, value: Any, size: int) -> None:
+        key = (digest, encoding)
+        if size > self.max_bytes:
+            return
+        existing = self._entries.pop(key, None)
+        if existing is not None:
+            self.total_bytes -= existing.size
+        self._entries[key] = CacheEntry(value=value, size=size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            cache_evictions.inc()
+        cache_bytes.set(self.total_bytes)
+
+    def get_or_compute(
+        self, digest: str, encoding: str, compute: Callable[[], T], size: Callable[[T], int]
+    ) -> T:
+        cached = self.get(digest, encoding)
+        if cached is not None:
+            return cached
+        self.misses += 1
+        cache_misses.inc(encoding=encoding)
+        value = compute()
+        self.put(digest, encoding, value, size(value))
+        return value
+
+    async def get_or_compute_async(
+        self,
+        digest: str,
+        encoding: str,
+        compute: Callable[[], Awaitable[T]],
+        size: Callable[[T], int],
+    ) -> T:
+        cached = self.get(digest, encoding)
+        if cached is not None:
+            return cached
+
+        key = (digest, encoding)
+        task = self._in_flight.get(key)
+        if task is not None:
+            # Another variant is already processing this image
+            self.hits += 1
+            cache_hits.inc(encoding=encoding)
+        else:
+            self.misses += 1
+            cache_misses.inc(encoding=encoding)
+            # The computation runs in its own task, so a requester that's
+            # cancelled (e.g. its variant failed) doesn't cancel the others
+            task = asyncio.ensure_future(self._compute(key, compute, size))
+            self._in_flight[key] = task
+            task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _compute(
+        self,
+        key: Tuple[str, str],
+        compute: Callable[[], Awaitable[T]],
+        size: Callable[[T], int],
+    ) -> T:
+        try:
+            value = await compute()
+        finally:
+            self._in_flight.pop(key, None)
+        self.put(key[0], key[1], value, size(value))
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _retrieve_exception(task: "asyncio.Future[Any]") -> None:
+    # Waiters re-raise the error; don't warn if they were all cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+image_encoding_cache = ImageEncodingCache()
+
+
+def split_data_url(image_data_url: str) -> Tuple[str, str]:
+    """Split a base64 data URL into (media_type, base64_data)"""
+    media_type = image_data_url.split(";")[0].split(":")[1]
+    base64_data = image_data_url.split(",", 1)[1]
+    return media_type, base64_data
+
+
+def image_digest(base64_data: str) -> str:
+    """Content hash of an image
+
+    Standard base64 is a canonical encoding of the image bytes, so hashing it
+    identifies the image without having to decode it first.
+    """
+    return hashlib.sha256(base64_data.encode("ascii")).hexdigest()
+
+
+async def get_claude_image(image_data_url: str) -> Tuple[str, str]:
+    """Claude-compliant (media_type, base64_data) for a data URL, processed once per image"""
+    _, base64_data = split_data_url(image_data_url)
+    return await image_encoding_cache.get_or_compute_async(
+        image_digest(base64_data),
+        CLAUDE_JPEG,
+        lambda: run_image_task(process_image, image_data_url),
+        lambda result: len(result[1]),
+    )
+
+
+def get_image_bytes(base64_data: str) -> bytes:
+    """Decoded image bytes (e.g. for Gemini), decoded once per image"""
+    return image_encoding_cache.get_or_compute(
+        image_digest(base64_data),
+        RAW_BYTES,
+        lambda: base64.b64decode(base64_data),
+        len,
+    )
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Tuple, TypeVar
+
+from config import IMAGE_EXECUTOR_KIND, IMAGE_EXECUTOR_MAX_WORKERS
+from metrics.core import counter
+
+T = TypeVar("T")
+
+offloaded_seconds = counter(
+    "image_executor_offloaded_seconds_total",
+    "CPU time spent on image work in the executor instead of on the event loop",
+    ("task",),
+)
+offloaded_tasks = counter(
+    "image_executor_tasks_total",
+    "Image processing tasks run in the executor",
+    ("task",),
+)
+
+_executor: Executor | None = None
+
+
+def get_image_executor() -> Executor:
+    """Lazily create the shared executor for PIL work"""
+    global _executor
+    if _executor is None:
+        if IMAGE_EXECUTOR_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_EXECUTOR_MAX_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_EXECUTOR_MAX_WORKERS,
+                thread_name_prefix="image-worker",
+            )
+    return _executor
+
+
+def _timed_call(func: Callable[..., T], *args: Any) -> Tuple[T, float]:
+    # Module-level so it can be pickled into a process pool
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+async def run_image_task(func: Callable[..., T], *args: Any) -> T:
+    """Run a CPU-bound image function in the executor and await its result
+
+    `func` and its arguments must be picklable when a process pool is configured.
+    """
+    loop = asyncio.get_running_loop()
+    result, duration = await loop.run_in_executor(
+        get_image_executor(), _timed_call, func, *args
+    )
+    task_name = getattr(func, "__name__", "unknown")
+    offloaded_tasks.inc(task=task_name)
+    offloaded_seconds.inc(duration, task=task_name)
+    return result
+
+
+def shutdown_image_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
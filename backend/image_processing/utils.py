@@ -1,11 +1,110 @@
 import base64
 import io
 import time
+from dataclasses import dataclass
 from PIL import Image
 
 CLAUDE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
 CLAUDE_MAX_IMAGE_DIMENSION = 7990
 
+JPEG_MAX_QUALITY = 95
+JPEG_MIN_QUALITY = 10
+# Binary search stops once the quality window is this narrow
+JPEG_QUALITY_PRECISION = 5
+# Rather than dropping quality below this, we shrink the image first
+JPEG_DOWNSCALE_QUALITY_THRESHOLD = 60
+JPEG_DOWNSCALE_FACTOR = 0.75
+JPEG_MAX_DOWNSCALES = 3
+
+
+def base64_size(byte_length: int) -> int:
+    """Length of the base64 encoding of `byte_length` bytes, without encoding them"""
+    return 4 * ((byte_length + 2) // 3)
+
+
+@dataclass
+class JpegCompressionResult:
+    data: bytes
+    quality: int
+    width: int
+    height: int
+    encode_count: int
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def compress_jpeg_to_size(
+    img: Image.Image,
+    max_base64_size: int,
+    min_quality: int = JPEG_MIN_QUALITY,
+    max_quality: int = JPEG_MAX_QUALITY,
+    downscale_threshold: int | None = JPEG_DOWNSCALE_QUALITY_THRESHOLD,
+    max_downscales: int = JPEG_MAX_DOWNSCALES,
+) -> JpegCompressionResult:
+    """Encode an RGB image as the highest-quality JPEG whose base64 form fits the limit
+
+    Binary-searches JPEG quality (file size grows monotonically with quality) and
+    predicts the base64 size from the byte length. If even `downscale_threshold`
+    quality doesn't fit, the image is downscaled before quality is reduced any
+    further. Falls back to `min_quality` if nothing fits.
+    """
+    encode_count = 0
+
+    def encode(image: Image.Image, quality: int) -> bytes:
+        nonlocal encode_count
+        encode_count += 1
+        return _encode_jpeg(image, quality)
+
+    def fits(data: bytes) -> bool:
+        return base64_size(len(data)) <= max_base64_size
+
+    downscales = 0
+    while True:
+        data = encode(img, max_quality)
+        if fits(data):
+            return JpegCompressionResult(
+                data, max_quality, img.width, img.height, encode_count
+            )
+
+        can_downscale = downscale_threshold is not None and downscales < max_downscales
+        floor_quality = min_quality
+        if can_downscale and downscale_threshold is not None:
+            floor_quality = max(min_quality, downscale_threshold)
+        floor_data = encode(img, floor_quality)
+        if fits(floor_data):
+            break
+        if not can_downscale:
+            # Nothing fits; return the smallest encoding we're allowed to produce
+            return JpegCompressionResult(
+                floor_data, floor_quality, img.width, img.height, encode_count
+            )
+
+        downscales += 1
+        new_size = (
+            max(1, int(img.width * JPEG_DOWNSCALE_FACTOR)),
+            max(1, int(img.height * JPEG_DOWNSCALE_FACTOR)),
+        )
+        img = img.resize(new_size, Image.DEFAULT_STRATEGY)
+
+    # floor_quality fits and max_quality doesn't: search for the best quality in between
+    low_quality, low_data = floor_quality, floor_data
+    high_quality = max_quality
+    while high_quality - low_quality > JPEG_QUALITY_PRECISION:
+        mid_quality = (low_quality + high_quality) // 2
+        mid_data = encode(img, mid_quality)
+        if fits(mid_data):
+            low_quality, low_data = mid_quality, mid_data
+        else:
+            high_quality = mid_quality
+
+    return JpegCompressionResult(
+        low_data, low_quality, img.width, img.height, encode_count
+    )
+
 
 # Process image so it meets Claude requirements
 def process_image(image_data_url: str) -> tuple[str, str]:
@@ -52,23 +151,17 @@ def process_image(image_data_url: str) -> tuple[str, str]:
     # Convert and compress as JPEG
     # We always compress as JPEG (95% at the least) even when we resize and the original image
     # is under the size limit.
-    quality = 95
-    output = io.BytesIO()
     img = img.convert("RGB")  # Ensure image is in RGB mode for JPEG conversion
-    img.save(output, format="JPEG", quality=quality)
-
-    # Reduce quality until image is under max size
-    while (
-        len(base64.b64encode(output.getvalue())) > CLAUDE_IMAGE_MAX_SIZE
-        and quality > 10
-    ):
-        output = io.BytesIO()
-        img.save(output, format="JPEG", quality=quality)
-        quality -= 5
+    result = compress_jpeg_to_size(img, CLAUDE_IMAGE_MAX_SIZE)
+    print(
+        f"[CLAUDE IMAGE PROCESSING] JPEG quality = {result.quality}, "
+        f"size = {result.width}x{result.height}, encodes = {result.encode_count}"
+    )
 
     # Log so we know it was modified
+    encoded_data = base64.b64encode(result.data).decode("utf-8")
     old_size = len(base64_data)
-    new_size = len(base64.b64encode(output.getvalue()))
+    new_size = len(encoded_data)
     print(
         f"[CLAUDE IMAGE PROCESSING] image size updated: old size = {old_size} bytes, new size = {new_size} bytes"
     )
@@ -77,4 +170,4 @@ def process_image(image_data_url: str) -> tuple[str, str]:
     processing_time = end_time - start_time
     print(f"[CLAUDE IMAGE PROCESSING] processing time: {processing_time:.2f} seconds")
 
-    return ("image/jpeg", base64.b64encode(output.getvalue()).decode("utf-8"))
+    return ("image/jpeg", encoded_data)
@@ -0,0 +1,139 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Callable
+
+from config import (
+    LOOP_LAG_INTERVAL_SECONDS,
+    LOOP_LAG_WARN_SECONDS,
+    SLOW_CALLBACK_DETECTOR,
+    SLOW_CALLBACK_THRESHOLD_SECONDS,
+)
+from metrics.core import counter, histogram
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+loop_lag_seconds = histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled by the lag sampler",
+    buckets=LAG_BUCKETS,
+)
+slow_callbacks = counter(
+    "event_loop_slow_callbacks_total",
+    "Times a callback held the event loop longer than the slow callback threshold",
+)
+blocked_seconds = histogram(
+    "event_loop_blocked_seconds",
+    "How long callbacks reported as slow held the event loop",
+    buckets=LAG_BUCKETS,
+)
+
+
+class LoopMonitor:
+    """Samples event loop lag and, optionally, reports what is blocking it
+
+    A task on the loop sleeps for `interval` and records how late it woke up.
+    With `slow_callback_seconds` set, a watchdog thread also notices when the
+    loop hasn't woken the sampler for that long past its interval, and logs
+    the loop thread's stack at that moment, which is the code holding it.
+    `clock` is only swapped out by tests.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL_SECONDS,
+        warn_seconds: float = LOOP_LAG_WARN_SECONDS,
+        slow_callback_seconds: float = (
+            SLOW_CALLBACK_THRESHOLD_SECONDS if SLOW_CALLBACK_DETECTOR else 0
+        ),
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.interval = interval
+        self.warn_seconds = warn_seconds
+        self.slow_callback_seconds = slow_callback_seconds
+        self._clock = clock
+        # Stack of the most recent slow callback
+        self.last_stack: str | None = None
+        self._task: "asyncio.Task[None] | None" = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._loop_thread_id = 0
+        self._last_beat = 0.0
+        self._stall_started: float | None = None
+
+    def start(self) -> None:
+        """Start monitoring the running loop"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = self._clock()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        if self.slow_callback_seconds > 0:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            started = self._clock()
+            await asyncio.sleep(self.interval)
+            now = self._clock()
+            lag = max(0.0, now - started - self.interval)
+            self._beat(now)
+            loop_lag_seconds.observe(lag)
+            if lag >= self.warn_seconds:
+                print(f"[LOOP] Event loop lagged by {lag * 1000:.0f}ms")
+
+    def _beat(self, now: float) -> None:
+        with self._lock:
+            self._last_beat = now
+            stall_started = self._stall_started
+            self._stall_started = None
+        if stall_started is not None:
+            blocked = now - stall_started
+            blocked_seconds.observe(blocked)
+            print(f"[LOOP] Event loop unblocked after {blocked * 1000:.0f}ms")
+
+    def _watch(self) -> None:
+        period = min(self.slow_callback_seconds, self.interval) / 2
+        while not self._stopped.wait(period):
+            self._check()
+
+    def _check(self) -> None:
+        """Report the loop as blocked if the sampler is overdue by the threshold"""
+        with self._lock:
+            due = self._last_beat + self.interval
+            overdue = self._clock() - due
+            if overdue < self.slow_callback_seconds or self._stall_started is not None:
+                return
+            self._stall_started = due
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else ""
+        self.last_stack = stack
+        slow_callbacks.inc()
+        print(
+            f"[LOOP] Event loop blocked for over {overdue * 1000:.0f}ms in:\n"
+            f"{stack or '  <stack unavailable>'}"
+        )
+
+
+loop_monitor = LoopMonitor()
@@ -4,11 +4,34 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import screenshot, generate_code, home, evals
+from blobs.core import blob_store
+from image_processing.executor import shutdown_image_executor
+from loop_monitor.core import loop_monitor
+from models.clients import provider_clients
+from response_cache.core import response_cache
+from routes import screenshot, generate_code, home, evals, metrics, uploads
+from sessions.core import session_store
+from uploads.core import upload_store
 
-app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    # Close pooled provider connections and image workers on shutdown
+    await provider_clients.aclose()
+    shutdown_image_executor()
+    upload_store.clear()
+    blob_store.clear()
+    session_store.clear()
+    response_cache.close()
+
+
+app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None, lifespan=lifespan)
 
 # Configure CORS settings
 app.add_middleware(
@@ -24,3 +47,5 @@ app.include_router(generate_code.router)
 app.include_router(screenshot.router)
 app.include_router(home.router)
 app.include_router(evals.router)
+app.include_router(metrics.router)
+app.include_router(uploads.router)
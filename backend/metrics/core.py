@@ -0,0 +1,243 @@
+import bisect
+import math
+import threading
+from typing import Any, Dict, List, Tuple
+
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, from a fast middleware up to a long generation
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+
+
+class _Metric:
+    """Base class for process-wide metrics with optional labels"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [
+                (dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing value, e.g. cache hits"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. open connections"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, e.g. latencies"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...],
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (plus +Inf), then sum and count
+        self._observations: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._observations.get(key)
+            if state is None:
+                state = self._observations[key] = [0.0] * (len(self.buckets) + 3)
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def value(self, **labels: str) -> float:
+        """Number of observations"""
+        with self._lock:
+            state = self._observations.get(self._key(labels))
+            return state[-1] if state else 0.0
+
+    def sum(self, **labels: str) -> float:
+        with self._lock:
+            state = self._observations.get(self._key(labels))
+            return state[-2] if state else 0.0
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [
+                (dict(zip(self.labelnames, key)), state[-1])
+                for key, state in self._observations.items()
+            ]
+
+    def bucket_samples(
+        self,
+    ) -> List[Tuple[Dict[str, str], List[Tuple[float, float]], float, float]]:
+        """(labels, cumulative (upper bound, count) pairs, sum, count) per label set"""
+        with self._lock:
+            result = []
+            for key, state in self._observations.items():
+                cumulative = 0.0
+                buckets: List[Tuple[float, float]] = []
+                for bound, count in zip((*self.buckets, math.inf), state):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                result.append(
+                    (dict(zip(self.labelnames, key)), buckets, state[-2], state[-1])
+                )
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._observations.clear()
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(
+    cls: type[_Metric],
+    name: str,
+    documentation: str,
+    labelnames: Tuple[str, ...],
+    **options: Any,
+) -> _Metric:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, documentation, labelnames, **options)
+            _registry[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+        return metric
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return _get_or_create(Counter, name, documentation, labelnames)  # type: ignore
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, documentation, labelnames)  # type: ignore
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Tuple[str, ...] = (),
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return _get_or_create(  # type: ignore
+        Histogram, name, documentation, labelnames, buckets=buckets
+    )
+
+
+def registered_metrics() -> List[_Metric]:
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in sorted(registered_metrics(), key=lambda metric: metric.name):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        if isinstance(metric, Histogram):
+            for labels, buckets, total, count in metric.bucket_samples():
+                for bound, cumulative in buckets:
+                    bucket_labels = {**labels, "le": _format_value(bound)}
+                    lines.append(
+                        f"{metric.name}_bucket{_format_labels(bucket_labels)} "
+                        f"{_format_value(cumulative)}"
+                    )
+                lines.append(
+                    f"{metric.name}_sum{_format_labels(labels)} {_format_value(total)}"
+                )
+                lines.append(
+                    f"{metric.name}_count{_format_labels(labels)} {_format_value(count)}"
+                )
+            continue
+        for labels, value in metric.samples():
+            lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
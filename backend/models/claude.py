@@ -1,16 +1,28 @@
 import copy
 import time
 from typing import Any, Awaitable, Callable, Dict, List, Tuple, cast
-from anthropic import AsyncAnthropic
 from openai.types.chat import ChatCompletionMessageParam
 from config import IS_DEBUG_ENABLED
 from debug.DebugFileWriter import DebugFileWriter
-from image_processing.utils import process_image
+from image_processing.cache import get_claude_image
 from utils import pprint_prompt
 from llm import Completion, Llm
-
-
-def convert_openai_messages_to_claude(
+from models.clients import provider_clients
+from models.prompt_cache import (
+    add_claude_history_breakpoint,
+    claude_system_blocks,
+    record_usage,
+)
+from models.scheduler import estimate_prompt_tokens, provider_scheduler
+
+# Models run with extended thinking, which rules out prefilling the reply
+THINKING_MODELS = {
+    Llm.CLAUDE_4_SONNET_2025_05_14.value,
+    Llm.CLAUDE_4_OPUS_2025_05_14.value,
+}
+
+
+async def convert_openai_messages_to_claude(
     messages: List[ChatCompletionMessageParam],
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """
@@ -41,8 +53,11 @@ def convert_openai_messages_to_claude(
                 image_data_url = cast(str, content["image_url"]["url"])
 
                 # Process image and split media type and data
-                # so it works with Claude (under 5mb in base64 encoding)
-                (media_type, base64_data) = process_image(image_data_url)
+                # so it works with Claude (under 5mb in base64 encoding).
+                # This runs in the image executor so large screenshots don't
+                # block other connections, and is cached so each image is only
+                # processed once across variants and update turns.
+                (media_type, base64_data) = await get_claude_image(image_data_url)
 
                 # Remove OpenAI parameter
                 del content["image_url"]
@@ -56,6 +71,16 @@ def convert_openai_messages_to_claude(
     return system_prompt, claude_messages
 
 
+def record_claude_usage(model_name: str, usage: Any) -> None:
+    # input_tokens only counts the tokens that were neither read from nor
+    # written to the cache
+    cached = usage.cache_read_input_tokens or 0
+    written = usage.cache_creation_input_tokens or 0
+    record_usage(
+        "anthropic", model_name, usage.input_tokens + cached + written, cached, written
+    )
+
+
 async def stream_claude_response(
     messages: List[ChatCompletionMessageParam],
     api_key: str,
@@ -64,7 +89,6 @@ async def stream_claude_response(
     temperature: float,
 ) -> Completion:
     start_time = time.time()
-    client = AsyncAnthropic(api_key=api_key)
 
     # Base parameters
     max_tokens = 8192
@@ -77,50 +101,54 @@ async def stream_claude_response(
     # Translate OpenAI messages to Claude messages
 
     # Convert OpenAI format messages to Claude format
-    system_prompt, claude_messages = convert_openai_messages_to_claude(messages)
+    system_prompt, claude_messages = await convert_openai_messages_to_claude(messages)
     pprint_prompt([{"role": "system", "content": system_prompt}, *claude_messages])
+    # Cache the shared system prompt and the conversation up to the last user turn
+    system = claude_system_blocks(system_prompt)
+    add_claude_history_breakpoint(claude_messages)
 
     response = ""
 
-    if (
-        model_name == Llm.CLAUDE_4_SONNET_2025_05_14.value
-        or model_name == Llm.CLAUDE_4_OPUS_2025_05_14.value
+    async with provider_scheduler.slot(
+        "anthropic", model_name, estimate_prompt_tokens(messages)
     ):
-        print(f"Using {model_name} with thinking")
-        # Thinking is not compatible with temperature
-        async with client.messages.stream(
-            model=model_name,
-            thinking={"type": "enabled", "budget_tokens": 10000},
-            max_tokens=30000,
-            system=system_prompt,
-            messages=claude_messages,  # type: ignore
-        ) as stream:
-            async for event in stream:
-                if event.type == "content_block_delta":
-                    if event.delta.type == "thinking_delta":
-                        pass
-                        # print(event.delta.thinking, end="")
-                    elif event.delta.type == "text_delta":
-                        response += event.delta.text
-                        await callback(event.delta.text)
-
-    else:
-        # Stream Claude response
-        async with client.beta.messages.stream(
-            model=model_name,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=claude_messages,  # type: ignore
-            betas=["output-128k-2025-02-19"],
-        ) as stream:
-            async for text in stream.text_stream:
-                response += text
-                await callback(text)
-
-    # Close the Anthropic client
-    await client.close()
-
+        async with provider_clients.anthropic(api_key) as client:
+            if model_name in THINKING_MODELS:
+                print(f"Using {model_name} with thinking")
+                # Thinking is not compatible with temperature
+                async with client.messages.stream(
+                    model=model_name,
+                    thinking={"type": "enabled", "budget_tokens": 10000},
+                    max_tokens=30000,
+                    system=system,  # type: ignore
+                    messages=claude_messages,  # type: ignore
+                ) as stream:
+                    async for event in stream:
+                        if event.type == "content_block_delta":
+                            if event.delta.type == "thinking_delta":
+                                pass
+                                # print(event.delta.thinking, end="")
+                            elif event.delta.type == "text_delta":
+                                response += event.delta.text
+                                await callback(event.delta.text)
+                    final_message = await stream.get_final_message()
+
+            else:
+                # Stream Claude response
+                async with client.beta.messages.stream(
+                    model=model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,  # type: ignore
+                    messages=claude_messages,  # type: ignore
+                    betas=["output-128k-2025-02-19"],
+                ) as stream:
+                    async for text in stream.text_stream:
+                        response += text
+                        await callback(text)
+                    final_message = await stream.get_final_message()
+
+    record_claude_usage(model_name, final_message.usage)
     completion_time = time.time() - start_time
     return {"duration": completion_time, "code": response}
 
@@ -134,7 +162,6 @@ async def stream_claude_response_native(
     model_name: str = "claude-3-7-sonnet-20250219",
 ) -> Completion:
     start_time = time.time()
-    client = AsyncAnthropic(api_key=api_key)
 
     # Base model parameters
     max_tokens = 4096
@@ -163,20 +190,29 @@ async def stream_claude_response_native(
 
         pprint_prompt(messages_to_send)
 
-        async with client.messages.stream(
-            model=model_name,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=messages_to_send,  # type: ignore
-        ) as stream:
-            async for text in stream.text_stream:
-                print(text, end="", flush=True)
-                full_stream += text
-                await callback(text)
+        async with provider_scheduler.slot(
+            "anthropic",
+            model_name,
+            estimate_prompt_tokens(
+                [{"role": "system", "content": system_prompt}, *messages_to_send]
+            ),
+        ):
+            async with provider_clients.anthropic(api_key) as client:
+                async with client.messages.stream(
+                    model=model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=claude_system_blocks(system_prompt),  # type: ignore
+                    messages=messages_to_send,  # type: ignore
+                ) as stream:
+                    async for text in stream.text_stream:
+                        print(text, end="", flush=True)
+                        full_stream += text
+                        await callback(text)
 
         response = await stream.get_final_message()
         response_text = response.content[0].text
+        record_claude_usage(model_name, response.usage)
 
         # Write each pass's code to .html file and thinking to .txt file
         if IS_DEBUG_ENABLED:
@@ -202,9 +238,6 @@ async def stream_claude_response_native(
             f"Token usage: Input Tokens: {response.usage.input_tokens}, Output Tokens: {response.usage.output_tokens}"
         )
 
-    # Close the Anthropic client
-    await client.close()
-
     completion_time = time.time() - start_time
 
     if IS_DEBUG_ENABLED:
@@ -0,0 +1,183 @@
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Literal, Tuple
+
+import httpx
+from anthropic import AsyncAnthropic
+from anthropic import DefaultAsyncHttpxClient as AnthropicHttpxClient
+from google import genai
+from openai import AsyncOpenAI
+from openai import DefaultAsyncHttpxClient as OpenAIHttpxClient
+
+from config import (
+    PROVIDER_CLIENT_IDLE_TTL,
+    PROVIDER_POOL_KEEPALIVE_EXPIRY,
+    PROVIDER_POOL_MAX_CONNECTIONS,
+    PROVIDER_POOL_MAX_KEEPALIVE_CONNECTIONS,
+)
+from metrics.core import counter, gauge
+
+Provider = Literal["openai", "anthropic", "gemini"]
+ClientKey = Tuple[Provider, str, str | None]
+
+pool_hits = counter(
+    "provider_client_pool_hits_total",
+    "Provider SDK clients reused from the shared pool",
+    ("provider",),
+)
+pool_misses = counter(
+    "provider_client_pool_misses_total",
+    "Provider SDK clients created because none was pooled",
+    ("provider",),
+)
+pool_evictions = counter(
+    "provider_client_pool_evictions_total",
+    "Pooled provider SDK clients closed after sitting idle",
+    ("provider",),
+)
+pooled_clients = gauge(
+    "provider_client_pool_size",
+    "Provider SDK clients currently held by the shared pool",
+    ("provider",),
+)
+
+
+@dataclass
+class PooledClient:
+    client: Any
+    last_used: float
+    in_use: int = 0
+
+
+class ProviderClientPool:
+    """Process-wide registry of provider SDK clients keyed by (provider, api_key, base_url)
+
+    Clients keep their HTTP connection pools alive between requests. A client is
+    only evicted when nobody is using it and it has been idle for `idle_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = PROVIDER_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections: int = PROVIDER_POOL_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = PROVIDER_POOL_KEEPALIVE_EXPIRY,
+        idle_ttl: float = PROVIDER_CLIENT_IDLE_TTL,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.idle_ttl = idle_ttl
+        self._clients: Dict[ClientKey, PooledClient] = {}
+
+    @asynccontextmanager
+    async def openai(self, api_key: str, base_url: str | None) -> AsyncIterator[AsyncOpenAI]:
+        """Lease a shared AsyncOpenAI client"""
+        async with self._lease(
+            ("openai", api_key, base_url),
+            lambda: AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=OpenAIHttpxClient(limits=self.limits),
+            ),
+        ) as client:
+            yield client
+
+    @asynccontextmanager
+    async def anthropic(self, api_key: str) -> AsyncIterator[AsyncAnthropic]:
+        """Lease a shared AsyncAnthropic client"""
+        async with self._lease(
+            ("anthropic", api_key, None),
+            lambda: AsyncAnthropic(
+                api_key=api_key,
+                http_client=AnthropicHttpxClient(limits=self.limits),
+            ),
+        ) as client:
+            yield client
+
+    @asynccontextmanager
+    async def gemini(self, api_key: str) -> AsyncIterator[genai.Client]:
+        """Lease a shared Gemini client"""
+        # The Gemini SDK may use aiohttp instead of httpx for async calls, so we
+        # leave its connection limits at the SDK defaults and only reuse the client
+        async with self._lease(
+            ("gemini", api_key, None),
+            lambda: genai.Client(api_key=api_key),
+        ) as client:
+            yield client
+
+    @asynccontextmanager
+    async def _lease(
+        self, key: ClientKey, factory: Callable[[], Any]
+    ) -> AsyncIterator[Any]:
+        await self.evict_idle()
+
+        provider = key[0]
+        entry = self._clients.get(key)
+        if entry is None:
+            pool_misses.inc(provider=provider)
+            entry = PooledClient(client=factory(), last_used=time.monotonic())
+            self._clients[key] = entry
+            pooled_clients.inc(provider=provider)
+        else:
+            pool_hits.inc(provider=provider)
+
+        entry.in_use += 1
+        try:
+            yield entry.client
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    async def evict_idle(self) -> None:
+        """Close clients that have been idle for longer than the TTL"""
+        now = time.monotonic()
+        expired = [
+            key
+            for key, entry in self._clients.items()
+            if entry.in_use == 0 and now - entry.last_used > self.idle_ttl
+        ]
+        for key in expired:
+            entry = self._clients.pop(key)
+            pool_evictions.inc(provider=key[0])
+            pooled_clients.dec(provider=key[0])
+            try:
+                await _close_client(key[0], entry.client)
+            except Exception as e:
+                print(f"[CLIENT POOL] Error closing idle {key[0]} client: {e}")
+
+    async def aclose(self) -> None:
+        """Close every pooled client, e.g. on application shutdown"""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for key, entry in clients:
+            pooled_clients.dec(provider=key[0])
+            try:
+                await _close_client(key[0], entry.client)
+            except Exception as e:
+                print(f"[CLIENT POOL] Error closing {key[0]} client: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        """Pool size plus hit/miss counters summed across providers"""
+        hits = sum(value for _, value in pool_hits.samples())
+        misses = sum(value for _, value in pool_misses.samples())
+        total = hits + misses
+        return {
+            "clients": len(self._clients),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+async def _close_client(provider: Provider, client: Any) -> None:
+    if provider == "gemini":
+        await client.aio.aclose()
+    else:
+        await client.close()
+
+
+# Shared by all requests in this process; closed from the FastAPI lifespan handler
+provider_clients = ProviderClientPool()
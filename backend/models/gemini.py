@@ -1,10 +1,12 @@
-import base64
 import time
 from typing import Any, Awaitable, Callable, Dict, List
 from openai.types.chat import ChatCompletionMessageParam
-from google import genai
 from google.genai import types
+from image_processing.cache import get_image_bytes
 from llm import Completion, Llm
+from models.clients import provider_clients
+from models.prompt_cache import record_usage
+from models.scheduler import estimate_prompt_tokens, provider_scheduler
 from utils import pprint_prompt
 
 # Set to True to print debug messages for Gemini requests
@@ -80,7 +82,7 @@ def convert_message_to_gemini_content(
     if image_data and "data" in image_data:
         parts.append(
             types.Part.from_bytes(
-                data=base64.b64decode(image_data["data"]),
+                data=get_image_bytes(image_data["data"]),
                 mime_type=image_data["mime_type"],
             )
         )
@@ -134,7 +136,6 @@ async def stream_gemini_response(
             print(f"  [{i}] {role}: {text_preview}... (has_image={has_image})")
         print("=" * 50)
 
-    client = genai.Client(api_key=api_key)
     full_response = ""
 
     temperature = max(0.0, min(1.0, temperature))
@@ -174,21 +175,37 @@ async def stream_gemini_response(
 
     pprint_prompt(messages)
 
-    async for chunk in await client.aio.models.generate_content_stream(
-        model=model_name,
-        contents=gemini_contents,
-        config=config,
+    usage = None
+    async with provider_scheduler.slot(
+        "gemini", model_name, estimate_prompt_tokens(messages)
     ):
-        if chunk.candidates and len(chunk.candidates) > 0:
-            for part in chunk.candidates[0].content.parts:
-                if not part.text:
-                    continue
-                elif part.thought:
-                    print("Thought summary:")
-                    print(part.text)
-                else:
-                    full_response += part.text
-                    await callback(part.text)
+        async with provider_clients.gemini(api_key) as client:
+            async for chunk in await client.aio.models.generate_content_stream(
+                model=model_name,
+                contents=gemini_contents,
+                config=config,
+            ):
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+                if chunk.candidates and len(chunk.candidates) > 0:
+                    for part in chunk.candidates[0].content.parts:
+                        if not part.text:
+                            continue
+                        elif part.thought:
+                            print("Thought summary:")
+                            print(part.text)
+                        else:
+                            full_response += part.text
+                            await callback(part.text)
+
+    # Gemini caches repeated prompt prefixes implicitly; report what it reused
+    if usage is not None and usage.prompt_token_count:
+        record_usage(
+            "gemini",
+            model_name,
+            usage.prompt_token_count,
+            usage.cached_content_token_count or 0,
+        )
 
     completion_time = time.time() - start_time
     return {"duration": completion_time, "code": full_response}
@@ -1,8 +1,10 @@
 import time
 from typing import Awaitable, Callable, List
-from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletionChunk
 from llm import Completion
+from models.clients import provider_clients
+from models.prompt_cache import openai_prompt_cache_key, record_usage
+from models.scheduler import estimate_prompt_tokens, provider_scheduler
 from utils import pprint_prompt
 
 
@@ -15,8 +17,6 @@ async def stream_openai_response(
     temperature: float | None,
 ) -> Completion:
     start_time = time.time()
-    client = AsyncOpenAI(api_key=api_key, base_url=base_url)
-
     # Base parameters
     params = {
         "model": model_name,
@@ -53,28 +53,54 @@ async def stream_openai_response(
         params["stream"] = True
         params["reasoning_effort"] = "high"
 
+    # Ask for token usage (including cached prompt tokens) in the last chunk
+    params["stream_options"] = {"include_usage": True}
+    if base_url is None:
+        # Requests sharing a system prompt land on the same prompt cache.
+        # OpenAI-compatible proxies may not accept the parameter. Sent in the
+        # body directly since the pinned SDK doesn't know the argument yet
+        params["extra_body"] = {
+            "prompt_cache_key": openai_prompt_cache_key(messages, model_name)
+        }
+
     pprint_prompt(messages)
 
-    # O1 doesn't support streaming
-    if model_name == "o1-2024-12-17":
-        response = await client.chat.completions.create(**params)  # type: ignore
-        full_response = response.choices[0].message.content  # type: ignore
-    else:
-        stream = await client.chat.completions.create(**params)  # type: ignore
-        full_response = ""
-        async for chunk in stream:  # type: ignore
-            assert isinstance(chunk, ChatCompletionChunk)
-            if (
-                chunk.choices
-                and len(chunk.choices) > 0
-                and chunk.choices[0].delta
-                and chunk.choices[0].delta.content
-            ):
-                content = chunk.choices[0].delta.content or ""
-                full_response += content
-                await callback(content)
+    usage = None
+    async with provider_scheduler.slot(
+        "openai", model_name, estimate_prompt_tokens(messages)
+    ):
+        async with provider_clients.openai(api_key, base_url) as client:
+            # O1 doesn't support streaming
+            if model_name == "o1-2024-12-17":
+                params.pop("stream_options")
+                response = await client.chat.completions.create(**params)  # type: ignore
+                full_response = response.choices[0].message.content  # type: ignore
+                usage = response.usage  # type: ignore
+            else:
+                stream = await client.chat.completions.create(**params)  # type: ignore
+                full_response = ""
+                async for chunk in stream:  # type: ignore
+                    assert isinstance(chunk, ChatCompletionChunk)
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if (
+                        chunk.choices
+                        and len(chunk.choices) > 0
+                        and chunk.choices[0].delta
+                        and chunk.choices[0].delta.content
+                    ):
+                        content = chunk.choices[0].delta.content or ""
+                        full_response += content
+                        await callback(content)
 
-    await client.close()
+    if usage is not None:
+        details = usage.prompt_tokens_details
+        record_usage(
+            "openai",
+            model_name,
+            usage.prompt_tokens,
+            (details.cached_tokens or 0) if details else 0,
+        )
 
     completion_time = time.time() - start_time
     return {"duration": completion_time, "code": full_response}
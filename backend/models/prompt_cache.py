@@ -0,0 +1,112 @@
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+from metrics.core import counter
+from prompts.engineering_update_prompts import (
+    BLOCK_UPDATE_SYSTEM_SUFFIX,
+    ENGINEERING_UPDATE_SYSTEM_PROMPTS,
+)
+from prompts.imported_code_prompts import IMPORTED_CODE_SYSTEM_PROMPTS
+from prompts.screenshot_system_prompts import SYSTEM_PROMPTS
+from prompts.text_prompts import SYSTEM_PROMPTS as TEXT_SYSTEM_PROMPTS
+
+# Anthropic cache breakpoint; cached prefixes live for about five minutes
+EPHEMERAL = {"type": "ephemeral"}
+
+input_tokens = counter(
+    "provider_input_tokens_total", "Prompt tokens sent to providers", ("provider",)
+)
+cached_input_tokens = counter(
+    "provider_cached_input_tokens_total",
+    "Prompt tokens providers served from their prompt cache",
+    ("provider",),
+)
+cache_write_tokens = counter(
+    "provider_cache_write_tokens_total",
+    "Prompt tokens written to a provider's prompt cache",
+    ("provider",),
+)
+
+# Known system prompts, longest first so the most specific one matches
+STATIC_SYSTEM_PROMPTS: List[str] = sorted(
+    {
+        *SYSTEM_PROMPTS.values(),
+        *TEXT_SYSTEM_PROMPTS.values(),
+        *IMPORTED_CODE_SYSTEM_PROMPTS.values(),
+        *ENGINEERING_UPDATE_SYSTEM_PROMPTS.values(),
+        *(
+            f"{prompt}\n\n{BLOCK_UPDATE_SYSTEM_SUFFIX}"
+            for prompt in ENGINEERING_UPDATE_SYSTEM_PROMPTS.values()
+        ),
+    },
+    key=len,
+    reverse=True,
+)
+
+
+def split_static_prefix(system_prompt: str) -> Tuple[str, str]:
+    """Split a system prompt into its shared part and the request-specific rest
+
+    Imported-code prompts append the user's code to a shared system prompt,
+    which would otherwise keep the shared part from being reused. Unknown
+    prompts are assumed to be entirely static.
+    """
+    for static in STATIC_SYSTEM_PROMPTS:
+        if system_prompt.startswith(static):
+            return static, system_prompt[len(static) :]
+    return system_prompt, ""
+
+
+def claude_system_blocks(system_prompt: str) -> List[Dict[str, Any]]:
+    """Claude system content with a cache breakpoint after the shared prefix"""
+    static, rest = split_static_prefix(system_prompt)
+    blocks: List[Dict[str, Any]] = [
+        {"type": "text", "text": static, "cache_control": EPHEMERAL}
+    ]
+    if rest:
+        blocks.append({"type": "text", "text": rest})
+    return blocks
+
+
+def add_claude_history_breakpoint(messages: List[Dict[str, Any]]) -> None:
+    """Mark the end of the last user turn so the conversation so far is cached
+
+    Variants, hedges and retries of the same prompt, and later update turns,
+    then only pay full price for what comes after it.
+    """
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message["content"]
+        if isinstance(content, str):
+            if not content:
+                return
+            content = message["content"] = [{"type": "text", "text": content}]
+        if content:
+            content[-1]["cache_control"] = EPHEMERAL
+        return
+
+
+def openai_prompt_cache_key(messages: List[Any], model_name: str) -> str:
+    """Routing hint that sends requests sharing a system prompt to the same cache"""
+    system = messages[0].get("content") if messages else ""
+    static, _ = split_static_prefix(system if isinstance(system, str) else "")
+    return hashlib.sha256(f"{model_name}\n{static}".encode("utf-8")).hexdigest()[:32]
+
+
+def record_usage(
+    provider: str,
+    model_name: str,
+    total_tokens: int,
+    cached_tokens: int,
+    written_tokens: int = 0,
+) -> None:
+    """Count prompt tokens and how many of them came from the provider's cache"""
+    input_tokens.inc(total_tokens, provider=provider)
+    cached_input_tokens.inc(cached_tokens, provider=provider)
+    cache_write_tokens.inc(written_tokens, provider=provider)
+    if total_tokens:
+        print(
+            f"[PROMPT_CACHE] {model_name}: {cached_tokens}/{total_tokens} input tokens "
+            f"from cache ({cached_tokens / total_tokens:.0%}), {written_tokens} written"
+        )
@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, List
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from config import STREAM_MAX_RETRIES, STREAM_RETRY_BACKOFF_SECONDS
+from llm import Completion
+from metrics.core import counter
+from routing.core import classify_error
+
+# Continuations often start by repeating the last few lines of the partial
+# output; repeats shorter than this are too likely to be coincidental
+MIN_OVERLAP = 8
+OVERLAP_WINDOW = 512
+
+CONTINUE_PROMPT = (
+    "Your previous response was cut off. Continue it exactly where it stopped, "
+    "without repeating anything that was already written and without any "
+    "preamble."
+)
+
+stream_retries = counter(
+    "generation_stream_retries_total",
+    "Provider streams re-issued after failing",
+)
+stream_resumes = counter(
+    "generation_stream_resumes_total",
+    "Dropped provider streams completed with a continuation request",
+)
+resumed_output_chars = counter(
+    "generation_resumed_output_chars_total",
+    "Characters of partial output kept instead of regenerated",
+)
+
+StartStream = Callable[
+    [List[ChatCompletionMessageParam], Callable[[str], Awaitable[None]]],
+    Awaitable[Completion],
+]
+
+
+class OverlapTrimmer:
+    """Drops text at the start of a continuation that repeats the end of `partial`
+
+    Holds back the first len(partial[-window:]) characters of the continuation
+    until it can tell how much of it is repeated.
+    """
+
+    def __init__(self, partial: str, window: int = OVERLAP_WINDOW):
+        self.partial = partial[-window:]
+        self.buffer = ""
+        self.done = not partial
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return text
+        self.buffer += text
+        if len(self.buffer) < len(self.partial):
+            return ""
+        return self.flush()
+
+    def flush(self) -> str:
+        if self.done:
+            return ""
+        self.done = True
+        buffer, self.buffer = self.buffer, ""
+        for size in range(min(len(buffer), len(self.partial)), MIN_OVERLAP - 1, -1):
+            if self.partial.endswith(buffer[:size]):
+                return buffer[size:]
+        return buffer
+
+
+def continuation_messages(
+    messages: List[ChatCompletionMessageParam], partial: str, prefill: bool
+) -> List[ChatCompletionMessageParam]:
+    """Messages asking the model to pick up after `partial`
+
+    With `prefill`, the partial output becomes the start of the assistant turn
+    (Claude continues it directly). Otherwise the model is shown its partial
+    output and asked to continue.
+    """
+    if prefill:
+        # Claude rejects a final assistant message ending in whitespace
+        return [*messages, {"role": "assistant", "content": partial.rstrip()}]
+    return [
+        *messages,
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+async def stream_with_resume(
+    start: StartStream,
+    messages: List[ChatCompletionMessageParam],
+    callback: Callable[[str], Awaitable[None]],
+    prefill: bool,
+    max_retries: int = STREAM_MAX_RETRIES,
+    backoff_seconds: float = STREAM_RETRY_BACKOFF_SECONDS,
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> Completion:
+    """Run a streaming request, resuming it if the stream fails part way
+
+    Everything streamed before a failure is kept. The retry asks the model to
+    continue from it, and its output is spliced on so `callback` sees one
+    uninterrupted stream. Client errors (bad key, unknown model) are raised
+    straight away; other failures are retried up to `max_retries` times with
+    jittered exponential backoff.
+    """
+    start_time = time.time()
+    received = ""
+    attempt = 0
+    while True:
+        resumed_from = len(received)
+        request_messages = (
+            continuation_messages(messages, received, prefill) if received else messages
+        )
+        trimmer = OverlapTrimmer(received)
+
+        async def on_chunk(text: str) -> None:
+            nonlocal received
+            text = trimmer.feed(text)
+            if text:
+                received += text
+                await callback(text)
+
+        try:
+            completion = await start(request_messages, on_chunk)
+        except Exception as e:
+            if attempt >= max_retries or classify_error(e) == "client":
+                raise
+            delay = backoff_seconds * 2**attempt * random.uniform(0.5, 1.5)
+            print(
+                f"[RESUME] Stream failed after {len(received)} chars ({e!r}), "
+                f"retrying in {delay:.1f}s"
+            )
+            stream_retries.inc()
+            attempt += 1
+            await sleep(delay)
+            continue
+
+        tail = trimmer.flush()
+        if tail:
+            received += tail
+            await callback(tail)
+        if resumed_from:
+            stream_resumes.inc()
+            resumed_output_chars.inc(resumed_from)
+        if received:
+            completion["code"] = received
+        completion["duration"] = time.time() - start_time
+        return completion
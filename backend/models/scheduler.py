@@ -0,0 +1,375 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List
+
+from config import (
+    PROVIDER_MAX_CONCURRENCY,
+    PROVIDER_MODEL_MAX_CONCURRENCY,
+    PROVIDER_QUEUE_STATUS_INTERVAL,
+    PROVIDER_RPM_LIMITS,
+    PROVIDER_TPM_LIMITS,
+)
+from metrics.core import counter, gauge
+
+# Rough chars-per-token ratio and per-image cost used to estimate prompt sizes
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1500
+
+queue_depth = gauge(
+    "provider_queue_depth", "Provider requests waiting for a slot", ("provider",)
+)
+requests_in_flight = gauge(
+    "provider_requests_in_flight",
+    "Provider requests currently holding a slot",
+    ("provider",),
+)
+requests_scheduled = counter(
+    "provider_requests_scheduled_total",
+    "Provider requests admitted by the scheduler",
+    ("provider",),
+)
+requests_queued = counter(
+    "provider_requests_queued_total",
+    "Provider requests that had to wait for a slot",
+    ("provider",),
+)
+queue_wait_seconds = counter(
+    "provider_queue_wait_seconds_total",
+    "Total time provider requests spent waiting for a slot",
+    ("provider",),
+)
+
+
+@dataclass
+class QueueStatus:
+    provider: str
+    model: str
+    # Requests that will be admitted before this one
+    ahead: int
+    waited: float
+    started: bool = False
+
+
+QueueListener = Callable[[QueueStatus], Awaitable[None]]
+
+# Requests are queued fairly across clients (one per WebSocket connection)
+current_client: ContextVar[str] = ContextVar("scheduler_client", default="")
+# Notified while a request waits for a slot and once it is admitted
+queue_listener: ContextVar[QueueListener | None] = ContextVar(
+    "scheduler_queue_listener", default=None
+)
+
+
+@dataclass
+class ProviderLimits:
+    # 0 means unlimited
+    max_concurrency: int = PROVIDER_MAX_CONCURRENCY
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+
+
+def parse_provider_limits(spec: str) -> Dict[str, float]:
+    """Parse "openai=500,anthropic=50" into a per-provider mapping"""
+    limits: Dict[str, float] = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        provider, _, value = item.partition("=")
+        limits[provider.strip()] = float(value)
+    return limits
+
+
+PROVIDER_RPM = parse_provider_limits(PROVIDER_RPM_LIMITS)
+PROVIDER_TPM = parse_provider_limits(PROVIDER_TPM_LIMITS)
+
+
+def estimate_prompt_tokens(messages: List[Any]) -> int:
+    """Approximate input tokens of OpenAI-style messages"""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            else:
+                images += 1
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute, bursting up to one minute's worth"""
+
+    def __init__(
+        self, rate_per_minute: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self._rate = rate_per_minute / 60
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        self._refill()
+        # A request bigger than the whole bucket would otherwise never run
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self._rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+@dataclass(eq=False)
+class _Waiter:
+    provider: str
+    model: str
+    client: str
+    tokens: int
+    future: "asyncio.Future[None]"
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _ClientQueue:
+    waiters: Deque[_Waiter] = field(default_factory=deque)
+    active: int = 0
+    # Admission sequence number of this client's most recent request
+    last_served: int = -1
+
+
+class ProviderScheduler:
+    """Process-wide admission control for provider requests
+
+    Every provider has a concurrency limit and optional requests-per-minute
+    and tokens-per-minute budgets; every model a concurrency limit of its own
+    (0 for any of them means unlimited).
+    Requests that can't run yet wait in per-client queues. The next slot goes
+    to the client with the fewest requests in flight (then the one served
+    longest ago), so one connection fanning out many variants and pages
+    can't starve the others.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, ProviderLimits] | None = None,
+        model_max_concurrency: int = PROVIDER_MODEL_MAX_CONCURRENCY,
+        status_interval: float = PROVIDER_QUEUE_STATUS_INTERVAL,
+    ):
+        self.limits = limits or {}
+        self.model_max_concurrency = model_max_concurrency
+        self.status_interval = status_interval
+        self._active: Dict[str, int] = {}
+        self._active_models: Dict[str, int] = {}
+        self._clients: Dict[str, Dict[str, _ClientQueue]] = {}
+        self._served = 0
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        self._token_buckets: Dict[str, TokenBucket] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    @asynccontextmanager
+    async def slot(
+        self, provider: str, model: str, tokens: int = 0
+    ) -> AsyncIterator[None]:
+        """Hold a slot for one provider request while the body runs"""
+        waiter = await self._acquire(provider, model, tokens)
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def stats(self, provider: str) -> Dict[str, int]:
+        return {
+            "in_flight": self._active.get(provider, 0),
+            "queued": self._queued(provider),
+        }
+
+    def total_stats(self) -> Dict[str, int]:
+        """In-flight and queued requests summed over all providers"""
+        return {
+            "in_flight": sum(self._active.values()),
+            "queued": sum(self._queued(provider) for provider in self._clients),
+        }
+
+    def _provider_limits(self, provider: str) -> ProviderLimits:
+        limits = self.limits.get(provider)
+        if limits is None:
+            limits = ProviderLimits(
+                requests_per_minute=PROVIDER_RPM.get(provider, 0),
+                tokens_per_minute=PROVIDER_TPM.get(provider, 0),
+            )
+            self.limits[provider] = limits
+        return limits
+
+    async def _acquire(self, provider: str, model: str, tokens: int) -> _Waiter:
+        client = current_client.get()
+        waiter = _Waiter(
+            provider, model, client, tokens, asyncio.get_running_loop().create_future()
+        )
+        clients = self._clients.setdefault(provider, {})
+        clients.setdefault(client, _ClientQueue()).waiters.append(waiter)
+        self._dispatch(provider)
+        if waiter.future.done():
+            requests_scheduled.inc(provider=provider)
+            return waiter
+
+        requests_queued.inc(provider=provider)
+        listener = queue_listener.get()
+        try:
+            while not waiter.future.done():
+                if listener is not None:
+                    await listener(self._status(waiter))
+                await asyncio.wait({waiter.future}, timeout=self.status_interval)
+            if listener is not None:
+                waited = time.monotonic() - waiter.enqueued_at
+                await listener(QueueStatus(provider, model, 0, waited, started=True))
+        except BaseException:
+            if waiter.future.done():
+                self._release(waiter)
+            else:
+                waiter.future.cancel()
+                self._remove_waiter(waiter)
+                self._dispatch(provider)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        queue_wait_seconds.inc(waited, provider=provider)
+        requests_scheduled.inc(provider=provider)
+        print(f"[SCHEDULER] {model} admitted after waiting {waited:.1f}s")
+        return waiter
+
+    def _release(self, waiter: _Waiter) -> None:
+        provider = waiter.provider
+        self._active[provider] -= 1
+        self._active_models[waiter.model] -= 1
+        clients = self._clients[provider]
+        state = clients[waiter.client]
+        state.active -= 1
+        if not state.active and not state.waiters:
+            del clients[waiter.client]
+        self._dispatch(provider)
+
+    def _dispatch(self, provider: str) -> None:
+        """Admit queued requests while the provider has capacity"""
+        limits = self._provider_limits(provider)
+        while (
+            not limits.max_concurrency
+            or self._active.get(provider, 0) < limits.max_concurrency
+        ):
+            waiter = self._next_waiter(provider)
+            if waiter is None:
+                break
+
+            delay = self._budget_delay(provider, waiter.tokens)
+            if delay > 0:
+                self._schedule_dispatch(provider, delay)
+                break
+
+            self._take_budget(provider, waiter.tokens)
+            state = self._clients[provider][waiter.client]
+            state.active += 1
+            state.last_served = self._served
+            self._served += 1
+            self._remove_waiter(waiter)
+            self._active[provider] = self._active.get(provider, 0) + 1
+            self._active_models[waiter.model] = (
+                self._active_models.get(waiter.model, 0) + 1
+            )
+            waiter.future.set_result(None)
+
+        requests_in_flight.set(self._active.get(provider, 0), provider=provider)
+        queue_depth.set(self._queued(provider), provider=provider)
+
+    def _next_waiter(self, provider: str) -> _Waiter | None:
+        best: _Waiter | None = None
+        best_key = (0, 0)
+        for state in self._clients.get(provider, {}).values():
+            key = (state.active, state.last_served)
+            if best is not None and key >= best_key:
+                continue
+            for waiter in state.waiters:
+                if (
+                    not self.model_max_concurrency
+                    or self._active_models.get(waiter.model, 0)
+                    < self.model_max_concurrency
+                ):
+                    best, best_key = waiter, key
+                    break
+        return best
+
+    def _budget_delay(self, provider: str, tokens: int) -> float:
+        limits = self._provider_limits(provider)
+        delay = 0.0
+        if limits.requests_per_minute:
+            bucket = self._request_buckets.setdefault(
+                provider, TokenBucket(limits.requests_per_minute)
+            )
+            delay = max(delay, bucket.delay(1))
+        if limits.tokens_per_minute and tokens:
+            bucket = self._token_buckets.setdefault(
+                provider, TokenBucket(limits.tokens_per_minute)
+            )
+            delay = max(delay, bucket.delay(tokens))
+        return delay
+
+    def _take_budget(self, provider: str, tokens: int) -> None:
+        if provider in self._request_buckets:
+            self._request_buckets[provider].take(1)
+        if tokens and provider in self._token_buckets:
+            self._token_buckets[provider].take(tokens)
+
+    def _schedule_dispatch(self, provider: str, delay: float) -> None:
+        if provider in self._timers:
+            return
+
+        def run() -> None:
+            del self._timers[provider]
+            self._dispatch(provider)
+
+        self._timers[provider] = asyncio.get_running_loop().call_later(delay, run)
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        clients = self._clients[waiter.provider]
+        state = clients[waiter.client]
+        state.waiters.remove(waiter)
+        if not state.active and not state.waiters:
+            del clients[waiter.client]
+        queue_depth.set(self._queued(waiter.provider), provider=waiter.provider)
+
+    def _queued(self, provider: str) -> int:
+        return sum(
+            len(state.waiters) for state in self._clients.get(provider, {}).values()
+        )
+
+    def _status(self, waiter: _Waiter) -> QueueStatus:
+        clients = self._clients.get(waiter.provider, {})
+        own = clients.get(waiter.client)
+        position = own.waiters.index(waiter) if own and waiter in own.waiters else 0
+        # Every other client gets up to one turn per turn of ours
+        ahead = position + sum(
+            min(len(state.waiters), position + 1)
+            for client, state in clients.items()
+            if client != waiter.client
+        )
+        return QueueStatus(
+            waiter.provider,
+            waiter.model,
+            ahead,
+            time.monotonic() - waiter.enqueued_at,
+        )
+
+
+provider_scheduler = ProviderScheduler()
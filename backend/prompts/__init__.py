@@ -1,6 +1,7 @@
 from typing import Union, Any, cast
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletionContentPartParam
 
+from blobs.core import blob_store
 from custom_types import InputMode
 from codegen.utils import replace_base64_data_urls
 from image_generation.core import create_alt_url_mapping
@@ -38,7 +39,9 @@ async def create_prompt(
     base64_mapping: dict[str, str] = {}
 
     if generation_type == "update":
-        current_html = history[-2]["text"] if len(history) >= 2 else ""
+        current_html = (
+            blob_store.resolve(history[-2]["text"]) if len(history) >= 2 else ""
+        )
         update_instruction = history[-1]["text"] if history else ""
         update_images = history[-1].get("images", []) if history else []
         prompt_messages, base64_mapping = assemble_engineering_update_prompt(
@@ -53,7 +56,7 @@ async def create_prompt(
         if current_html:
             image_cache = create_alt_url_mapping(current_html)
     elif is_imported_from_code:
-        original_imported_code = history[0]["text"]
+        original_imported_code = blob_store.resolve(history[0]["text"])
         prompt_messages = assemble_imported_code_prompt(original_imported_code, stack)
         for index, item in enumerate(history[1:]):
             role = "user" if index % 2 == 0 else "assistant"
@@ -62,14 +65,14 @@ async def create_prompt(
     else:
         # Assemble the prompt for non-imported code
         if input_mode == "image":
-            image_url = prompt["images"][0]
+            image_url = blob_store.resolve(prompt["images"][0])
             text_prompt = prompt.get("text", "")
             prompt_messages = assemble_prompt(image_url, stack, text_prompt)
         elif input_mode == "text":
             prompt_messages = assemble_text_prompt(prompt["text"], stack)
         else:
             # Default to image mode for backward compatibility
-            image_url = prompt["images"][0]
+            image_url = blob_store.resolve(prompt["images"][0])
             text_prompt = prompt.get("text", "")
             prompt_messages = assemble_prompt(image_url, stack, text_prompt)
 
@@ -114,8 +117,11 @@ def create_message_from_history_item(
 ) -> ChatCompletionMessageParam:
     """
     Create a ChatCompletionMessageParam from a history item.
-    Handles both text-only and text+images content.
+    Handles both text-only and text+images content, and resolves
+    blob references in either.
     """
+    text = blob_store.resolve(item["text"])
+
     # Check if this is a user message with images
     if role == "user" and item.get("images") and len(item["images"]) > 0:
         # Create multipart content for user messages with images
@@ -126,7 +132,7 @@ def create_message_from_history_item(
             user_content.append(
                 {
                     "type": "image_url",
-                    "image_url": {"url": image_url, "detail": "high"},
+                    "image_url": {"url": blob_store.resolve(image_url), "detail": "high"},
                 }
             )
 
@@ -134,7 +140,7 @@ def create_message_from_history_item(
         user_content.append(
             {
                 "type": "text",
-                "text": item["text"],
+                "text": text,
             }
         )
 
@@ -151,7 +157,7 @@ def create_message_from_history_item(
             ChatCompletionMessageParam,
             {
                 "role": role,
-                "content": item["text"],
+                "content": text,
             },
         )
 
@@ -246,6 +252,8 @@ def assemble_engineering_update_prompt(
             image_urls.extend(update_images)
         elif prompt_images:
             image_urls.extend(prompt_images)
+    image_urls = [blob_store.resolve(image_url) for image_url in image_urls]
+    current_html = blob_store.resolve(current_html)
 
     scrubbed_instruction, mapping = replace_base64_data_urls(update_instruction)
     scrubbed_html, mapping = replace_base64_data_urls(current_html, mapping)
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from config import (
+    RESPONSE_CACHE_DISK_MAX_BYTES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_REPLAY_CHARS_PER_SECOND,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+from metrics.core import counter, gauge
+
+# Size of the chunks a cached completion is replayed in
+REPLAY_CHUNK_CHARS = 64
+
+cache_hits = counter(
+    "response_cache_hits_total", "Completions served from the response cache", ("tier",)
+)
+cache_misses = counter(
+    "response_cache_misses_total", "Completion lookups the response cache couldn't serve"
+)
+cache_hit_ratio = gauge(
+    "response_cache_hit_ratio", "Share of completion lookups served from the cache"
+)
+cache_evictions = counter(
+    "response_cache_evictions_total",
+    "Cached completions dropped for size or age",
+    ("tier", "reason"),
+)
+cache_bytes = gauge(
+    "response_cache_bytes", "Bytes held by the response cache", ("tier",)
+)
+
+
+def _normalize_content(content: Any) -> Any:
+    if not isinstance(content, list):
+        return content
+    parts: List[Any] = []
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            # Hash images so large data URLs don't end up in the key material
+            url = part.get("image_url", {}).get("url", "")
+            digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+            parts.append({"type": "image_url", "sha256": digest})
+        else:
+            parts.append(part)
+    return parts
+
+
+def cache_key(
+    model: str,
+    stack: str,
+    temperature: float,
+    messages: List[Any],
+    variant: int = 0,
+    base_url: str | None = None,
+) -> str:
+    """Canonical hash of everything that determines a completion
+
+    `variant` keeps variants that use the same model distinct, so a cache hit
+    still shows the user different options. `base_url` separates the same
+    model name served by different OpenAI-compatible endpoints.
+    """
+    normalized = [
+        {"role": message.get("role"), "content": _normalize_content(message.get("content"))}
+        for message in messages
+    ]
+    material = json.dumps(
+        [model, base_url, stack, temperature, variant, normalized],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Completions keyed by `cache_key`, in memory and in a SQLite file
+
+    Recently used completions stay in memory up to `max_memory_bytes`. Every
+    completion is also written to the SQLite file at `path` (if set), which
+    survives restarts and drops least-recently-used entries once it holds
+    more than `max_disk_bytes`. Entries expire `ttl_seconds` after they were
+    stored. Methods block on disk I/O, so async code calls them in a thread.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        path: str = RESPONSE_CACHE_PATH,
+        max_disk_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._clock = clock
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            code = self._get(key)
+            self._lookups += 1
+            if code is not None:
+                self._hits += 1
+            else:
+                cache_misses.inc()
+            cache_hit_ratio.set(self._hits / self._lookups)
+            return code
+
+    def put(self, key: str, code: str) -> None:
+        with self._lock:
+            created_at = self._clock()
+            self._put_memory(key, code, created_at)
+            db = self._connect()
+            if db is None or len(code) > self.max_disk_bytes:
+                return
+            old = db.execute(
+                "SELECT size FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                (key, code, len(code), created_at, created_at),
+            )
+            self.disk_bytes += len(code) - (old[0] if old else 0)
+            self._enforce_disk_budget(db)
+            db.commit()
+            self._update_gauges()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+            "hit_ratio": self._hits / self._lookups if self._lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _get(self, key: str) -> str | None:
+        now = self._clock()
+        entry = self._memory.get(key)
+        if entry is not None:
+            code, created_at = entry
+            if now - created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                cache_hits.inc(tier="memory")
+                return code
+            self._remove_memory(key)
+            cache_evictions.inc(tier="memory", reason="expired")
+
+        db = self._connect()
+        if db is None:
+            return None
+        row = db.execute(
+            "SELECT code, created_at FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        code, created_at = row
+        if now - created_at > self.ttl_seconds:
+            db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            db.commit()
+            self.disk_bytes -= len(code)
+            cache_evictions.inc(tier="disk", reason="expired")
+            self._update_gauges()
+            return None
+        db.execute("UPDATE completions SET used_at = ? WHERE key = ?", (now, key))
+        db.commit()
+        cache_hits.inc(tier="disk")
+        self._put_memory(key, code, created_at)
+        return code
+
+    def _put_memory(self, key: str, code: str, created_at: float) -> None:
+        self._remove_memory(key)
+        self._memory[key] = (code, created_at)
+        self.memory_bytes += len(code)
+        while self.memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            self._remove_memory(next(iter(self._memory)))
+            cache_evictions.inc(tier="memory", reason="size")
+        self._update_gauges()
+
+    def _remove_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[0])
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if not self.path:
+            return None
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, code TEXT, size INTEGER, "
+                "created_at REAL, used_at REAL)"
+            )
+            self._db.execute(
+                "DELETE FROM completions WHERE created_at < ?",
+                (self._clock() - self.ttl_seconds,),
+            )
+            self._db.commit()
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+            self.disk_bytes = total
+        return self._db
+
+    def _enforce_disk_budget(self, db: sqlite3.Connection) -> None:
+        while self.disk_bytes > self.max_disk_bytes:
+            row = db.execute(
+                "SELECT key, size FROM completions ORDER BY used_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM completions WHERE key = ?", (row[0],))
+            self.disk_bytes -= row[1]
+            cache_evictions.inc(tier="disk", reason="size")
+
+    def _update_gauges(self) -> None:
+        cache_bytes.set(self.memory_bytes, tier="memory")
+        cache_bytes.set(self.disk_bytes, tier="disk")
+
+
+async def replay_completion(
+    code: str,
+    callback: Callable[[str], Awaitable[None]],
+    chars_per_second: float = RESPONSE_CACHE_REPLAY_CHARS_PER_SECOND,
+) -> None:
+    """Stream a cached completion in chunks, paced like a model would (0 = at once)"""
+    if chars_per_second <= 0:
+        await callback(code)
+        return
+    delay = REPLAY_CHUNK_CHARS / chars_per_second
+    for start in range(0, len(code), REPLAY_CHUNK_CHARS):
+        if start:
+            await asyncio.sleep(delay)
+        await callback(code[start : start + REPLAY_CHUNK_CHARS])
+
+
+response_cache = ResponseCache()
@@ -1,32 +1,45 @@
 import asyncio
 from dataclasses import dataclass, field, replace
 from abc import ABC, abstractmethod
+import json
 import traceback
 from typing import Callable, Awaitable
 import time
+import uuid
 from fastapi import APIRouter, WebSocket
 import openai
 from codegen.engineering import generate_engineered_html
 from codegen.block_updates import BlockUpdateStreamProcessor
 from codegen.utils import (
+    StreamingPlaceholderRestorer,
     extract_html_content,
     replace_base64_data_urls,
     restore_base64_placeholders,
 )
 from config import (
     ANTHROPIC_API_KEY,
+    BLOB_REQUEST_TIMEOUT_SECONDS,
     GEMINI_API_KEY,
+    HEDGE_FIRST_VARIANT,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MODEL,
+    HEDGE_TTFT_PERCENTILE,
     IS_PROD,
     NUM_VARIANTS,
     OPENAI_API_KEY,
     OPENAI_BASE_URL,
     REPLICATE_API_KEY,
+    RESPONSE_CACHE_ENABLED,
+    SCREENSHOT_INDEX_ENABLED,
     SHOULD_MOCK_AI_RESPONSE,
+    WS_CHUNK_FLUSH_INTERVAL_MS,
+    WS_CHUNK_FLUSH_MAX_BYTES,
 )
 from custom_types import InputMode
 from llm import (
     Completion,
     Llm,
+    MODEL_PROVIDER,
     OPENAI_MODELS,
     ANTHROPIC_MODELS,
     GEMINI_MODELS,
@@ -37,8 +50,46 @@ from models import (
     stream_openai_response,
     stream_gemini_response,
 )
+from models.claude import THINKING_MODELS
+from models.resume import stream_with_resume
+from models.scheduler import (
+    QueueStatus,
+    current_client,
+    provider_scheduler,
+    queue_listener,
+)
+from admission.core import admission_controller
+from response_cache.core import (
+    ResponseCache,
+    cache_key,
+    replay_completion,
+    response_cache,
+)
+from routing.core import classify_error, model_router
+from routing.telemetry import RequestOutcome, percentile
 from fs_logging.core import write_logs
+from metrics.core import counter
 from mock_llm import mock_completion
+from blobs.core import (
+    BlobMissingError,
+    blob_digest,
+    blob_store,
+    collect_blob_refs,
+    is_blob_ref,
+)
+from image_processing.executor import run_image_task
+from screenshot_index.core import screenshot_hash, screenshot_index
+from sessions.core import (
+    GenerationSession,
+    ResumeError,
+    frames_replayed,
+    regenerations_avoided,
+    resume_failures,
+    session_store,
+    sessions_resumed,
+)
+from tracing.core import RequestTrace, current_trace, span
+from uploads.core import UploadError, resolve_image_url
 from typing import (
     Any,
     Callable,
@@ -46,6 +97,8 @@ from typing import (
     Dict,
     List,
     Literal,
+    NoReturn,
+    Tuple,
     cast,
     get_args,
 )
@@ -61,6 +114,9 @@ MessageType = Literal[
     "variantComplete",
     "variantError",
     "variantCount",
+    "blobsMissing",
+    "session",
+    "warmStart",
 ]
 from image_generation.core import generate_images
 from prompts import create_multi_prompt
@@ -69,11 +125,93 @@ from prompts.engineering_refinement import assemble_engineering_refinement_promp
 from prompts.types import Stack, PromptContent
 
 # from utils import pprint_prompt
-from ws.constants import APP_ERROR_WEB_SOCKET_CODE  # type: ignore
+from ws.constants import (  # type: ignore
+    APP_ERROR_WEB_SOCKET_CODE,
+    SESSION_SUPERSEDED_WEB_SOCKET_CODE,
+)
 
 
 router = APIRouter()
 
+ws_frames_sent = counter(
+    "ws_frames_sent_total", "WebSocket frames sent to clients", ("type",)
+)
+ws_bytes_sent = counter("ws_bytes_sent_total", "WebSocket payload bytes sent to clients")
+client_disconnects = counter(
+    "generation_client_disconnects_total",
+    "Generations abandoned because the client disconnected mid-stream",
+)
+cancelled_variants = counter(
+    "generation_cancelled_variants_total",
+    "Variant generations cancelled before completion",
+)
+output_tokens_saved = counter(
+    "generation_output_tokens_saved_total",
+    "Estimated output tokens not generated thanks to cancellation",
+)
+hedged_variants = counter(
+    "generation_hedged_variants_total",
+    "Variant generations run with hedging enabled",
+)
+hedges_launched = counter(
+    "generation_hedges_total",
+    "Duplicate requests launched because a variant's first token was late",
+    ("model",),
+)
+hedge_wins = counter(
+    "generation_hedge_wins_total",
+    "Hedged variants where the duplicate request streamed first",
+    ("model",),
+)
+
+# Rough chars-per-token ratio used to estimate output token counts from streamed text
+CHARS_PER_TOKEN = 4
+
+
+def queue_status_sender(
+    send_message: Callable[[MessageType, Any, int, int], Coroutine[Any, Any, None]],
+    variant_index: int,
+    page_index: int,
+) -> Callable[[QueueStatus], Coroutine[Any, Any, None]]:
+    """Report a variant's place in the provider queue through status messages"""
+
+    async def send(status: QueueStatus) -> None:
+        if status.started:
+            message = "Generating code..."
+        else:
+            message = (
+                f"Waiting for {status.provider} capacity "
+                f"({status.ahead} requests ahead)..."
+            )
+        await send_message("status", message, variant_index, page_index)
+
+    return send
+
+
+class CompletionSizeTracker:
+    """Running average of completion sizes, used to estimate tokens saved by cancellation"""
+
+    def __init__(self, initial_tokens: float = 4000, smoothing: float = 0.1):
+        self.average_tokens = initial_tokens
+        self.smoothing = smoothing
+
+    def observe(self, output_tokens: float) -> None:
+        self.average_tokens += self.smoothing * (output_tokens - self.average_tokens)
+
+    def estimate_remaining(self, produced_tokens: float) -> int:
+        return max(0, int(self.average_tokens - produced_tokens))
+
+
+completion_sizes = CompletionSizeTracker()
+
+
+# OpenAI errors that get a specific variantError message
+OPENAI_REPORTED_ERRORS = (
+    openai.AuthenticationError,
+    openai.NotFoundError,
+    openai.RateLimitError,
+)
+
 
 class VariantErrorAlreadySent(Exception):
     """Exception that indicates a variantError message has already been sent to frontend"""
@@ -95,11 +233,14 @@ class PipelineContext:
     image_cache: Dict[str, str] = field(default_factory=dict)
     prompt_batches: List["PromptBatchContext"] = field(default_factory=list)
     variant_models: List[Llm] = field(default_factory=list)
+    # Variants per page, chosen by the admission controller
+    variant_count: int = NUM_VARIANTS
     completions: List[str] = field(default_factory=list)
     batch_completions: Dict[int, List[str]] = field(default_factory=dict)
     variant_completions: Dict[int, str] = field(default_factory=dict)
     base64_mapping: Dict[str, str] = field(default_factory=dict)
     metadata: Dict[str, Any] = field(default_factory=dict)
+    trace: RequestTrace = field(default_factory=RequestTrace)
 
     @property
     def send_message(self):
@@ -146,27 +287,80 @@ class Pipeline:
         for middleware in reversed(self.middlewares):
             chain = self._wrap_middleware(middleware, chain)
 
-        await chain(context)
+        # Lets variant tasks and helpers add spans to this request's trace
+        current_trace.set(context.trace)
+        try:
+            await chain(context)
+        finally:
+            if context.trace.keep_spans:
+                path = await asyncio.to_thread(context.trace.write)
+                print(f"[TRACE] Wrote {path}")
 
     def _wrap_middleware(
         self,
         middleware: Middleware,
         next_func: Callable[[PipelineContext], Awaitable[None]],
     ) -> Callable[[PipelineContext], Awaitable[None]]:
-        """Wrap a middleware with its next function"""
+        """Wrap a middleware with its next function, timing the middleware itself"""
+        stage = type(middleware).__name__.removesuffix("Middleware")
 
         async def wrapped(context: PipelineContext) -> None:
-            await middleware.process(context, lambda: next_func(context))
+            started = time.perf_counter()
+            downstream = 0.0
+
+            async def timed_next() -> None:
+                nonlocal downstream
+                next_started = time.perf_counter()
+                try:
+                    await next_func(context)
+                finally:
+                    downstream += time.perf_counter() - next_started
+
+            try:
+                await middleware.process(context, timed_next)
+            finally:
+                elapsed = time.perf_counter() - started
+                context.trace.stage(stage, started, max(0.0, elapsed - downstream))
 
         return wrapped
 
 
 class WebSocketCommunicator:
-    """Handles WebSocket communication with consistent error handling"""
+    """Handles WebSocket communication with consistent error handling
+
+    Streamed chunks are buffered per (variantIndex, pageIndex) and sent as a
+    single merged frame once the flush interval elapses or the buffer grows past
+    the size limit. Any other message type flushes the buffer first so the
+    client always sees chunks before the setCode/variantComplete/error that
+    follows them.
 
-    def __init__(self, websocket: WebSocket):
+    With a resumable session, every frame carries a sequence number and is
+    kept in the session's replay buffers. If the client goes away, frames are
+    only buffered until a reconnecting client is attached.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        flush_interval: float = WS_CHUNK_FLUSH_INTERVAL_MS / 1000,
+        flush_max_bytes: int = WS_CHUNK_FLUSH_MAX_BYTES,
+    ):
         self.websocket = websocket
         self.is_closed = False
+        self.client_disconnected = False
+        self.flush_interval = flush_interval
+        self.flush_max_bytes = flush_max_bytes
+        self._pending_chunks: Dict[Tuple[int, int], List[str]] = {}
+        self._pending_bytes = 0
+        self._flush_task: asyncio.Task[None] | None = None
+        # Serializes frames so a timed flush can't be overtaken by a setCode
+        self._send_lock = asyncio.Lock()
+        self.session: GenerationSession | None = None
+        self.detached = False
+        self.chunks_received = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self._first_frame_at: float | None = None
 
     async def accept(self) -> None:
         """Accept the WebSocket connection"""
@@ -181,32 +375,176 @@ class WebSocketCommunicator:
         pageIndex: int = 0,
     ) -> None:
         """Send a message to the client with debug logging"""
+        if type == "chunk":
+            self._buffer_chunk(value, variantIndex, pageIndex)
+            if self.flush_interval <= 0 or self._pending_bytes >= self.flush_max_bytes:
+                await self.flush_chunks()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_after_interval())
+            return
+
         # Print for debugging on the backend
         if type == "error":
             print(f"Error (variant {variantIndex + 1}): {value}")
         elif type == "status":
             print(f"Status (variant {variantIndex + 1}): {value}")
-        elif type == "chunk":
-            print(value, end="", flush=True)
         elif type == "variantComplete":
             print(f"Variant {variantIndex + 1} complete")
         elif type == "variantError":
             print(f"Variant {variantIndex + 1} error: {value}")
 
-        await self.websocket.send_json(
-            {
-                "type": type,
-                "value": value,
-                "variantIndex": variantIndex,
-                "pageIndex": pageIndex,
-            }
+        async with self._send_lock:
+            await self._flush_pending_chunks()
+            await self._send_frame(
+                {
+                    "type": type,
+                    "value": value,
+                    "variantIndex": variantIndex,
+                    "pageIndex": pageIndex,
+                }
+            )
+
+    def _buffer_chunk(self, value: str, variant_index: int, page_index: int) -> None:
+        self._pending_chunks.setdefault((variant_index, page_index), []).append(value)
+        self._pending_bytes += len(value)
+        self.chunks_received += 1
+
+    async def _flush_after_interval(self) -> None:
+        try:
+            await asyncio.sleep(self.flush_interval)
+            self._flush_task = None
+            await self.flush_chunks()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The socket may have gone away between scheduling and flushing
+            print(f"Error flushing chunks: {e}")
+
+    async def flush_chunks(self) -> None:
+        """Send all buffered chunks immediately"""
+        async with self._send_lock:
+            await self._flush_pending_chunks()
+
+    async def _flush_pending_chunks(self) -> None:
+        if not self._pending_chunks:
+            return
+        pending = self._pending_chunks
+        self._pending_chunks = {}
+        self._pending_bytes = 0
+        for (variant_index, page_index), parts in pending.items():
+            value = "".join(parts)
+            print(value, end="", flush=True)
+            await self._send_frame(
+                {
+                    "type": "chunk",
+                    "value": value,
+                    "variantIndex": variant_index,
+                    "pageIndex": page_index,
+                }
+            )
+
+    async def _send_frame(self, message: Dict[str, Any]) -> None:
+        session = self.session
+        if session is not None:
+            message["seq"] = session.next_seq()
+        # Same encoding as WebSocket.send_json, but we need the payload size
+        text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        if session is None:
+            await self.websocket.send_text(text)
+        else:
+            session.record(
+                (message.get("variantIndex"), message.get("pageIndex")),
+                message["seq"],
+                text,
+            )
+            if self.detached:
+                return
+            try:
+                await self.websocket.send_text(text)
+            except Exception as e:
+                print(f"[WS] Client went away, buffering frames for a resume: {e}")
+                self._detach()
+                return
+        if self._first_frame_at is None:
+            self._first_frame_at = time.perf_counter()
+        self.frames_sent += 1
+        self.bytes_sent += len(text)
+        ws_frames_sent.inc(type=str(message["type"]))
+        ws_bytes_sent.inc(len(text))
+
+    def stats(self) -> Dict[str, float]:
+        """Outbound frame statistics for this connection"""
+        elapsed = (
+            time.perf_counter() - self._first_frame_at
+            if self._first_frame_at is not None
+            else 0.0
         )
+        return {
+            "chunks_received": self.chunks_received,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "frames_per_second": self.frames_sent / elapsed if elapsed > 0 else 0.0,
+            "bytes_per_frame": (
+                self.bytes_sent / self.frames_sent if self.frames_sent else 0.0
+            ),
+        }
+
+    async def start_session(self, session: GenerationSession) -> None:
+        """Make this connection resumable and tell the client the session id"""
+        self.session = session
+        session.communicator = self
+        await self.websocket.send_json({"type": "session", "value": session.id})
+
+    async def reattach(self, websocket: WebSocket, last_seq: int) -> int:
+        """Continue the session on a reconnected client's socket
+
+        Replays the frames sent after `last_seq` and returns how many there
+        were. Raises ResumeError if some of them are no longer buffered. A
+        connection that is still attached is closed, so only the newest one
+        receives the rest of the generation.
+        """
+        assert self.session is not None
+        async with self._send_lock:
+            frames = self.session.frames_after(last_seq)
+            for frame in frames:
+                await websocket.send_text(frame)
+            previous = None if self.detached else self.websocket
+            self.websocket = websocket
+            self.detached = False
+            self.is_closed = False
+            self.client_disconnected = False
+            self.session.reattach()
+        if previous is not None:
+            try:
+                await previous.close(SESSION_SUPERSEDED_WEB_SOCKET_CODE)
+            except Exception as e:
+                print(f"[SESSION] Error closing superseded connection: {e}")
+        return len(frames)
+
+    def _detach(self) -> None:
+        self.detached = True
+        self.is_closed = True
+        self.client_disconnected = True
+        if self.session is not None:
+            self.session.detach()
+
+    def _handle_client_message(self, text: str) -> None:
+        """Apply acknowledgements ({"type": "ack", "value": seq}) from the client"""
+        try:
+            message = json.loads(text)
+            if isinstance(message, dict) and message.get("type") == "ack":
+                assert self.session is not None
+                self.session.ack(int(message["value"]))
+        except (ValueError, KeyError, TypeError):
+            pass
 
     async def throw_error(self, message: str) -> None:
         """Send an error message and close the connection"""
         print(message)
         if not self.is_closed:
-            await self.websocket.send_json({"type": "error", "value": message})
+            async with self._send_lock:
+                await self._flush_pending_chunks()
+                await self._send_frame({"type": "error", "value": message})
             await self.websocket.close(APP_ERROR_WEB_SOCKET_CODE)
             self.is_closed = True
 
@@ -216,11 +554,74 @@ class WebSocketCommunicator:
         print("Received params")
         return params
 
+    async def request_blobs(self, digests: List[str]) -> Dict[str, str]:
+        """Ask the client for content the blob store doesn't have
+
+        The client answers with {"type": "blobs", "value": {digest: content}}.
+        The request fails if no answer arrives within the timeout.
+        """
+        await self.send_message("blobsMissing", digests, 0)
+        try:
+            message = await asyncio.wait_for(
+                self.websocket.receive_json(), BLOB_REQUEST_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            raise BlobMissingError(digests)
+        if not isinstance(message, dict) or message.get("type") != "blobs":
+            raise BlobMissingError(digests)
+        blobs = message.get("value")
+        return blobs if isinstance(blobs, dict) else {}
+
+    async def wait_for_disconnect(self) -> None:
+        """Return once the connection is closed
+
+        Acknowledgements for a resumable session are applied; any other
+        incoming messages are ignored.
+        """
+        while True:
+            websocket = self.websocket
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                if websocket is not self.websocket:
+                    # A resumed connection has taken over from this one
+                    continue
+                if not self.detached:
+                    # If we closed the socket ourselves, this is just the client's reply
+                    self.client_disconnected = not self.is_closed
+                    self.is_closed = True
+                    if self.client_disconnected and self.session is not None:
+                        self._detach()
+                return
+            if self.session is not None and message.get("text"):
+                self._handle_client_message(message["text"])
+
     async def close(self) -> None:
         """Close the WebSocket connection"""
-        if not self.is_closed:
-            await self.websocket.close()
-            self.is_closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            if self.detached:
+                # Nobody to send to, but a resuming client still needs these
+                await self.flush_chunks()
+            elif not self.is_closed:
+                try:
+                    await self.flush_chunks()
+                except Exception as e:
+                    print(f"Error flushing chunks: {e}")
+                await self.websocket.close()
+                self.is_closed = True
+        finally:
+            if self.session is not None:
+                # Only now is every frame of the generation in the buffers
+                self.session.finish()
+                self.session.closed.set()
+        stats = self.stats()
+        print(
+            f"[WS] {stats['chunks_received']} chunks sent as {stats['frames_sent']} frames "
+            f"({stats['frames_per_second']:.1f} frames/s, "
+            f"{stats['bytes_per_frame']:.0f} bytes/frame)"
+        )
 
 
 @dataclass
@@ -261,11 +662,40 @@ class PromptBatchContext:
     base64_mapping: Dict[str, str]
 
 
+def _store_blobs(contents: List[str]) -> None:
+    for content in contents:
+        blob_store.put(content)
+
+
+def _store_and_resolve_blobs(
+    values: List[Any],
+    image_lists: List[List[str]],
+    history_items: List[Dict[str, Any]],
+) -> None:
+    # Remember full content so later turns can send references to it
+    _store_blobs(
+        [value for value in values if isinstance(value, str) and value and not is_blob_ref(value)]
+    )
+
+    for images in image_lists:
+        images[:] = [blob_store.resolve(image) for image in images]
+    for item in history_items:
+        if is_blob_ref(item.get("text")):
+            item["text"] = blob_store.resolve(item["text"])
+
+
 class ParameterExtractionStage:
     """Handles parameter extraction and validation from WebSocket requests"""
 
-    def __init__(self, throw_error: Callable[[str], Coroutine[Any, Any, None]]):
+    def __init__(
+        self,
+        throw_error: Callable[[str], Coroutine[Any, Any, None]],
+        request_blobs: (
+            Callable[[List[str]], Coroutine[Any, Any, Dict[str, str]]] | None
+        ) = None,
+    ):
         self.throw_error = throw_error
+        self.request_blobs = request_blobs
 
     async def extract_and_validate(self, params: Dict[str, str]) -> ExtractedParams:
         """Extract and validate all parameters from the request"""
@@ -384,6 +814,23 @@ class ParameterExtractionStage:
         # Extract history (default to empty list)
         history = params.get("history", [])
 
+        # Swap "blob:<digest>" references for content, asking the client for
+        # anything the store doesn't have
+        try:
+            await self._resolve_blobs(prompt, prompt_batches, history)
+        except BlobMissingError as exc:
+            await self.throw_error(str(exc))
+            raise
+
+        # Swap "upload:<id>" image references for the uploaded data. Videos
+        # stay references and are read from disk when frames are extracted
+        if validated_input_mode != "video":
+            try:
+                await self._resolve_uploads(prompt, prompt_batches, history)
+            except UploadError as exc:
+                await self.throw_error(str(exc))
+                raise
+
         # Extract imported code flag
         is_imported_from_code = params.get("isImportedFromCode", False)
 
@@ -409,6 +856,54 @@ class ParameterExtractionStage:
             is_imported_from_code=is_imported_from_code,
         )
 
+    async def _resolve_blobs(
+        self,
+        prompt: PromptContent,
+        prompt_batches: List["PromptBatch"],
+        history: List[Dict[str, Any]],
+    ) -> None:
+        image_lists = [prompt.get("images", [])] + [
+            batch.prompt.get("images", []) for batch in prompt_batches
+        ]
+        history_items = [item for item in history if isinstance(item, dict)]
+        for item in history_items:
+            if isinstance(item.get("images"), list):
+                image_lists.append(item["images"])
+        values = [value for images in image_lists for value in images] + [
+            item.get("text") for item in history_items
+        ]
+
+        missing = blob_store.missing(collect_blob_refs(values))
+        if missing and self.request_blobs is not None:
+            supplied = [
+                content
+                for digest, content in (await self.request_blobs(missing)).items()
+                if isinstance(content, str) and blob_digest(content) == digest
+            ]
+            await asyncio.to_thread(_store_blobs, supplied)
+            missing = blob_store.missing(missing)
+        if missing:
+            raise BlobMissingError(missing)
+
+        # The store reads and spills blobs on disk, so this runs in a thread
+        await asyncio.to_thread(_store_and_resolve_blobs, values, image_lists, history_items)
+
+    async def _resolve_uploads(
+        self,
+        prompt: PromptContent,
+        prompt_batches: List["PromptBatch"],
+        history: List[Dict[str, Any]],
+    ) -> None:
+        async def resolve(images: List[str]) -> List[str]:
+            return [await resolve_image_url(image) for image in images]
+
+        prompt["images"] = await resolve(prompt.get("images", []))
+        for batch in prompt_batches:
+            batch.prompt["images"] = await resolve(batch.prompt.get("images", []))
+        for item in history:
+            if isinstance(item, dict) and isinstance(item.get("images"), list):
+                item["images"] = await resolve(item["images"])
+
     def _get_from_settings_dialog_or_env(
         self, params: dict[str, str], key: str, env_var: str | None
     ) -> str | None:
@@ -496,13 +991,14 @@ class ModelSelectionStage:
         anthropic_api_key: str | None,
         include_engineering_variant: bool,
         gemini_api_key: str | None = None,
+        num_variants: int = NUM_VARIANTS,
     ) -> List[Llm]:
         """Select appropriate models based on available API keys"""
         try:
             variant_models = self._get_variant_models(
                 generation_type,
                 input_mode,
-                NUM_VARIANTS,
+                num_variants,
                 openai_api_key,
                 anthropic_api_key,
                 include_engineering_variant,
@@ -533,7 +1029,7 @@ class ModelSelectionStage:
         include_engineering_variant: bool,
         gemini_api_key: str | None,
     ) -> List[Llm]:
-        """Simple model cycling that scales with num_variants"""
+        """Cycle the healthy models for the available API keys over num_variants"""
 
         llm_variant_count = num_variants
         if include_engineering_variant and num_variants > 0:
@@ -559,10 +1055,9 @@ class ModelSelectionStage:
         else:
             raise Exception("No OpenAI or Anthropic key")
 
-        # Cycle through models: [A, B] with num=5 becomes [A, B, A, B, A]
-        selected_variants: List[Llm] = []
-        for i in range(llm_variant_count):
-            selected_variants.append(models[i % len(models)])
+        # Skip degraded models and cycle through the rest:
+        # [A, B] with num=5 becomes [A, B, A, B, A]
+        selected_variants = model_router.plan(models, llm_variant_count)
 
         if include_engineering_variant:
             selected_variants.append(Llm.ENGINEERING)
@@ -675,16 +1170,22 @@ class VideoGenerationStage:
         async def process_chunk(content: str, variantIndex: int):
             await self.send_message("chunk", content, variantIndex, page_index)
 
-        completion_results = [
-            await stream_claude_response_native(
-                system_prompt=VIDEO_PROMPT,
-                messages=prompt_messages,  # type: ignore
-                api_key=anthropic_api_key,
-                callback=lambda x: process_chunk(x, 0),
-                model_name=Llm.CLAUDE_3_OPUS.value,
-                include_thinking=True,
-            )
-        ]
+        listener_token = queue_listener.set(
+            queue_status_sender(self.send_message, 0, page_index)
+        )
+        try:
+            completion_results = [
+                await stream_claude_response_native(
+                    system_prompt=VIDEO_PROMPT,
+                    messages=prompt_messages,  # type: ignore
+                    api_key=anthropic_api_key,
+                    callback=lambda x: process_chunk(x, 0),
+                    model_name=Llm.CLAUDE_3_OPUS.value,
+                    include_thinking=True,
+                )
+            ]
+        finally:
+            queue_listener.reset(listener_token)
         completions = [result["code"] for result in completion_results]
 
         # Send the complete variant back to the client
@@ -723,12 +1224,67 @@ class PostProcessingStage:
             if valid_completions:
                 # Strip the completion of everything except the HTML content
                 html_content = extract_html_content(valid_completions[0])
-                write_logs(batch.prompt_messages, html_content)
+                # Serializing prompts with inline images is slow; keep it off the loop
+                await asyncio.to_thread(write_logs, batch.prompt_messages, html_content)
                 break
 
         # Note: WebSocket closing is handled by the caller
 
 
+class HedgeRace:
+    """Lets only the first of several requests that streams a token feed a variant"""
+
+    def __init__(self, forward: Callable[[str], Awaitable[None]]):
+        self.forward = forward
+        self.winner: int | None = None
+        self.decided = asyncio.Event()
+
+    def callback(self, attempt: int) -> Callable[[str], Awaitable[None]]:
+        async def on_chunk(content: str) -> None:
+            if self.winner is None:
+                self.winner = attempt
+                self.decided.set()
+            if self.winner == attempt:
+                await self.forward(content)
+
+        return on_chunk
+
+    async def finish(self, attempts: List["asyncio.Task[Completion]"]) -> Completion:
+        """Result of the winning attempt, cancelling the others
+
+        An attempt that finishes without streaming (e.g. a non-streaming model)
+        also wins. If every attempt fails, the first one's error is raised.
+        """
+        pending = set(attempts)
+        while True:
+            decided = asyncio.create_task(self.decided.wait())
+            done, _ = await asyncio.wait(
+                pending | {decided}, return_when=asyncio.FIRST_COMPLETED
+            )
+            decided.cancel()
+            if self.winner is not None:
+                winner = attempts[self.winner]
+            else:
+                finished = [
+                    attempt
+                    for attempt in attempts
+                    if attempt in done and attempt.exception() is None
+                ]
+                pending -= done
+                if finished:
+                    winner = finished[0]
+                    self.winner = attempts.index(winner)
+                elif not pending:
+                    return attempts[0].result()
+                else:
+                    continue
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+            return await winner
+
+
 class ParallelGenerationStage:
     """Handles parallel variant generation with independent processing for each variant"""
 
@@ -741,6 +1297,8 @@ class ParallelGenerationStage:
         should_generate_images: bool,
         vlm_temperature: float,
         page_index: int = 0,
+        hedge_first_variant: bool = HEDGE_FIRST_VARIANT,
+        cache: ResponseCache | None = response_cache if RESPONSE_CACHE_ENABLED else None,
     ):
         self.send_message = send_message
         self.openai_api_key = openai_api_key
@@ -749,9 +1307,18 @@ class ParallelGenerationStage:
         self.should_generate_images = should_generate_images
         self.vlm_temperature = vlm_temperature
         self.page_index = page_index
+        self.hedge_first_variant = hedge_first_variant
+        self.cache = cache
+        self._cache_hits: set[int] = set()
         self._block_update_processors: dict[int, BlockUpdateStreamProcessor] = {}
         self._block_update_enabled = False
         self._block_update_base_html = ""
+        self._streamed_chars: Dict[int, int] = {}
+        self._variant_started: Dict[int, float] = {}
+        self._first_token_at: Dict[int, float] = {}
+        self._hedge_winners: Dict[int, Llm] = {}
+        self._queue_waits: Dict[int, float] = {}
+        self._placeholder_restorers: Dict[int, StreamingPlaceholderRestorer] = {}
 
     async def process_variants(
         self,
@@ -775,6 +1342,16 @@ class ParallelGenerationStage:
                 else ""
             )
 
+        # Restore image placeholders in streamed chunks so the client can render
+        # images while the variant is still generating
+        self._placeholder_restorers = {}
+        if base64_mapping:
+            for index, model in enumerate(variant_models):
+                if model != Llm.ENGINEERING:
+                    self._placeholder_restorers[index] = StreamingPlaceholderRestorer(
+                        base64_mapping
+                    )
+
         tasks = self._create_generation_tasks(
             variant_models, prompt_messages, params, extracted_params
         )
@@ -785,7 +1362,9 @@ class ParallelGenerationStage:
 
         # Create tasks for each variant
         for index, task in enumerate(tasks):
-            variant_task = asyncio.create_task(task)
+            variant_task = asyncio.create_task(
+                self._run_variant(index, variant_models[index], task)
+            )
             variant_tasks[index] = variant_task
 
         # Process each variant independently
@@ -802,10 +1381,118 @@ class ParallelGenerationStage:
         ]
 
         # Wait for all variants to complete
-        await asyncio.gather(*variant_processors, return_exceptions=True)
+        try:
+            await asyncio.gather(*variant_processors, return_exceptions=True)
+        except asyncio.CancelledError:
+            self._cancel_variant_tasks(variant_tasks, variant_models)
+            raise
 
         return variant_completions
 
+    async def _run_variant(
+        self, index: int, model: Llm, generation: Coroutine[Any, Any, Completion]
+    ) -> Completion:
+        """Run a variant's generation in its own task and record how the provider did"""
+        send_status = queue_status_sender(self.send_message, index, self.page_index)
+
+        async def on_queue_status(status: QueueStatus) -> None:
+            if status.started:
+                # Provider latency is measured from admission, not from queueing
+                self._variant_started[index] = time.monotonic()
+                self._queue_waits[index] = status.waited
+            await send_status(status)
+
+        # The listener only applies to this variant's task
+        queue_listener.set(on_queue_status)
+        self._variant_started[index] = time.monotonic()
+        started = time.perf_counter()
+        try:
+            completion = await generation
+        except Exception as e:
+            self._trace_variant(index, model, started, error=True)
+            self._record_outcome(index, model, e)
+            raise
+        self._trace_variant(index, model, started, error=False)
+        self._record_outcome(index, model)
+        return completion
+
+    def _trace_variant(
+        self, index: int, model: Llm, started: float, error: bool
+    ) -> None:
+        trace = current_trace.get()
+        if trace is None:
+            return
+        first_token_at = self._first_token_at.get(index)
+        ttft = (
+            first_token_at - self._variant_started[index] if first_token_at else None
+        )
+        if index in self._cache_hits:
+            model_name = "cache"
+        else:
+            model_name = self._hedge_winners.get(index, model).value
+        trace.variant(
+            index,
+            model_name,
+            started,
+            time.perf_counter() - started,
+            self._queue_waits.get(index, 0.0),
+            ttft,
+            self._streamed_chars.get(index, 0) / CHARS_PER_TOKEN,
+            error,
+        )
+
+    def _record_outcome(
+        self, index: int, model: Llm, error: Exception | None = None
+    ) -> None:
+        if model == Llm.ENGINEERING or index in self._cache_hits:
+            return
+        # Timings of a hedged variant belong to the request that won the race
+        model = self._hedge_winners.get(index, model)
+        if isinstance(error, VariantErrorAlreadySent):
+            error = error.original_error
+        kind = classify_error(error) if error is not None else None
+        if kind == "client":
+            return
+
+        started = self._variant_started[index]
+        first_token_at = self._first_token_at.get(index)
+        model_router.record(
+            RequestOutcome(
+                model=model.value,
+                timestamp=time.time(),
+                ttft=first_token_at - started if first_token_at else None,
+                duration=time.monotonic() - started,
+                output_tokens=self._streamed_chars.get(index, 0) / CHARS_PER_TOKEN,
+                error=error is not None,
+                rate_limited=kind == "rate_limited",
+            )
+        )
+
+    def _cancel_variant_tasks(
+        self,
+        variant_tasks: Dict[int, asyncio.Task[Completion]],
+        variant_models: List[Llm],
+    ) -> None:
+        """Cancel unfinished variant streams and record the output tokens saved"""
+        for processor in self._block_update_processors.values():
+            processor.cancel()
+
+        for index, task in variant_tasks.items():
+            # Cancelling the gather may already have cancelled the task itself
+            if task.done() and not task.cancelled():
+                continue
+            task.cancel()
+            cancelled_variants.inc()
+            if variant_models[index] == Llm.ENGINEERING:
+                continue
+            produced_tokens = self._streamed_chars.get(index, 0) / CHARS_PER_TOKEN
+            saved_tokens = completion_sizes.estimate_remaining(produced_tokens)
+            output_tokens_saved.inc(saved_tokens)
+            print(
+                f"[VARIANT {index + 1}] Cancelled after ~{int(produced_tokens)} output tokens "
+                f"(~{saved_tokens} saved)"
+            )
+
     def _create_generation_tasks(
         self,
         variant_models: List[Llm],
@@ -821,67 +1508,289 @@ class ParallelGenerationStage:
                 tasks.append(
                     self._generate_engineering_completion(extracted_params, index)
                 )
-            elif model in OPENAI_MODELS:
+            elif self._block_update_enabled and model in OPENAI_MODELS:
                 if self.openai_api_key is None:
                     raise Exception("OpenAI API key is missing.")
 
-                model_name = model.value
-                if extracted_params.generation_type == "update":
-                    model_name = extracted_params.engineering_openai_model
-
-                block_processor = None
-                if self._block_update_enabled:
-                    block_processor = BlockUpdateStreamProcessor(
-                        self._block_update_base_html,
-                        lambda delta, i=index: self.send_message(
-                            "chunk", delta, i, self.page_index
-                        ),
-                    )
-                    self._block_update_processors[index] = block_processor
+                block_processor = BlockUpdateStreamProcessor(
+                    self._block_update_base_html,
+                    lambda delta, i=index: self._send_chunk(delta, i),
+                )
+                self._block_update_processors[index] = block_processor
                 tasks.append(
                     self._stream_openai_with_error_handling(
                         prompt_messages,
-                        model_name=model_name,
+                        model_name=extracted_params.engineering_openai_model,
                         index=index,
                         block_processor=block_processor,
                     )
                 )
-            elif GEMINI_API_KEY and model in GEMINI_MODELS:
-                tasks.append(
-                    stream_gemini_response(
+            else:
+                if index == 0 and self.hedge_first_variant:
+                    stream = self._hedged_generation(
+                        index, model, variant_models, prompt_messages, extracted_params
+                    )
+                else:
+                    stream = self._stream_model(
+                        model,
                         prompt_messages,
-                        api_key=GEMINI_API_KEY,
-                        callback=lambda x, i=index: self._process_chunk(x, i),
-                        model_name=model.value,
-                        temperature=self.vlm_temperature,
+                        extracted_params,
+                        index,
+                        lambda x, i=index: self._process_chunk(x, i),
                     )
-                )
-            elif model in ANTHROPIC_MODELS:
-                if self.anthropic_api_key is None:
-                    raise Exception("Anthropic API key is missing.")
+                if stream is None:
+                    continue
+                if self.cache is not None:
+                    stream = self._cached_generation(
+                        index, model, prompt_messages, extracted_params, stream
+                    )
+                tasks.append(stream)
 
-                tasks.append(
-                    stream_claude_response(
-                        prompt_messages,
-                        api_key=self.anthropic_api_key,
-                        callback=lambda x, i=index: self._process_chunk(x, i),
-                        model_name=model.value,
-                        temperature=self.vlm_temperature,
+        return tasks
+
+    async def _cached_generation(
+        self,
+        index: int,
+        model: Llm,
+        prompt_messages: List[ChatCompletionMessageParam],
+        extracted_params: ExtractedParams,
+        generation: Coroutine[Any, Any, Completion],
+    ) -> Completion:
+        """Replay this variant's completion from the cache, or generate and store it
+
+        A hedged variant's output is stored under the model that won the race.
+        """
+        assert self.cache is not None
+        key = self._completion_cache_key(index, model, prompt_messages, extracted_params)
+
+        code = await asyncio.to_thread(self.cache.get, key)
+        if code is None:
+            completion = await generation
+            if completion.get("code"):
+                winner = self._hedge_winners.get(index, model)
+                if winner != model:
+                    key = self._completion_cache_key(
+                        index, winner, prompt_messages, extracted_params
                     )
+                await asyncio.to_thread(self.cache.put, key, completion["code"])
+            return completion
+
+        generation.close()
+        self._cache_hits.add(index)
+        print(f"[VARIANT {index + 1}] Replaying cached completion")
+        started = time.monotonic()
+        await replay_completion(code, lambda x: self._process_chunk(x, index))
+        return {"duration": time.monotonic() - started, "code": code}
+
+    def _completion_cache_key(
+        self,
+        index: int,
+        model: Llm,
+        prompt_messages: List[ChatCompletionMessageParam],
+        extracted_params: ExtractedParams,
+    ) -> str:
+        model_name = model.value
+        base_url = None
+        if model in OPENAI_MODELS:
+            base_url = self.openai_base_url
+            if extracted_params.generation_type == "update":
+                model_name = extracted_params.engineering_openai_model
+        return cache_key(
+            model_name,
+            extracted_params.stack,
+            self.vlm_temperature,
+            cast(List[Any], prompt_messages),
+            index,
+            base_url,
+        )
+
+    def _stream_model(
+        self,
+        model: Llm,
+        prompt_messages: List[ChatCompletionMessageParam],
+        extracted_params: ExtractedParams,
+        index: int,
+        callback: Callable[[str], Awaitable[None]],
+        report_errors: bool = True,
+    ) -> Coroutine[Any, Any, Completion] | None:
+        """Streaming request to a model's provider; None if the provider isn't configured
+
+        With `report_errors` off, provider errors are raised without sending
+        the client a variantError.
+        """
+        if model in OPENAI_MODELS:
+            if self.openai_api_key is None:
+                raise Exception("OpenAI API key is missing.")
+
+            model_name = model.value
+            if extracted_params.generation_type == "update":
+                model_name = extracted_params.engineering_openai_model
+            return self._stream_openai_with_error_handling(
+                prompt_messages,
+                model_name=model_name,
+                index=index,
+                callback=callback,
+                report_errors=report_errors,
+            )
+        if GEMINI_API_KEY and model in GEMINI_MODELS:
+            gemini_api_key = GEMINI_API_KEY
+            return stream_with_resume(
+                lambda messages, on_chunk: stream_gemini_response(
+                    messages,
+                    api_key=gemini_api_key,
+                    callback=on_chunk,
+                    model_name=model.value,
+                    temperature=self.vlm_temperature,
+                ),
+                prompt_messages,
+                callback,
+                prefill=False,
+            )
+        if model in ANTHROPIC_MODELS:
+            if self.anthropic_api_key is None:
+                raise Exception("Anthropic API key is missing.")
+
+            anthropic_api_key = self.anthropic_api_key
+            return stream_with_resume(
+                lambda messages, on_chunk: stream_claude_response(
+                    messages,
+                    api_key=anthropic_api_key,
+                    callback=on_chunk,
+                    model_name=model.value,
+                    temperature=self.vlm_temperature,
+                ),
+                prompt_messages,
+                callback,
+                prefill=model.value not in THINKING_MODELS,
+            )
+        return None
+
+    async def _hedged_generation(
+        self,
+        index: int,
+        model: Llm,
+        variant_models: List[Llm],
+        prompt_messages: List[ChatCompletionMessageParam],
+        extracted_params: ExtractedParams,
+    ) -> Completion:
+        """Stream a variant, racing a duplicate request if its first token is late
+
+        The duplicate goes out once the request has produced nothing for the
+        HEDGE_TTFT_PERCENTILE of the model's recent TTFTs. Whichever request
+        streams first feeds the variant and the other one is cancelled. Only
+        the race's outcome is reported to the client, not a failed attempt.
+        """
+        race = HedgeRace(lambda x: self._process_chunk(x, index))
+
+        def start(attempt_model: Llm, attempt: int) -> "asyncio.Task[Completion]":
+            stream = self._stream_model(
+                attempt_model,
+                prompt_messages,
+                extracted_params,
+                index,
+                race.callback(attempt),
+                report_errors=False,
+            )
+            if stream is None:
+                raise Exception(f"No API key for {attempt_model.value}.")
+            return asyncio.create_task(stream)
+
+        hedged_variants.inc()
+        delay = self._hedge_delay(model)
+        hedge_model = model
+        attempts = [start(model, 0)]
+        try:
+            if delay is not None:
+                decided = asyncio.create_task(race.decided.wait())
+                await asyncio.wait(
+                    {attempts[0], decided},
+                    timeout=delay,
+                    return_when=asyncio.FIRST_COMPLETED,
                 )
+                decided.cancel()
+                hedge_model = self._hedge_model(model, variant_models)
+                if (
+                    not attempts[0].done()
+                    and race.winner is None
+                    and not provider_scheduler.stats(MODEL_PROVIDER[hedge_model])[
+                        "queued"
+                    ]
+                ):
+                    print(
+                        f"[VARIANT {index + 1}] No token from {model.value} after "
+                        f"{delay:.1f}s, hedging with {hedge_model.value}"
+                    )
+                    hedges_launched.inc(model=model.value)
+                    attempts.append(start(hedge_model, 1))
 
-        return tasks
+            try:
+                completion = await race.finish(attempts)
+            except OPENAI_REPORTED_ERRORS as e:
+                await self._report_openai_error(e, index)
+            if race.winner == 1:
+                hedge_wins.inc(model=model.value)
+                self._hedge_winners[index] = hedge_model
+            return completion
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    # Mark a losing attempt's error as retrieved
+                    attempt.exception()
+
+    def _hedge_delay(self, model: Llm) -> float | None:
+        ttfts = model_router.telemetry.ttfts(model.value)
+        if len(ttfts) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(ttfts, HEDGE_TTFT_PERCENTILE)
+
+    def _hedge_model(self, model: Llm, variant_models: List[Llm]) -> Llm:
+        if HEDGE_MODEL == "fallback":
+            for candidate in variant_models:
+                provider = MODEL_PROVIDER[candidate]
+                if (
+                    provider not in ("engineering", MODEL_PROVIDER[model])
+                    and model_router.breaker.allows(provider)
+                ):
+                    return candidate
+        return model
+
+    def _record_output(self, content: str, variant_index: int) -> None:
+        self._first_token_at.setdefault(variant_index, time.monotonic())
+        self._streamed_chars[variant_index] = (
+            self._streamed_chars.get(variant_index, 0) + len(content)
+        )
 
     async def _process_chunk(self, content: str, variant_index: int):
         """Process streaming chunks"""
-        await self.send_message("chunk", content, variant_index, self.page_index)
+        self._record_output(content, variant_index)
+        await self._send_chunk(content, variant_index)
+
+    async def _send_chunk(self, content: str, variant_index: int) -> None:
+        restorer = self._placeholder_restorers.get(variant_index)
+        if restorer is not None:
+            content = restorer.feed(content)
+        if content:
+            await self.send_message("chunk", content, variant_index, self.page_index)
+
+    async def _flush_chunks(self, variant_index: int) -> None:
+        """Send any text the placeholder restorer was still holding back"""
+        restorer = self._placeholder_restorers.pop(variant_index, None)
+        if restorer is None:
+            return
+        content = restorer.flush()
+        if content:
+            await self.send_message("chunk", content, variant_index, self.page_index)
 
     async def _process_block_update_chunk(
         self,
         content: str,
         processor: BlockUpdateStreamProcessor,
+        variant_index: int,
     ) -> None:
         print(content, end="", flush=True)
+        self._record_output(content, variant_index)
         await processor.process_chunk(content)
 
     async def _stream_openai_with_error_handling(
@@ -890,31 +1799,46 @@ class ParallelGenerationStage:
         model_name: str,
         index: int,
         block_processor: BlockUpdateStreamProcessor | None = None,
+        callback: Callable[[str], Awaitable[None]] | None = None,
+        report_errors: bool = True,
     ) -> Completion:
         """Wrap OpenAI streaming with specific error handling"""
         try:
             assert self.openai_api_key is not None
             if block_processor:
                 callback = lambda x: self._process_block_update_chunk(
-                    x, block_processor
+                    x, block_processor, index
                 )
-            else:
+            elif callback is None:
                 callback = lambda x: self._process_chunk(x, index)
-            completion = await stream_openai_response(
+            api_key = self.openai_api_key
+            completion = await stream_with_resume(
+                lambda messages, on_chunk: stream_openai_response(
+                    messages,
+                    api_key=api_key,
+                    base_url=self.openai_base_url,
+                    callback=on_chunk,
+                    model_name=model_name,
+                    temperature=self.vlm_temperature,
+                ),
                 prompt_messages,
-                api_key=self.openai_api_key,
-                base_url=self.openai_base_url,
-                callback=callback,
-                model_name=model_name,
-                temperature=self.vlm_temperature,
+                callback,
+                prefill=False,
             )
             if block_processor:
                 if block_processor.applied_ops == 0 and completion.get("code"):
                     await block_processor.process_full_response(completion["code"])
                 completion["code"] = block_processor.current_html
             return completion
-        except openai.AuthenticationError as e:
-            print(f"[VARIANT {index + 1}] OpenAI Authentication failed", e)
+        except OPENAI_REPORTED_ERRORS as e:
+            if not report_errors:
+                raise
+            await self._report_openai_error(e, index)
+
+    async def _report_openai_error(self, error: Exception, index: int) -> NoReturn:
+        """Send the variantError for an OpenAI error and raise it as already sent"""
+        if isinstance(error, openai.AuthenticationError):
+            print(f"[VARIANT {index + 1}] OpenAI Authentication failed", error)
             error_message = (
                 "Incorrect OpenAI key. Please make sure your OpenAI API key is correct, "
                 "or create a new OpenAI API key on your OpenAI dashboard."
@@ -924,14 +1848,10 @@ class ParallelGenerationStage:
                     else ""
                 )
             )
-            await self.send_message(
-                "variantError", error_message, index, self.page_index
-            )
-            raise VariantErrorAlreadySent(e)
-        except openai.NotFoundError as e:
-            print(f"[VARIANT {index + 1}] OpenAI Model not found", e)
+        elif isinstance(error, openai.NotFoundError):
+            print(f"[VARIANT {index + 1}] OpenAI Model not found", error)
             error_message = (
-                e.message
+                error.message
                 + ". Please make sure you have followed the instructions correctly to obtain "
                 "an OpenAI key with GPT vision access: "
                 "https://github.com/abi/screenshot-to-code/blob/main/Troubleshooting.md"
@@ -941,12 +1861,8 @@ class ParallelGenerationStage:
                     else ""
                 )
             )
-            await self.send_message(
-                "variantError", error_message, index, self.page_index
-            )
-            raise VariantErrorAlreadySent(e)
-        except openai.RateLimitError as e:
-            print(f"[VARIANT {index + 1}] OpenAI Rate limit exceeded", e)
+        else:
+            print(f"[VARIANT {index + 1}] OpenAI Rate limit exceeded", error)
             error_message = (
                 "OpenAI error - 'You exceeded your current quota, please check your plan and billing details.'"
                 + (
@@ -955,10 +1871,8 @@ class ParallelGenerationStage:
                     else ""
                 )
             )
-            await self.send_message(
-                "variantError", error_message, index, self.page_index
-            )
-            raise VariantErrorAlreadySent(e)
+        await self.send_message("variantError", error_message, index, self.page_index)
+        raise VariantErrorAlreadySent(error)
 
     async def _perform_image_generation(
         self,
@@ -984,13 +1898,14 @@ class ParallelGenerationStage:
 
         print("Generating images with model: ", image_generation_model)
 
-        return await generate_images(
-            completion,
-            api_key=api_key,
-            base_url=self.openai_base_url,
-            image_cache=image_cache,
-            model=image_generation_model,
-        )
+        with span("image_generation", model=image_generation_model):
+            return await generate_images(
+                completion,
+                api_key=api_key,
+                base_url=self.openai_base_url,
+                image_cache=image_cache,
+                model=image_generation_model,
+            )
 
     async def _generate_engineering_completion(
         self,
@@ -1020,6 +1935,8 @@ class ParallelGenerationStage:
             return {"duration": duration, "code": html_output, "arkui": arkui_output}
 
         scrubbed_html, mapping = replace_base64_data_urls(html_output)
+        if mapping:
+            self._placeholder_restorers[index] = StreamingPlaceholderRestorer(mapping)
         prompt_messages = assemble_engineering_refinement_prompt(
             stack=extracted_params.stack,
             input_mode=extracted_params.input_mode,
@@ -1035,14 +1952,14 @@ class ParallelGenerationStage:
             if extracted_params.is_block_update_enabled:
                 block_processor = BlockUpdateStreamProcessor(
                     html_output,
-                    lambda delta, i=index: self.send_message(
-                        "chunk", delta, i, self.page_index
-                    ),
+                    lambda delta, i=index: self._send_chunk(delta, i),
                 )
+                self._block_update_processors[index] = block_processor
 
                 async def process_block_update_chunk(content: str) -> None:
-                    print(content, end="", flush=True)
-                    await block_processor.process_chunk(content)
+                    await self._process_block_update_chunk(
+                        content, block_processor, index
+                    )
             completion = await stream_openai_response(
                 prompt_messages,
                 api_key=extracted_params.engineering_openai_api_key,
@@ -1115,6 +2032,7 @@ class ParallelGenerationStage:
         """Process a single variant completion including image generation"""
         try:
             completion = await task
+            await self._flush_chunks(index)
 
             if base64_mapping:
                 completion["code"] = restore_base64_placeholders(
@@ -1122,6 +2040,8 @@ class ParallelGenerationStage:
                 )
 
             print(f"{model.value} completion took {completion['duration']:.2f} seconds")
+            if model != Llm.ENGINEERING and self._streamed_chars.get(index):
+                completion_sizes.observe(self._streamed_chars[index] / CHARS_PER_TOKEN)
             variant_completions[index] = completion["code"]
 
             try:
@@ -1136,6 +2056,8 @@ class ParallelGenerationStage:
 
                 # Extract HTML content
                 processed_html = extract_html_content(processed_html)
+                # The client sends this back as history on the next update
+                await asyncio.to_thread(blob_store.put, processed_html)
 
                 arkui_output = completion.get("arkui")
                 if arkui_output is not None:
@@ -1180,6 +2102,9 @@ class WebSocketSetupMiddleware(Middleware):
     async def process(
         self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
     ) -> None:
+        # Provider requests are queued fairly per connection
+        current_client.set(uuid.uuid4().hex)
+
         # Create and setup WebSocket communicator
         context.ws_comm = WebSocketCommunicator(context.websocket)
         await context.ws_comm.accept()
@@ -1191,18 +2116,92 @@ class WebSocketSetupMiddleware(Middleware):
             await context.ws_comm.close()
 
 
+class SessionMiddleware(Middleware):
+    """Receives the request and makes it resumable, or resumes an earlier one
+
+    A request with "resumable": true gets a session id back. A client that
+    loses its connection can reconnect and send {"type": "resume", "sessionId",
+    "lastSeq"} as its first message to pick up the running generation from the
+    first frame it hasn't seen.
+    """
+
+    async def process(
+        self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
+    ) -> None:
+        assert context.ws_comm is not None
+        context.params = await context.ws_comm.receive_params()
+
+        if context.params.get("type") == "resume":
+            await self._resume(context.ws_comm, context.params)
+            return
+
+        if not context.params.get("resumable"):
+            await next_func()
+            return
+
+        # The communicator finishes the session once its last frames are out
+        await context.ws_comm.start_session(session_store.create())
+        await next_func()
+
+    async def _resume(
+        self, ws_comm: WebSocketCommunicator, params: Dict[str, Any]
+    ) -> None:
+        session = session_store.get(str(params.get("sessionId", "")))
+        if session is None or session.communicator is None:
+            resume_failures.inc(reason="unknown_session")
+            await ws_comm.throw_error(
+                "This generation can no longer be resumed. Please try again."
+            )
+            return
+
+        try:
+            last_seq = int(params.get("lastSeq", 0))
+            if session.finished.is_set():
+                frames = session.frames_after(last_seq)
+                for frame in frames:
+                    await ws_comm.websocket.send_text(frame)
+                replayed = len(frames)
+            else:
+                replayed = await session.communicator.reattach(
+                    ws_comm.websocket, last_seq
+                )
+                # The session's communicator owns the socket from here on
+                ws_comm.is_closed = True
+        except (ResumeError, ValueError) as e:
+            print(f"[SESSION] Could not resume {session.id}: {e}")
+            resume_failures.inc(reason="evicted")
+            await ws_comm.throw_error(
+                "This generation can no longer be resumed. Please try again."
+            )
+            return
+
+        sessions_resumed.inc()
+        regenerations_avoided.inc()
+        frames_replayed.inc(replayed)
+        print(
+            f"[SESSION] Resumed {session.id} after frame {last_seq}, "
+            f"replayed {replayed} frames"
+        )
+        if ws_comm.is_closed:
+            # Keep this connection open until the generation is done with it
+            await session.closed.wait()
+
+
 class ParameterExtractionMiddleware(Middleware):
     """Handles parameter extraction and validation"""
 
     async def process(
         self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
     ) -> None:
-        # Receive parameters
+        # Receive parameters, unless the session middleware already has
         assert context.ws_comm is not None
-        context.params = await context.ws_comm.receive_params()
+        if not context.params:
+            context.params = await context.ws_comm.receive_params()
 
         # Extract and validate
-        param_extractor = ParameterExtractionStage(context.throw_error)
+        param_extractor = ParameterExtractionStage(
+            context.throw_error, context.ws_comm.request_blobs
+        )
         context.extracted_params = await param_extractor.extract_and_validate(
             context.params
         )
@@ -1215,6 +2214,69 @@ class ParameterExtractionMiddleware(Middleware):
         await next_func()
 
 
+class DisconnectMonitorMiddleware(Middleware):
+    """Cancels the rest of the pipeline if the client disconnects mid-generation"""
+
+    async def process(
+        self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
+    ) -> None:
+        assert context.ws_comm is not None
+        ws_comm = context.ws_comm
+
+        pipeline_task = asyncio.create_task(next_func())
+        disconnect_task = asyncio.create_task(ws_comm.wait_for_disconnect())
+        try:
+            while True:
+                await asyncio.wait(
+                    {pipeline_task, disconnect_task},
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if pipeline_task.done() or not ws_comm.client_disconnected:
+                    break
+                if ws_comm.session is None or not await self._wait_for_resume(
+                    ws_comm.session, pipeline_task
+                ):
+                    break
+                if pipeline_task.done():
+                    break
+                # Watch the resumed connection instead
+                disconnect_task = asyncio.create_task(ws_comm.wait_for_disconnect())
+
+            if not pipeline_task.done() and ws_comm.client_disconnected:
+                print("[GENERATE_CODE] Client disconnected, cancelling generation")
+                client_disconnects.inc()
+                pipeline_task.cancel()
+                try:
+                    await pipeline_task
+                except asyncio.CancelledError:
+                    pass
+                return
+
+            await pipeline_task
+        finally:
+            disconnect_task.cancel()
+            if not pipeline_task.done():
+                pipeline_task.cancel()
+
+    async def _wait_for_resume(
+        self, session: GenerationSession, pipeline_task: "asyncio.Task[None]"
+    ) -> bool:
+        """Keep generating while the client is away; False if it doesn't come back"""
+        print("[GENERATE_CODE] Client disconnected, waiting for it to resume")
+        reattach_task = asyncio.create_task(session.wait_for_reattach())
+        try:
+            await asyncio.wait(
+                {pipeline_task, reattach_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            reattach_task.cancel()
+        return pipeline_task.done() or (
+            reattach_task.done()
+            and not reattach_task.cancelled()
+            and reattach_task.result()
+        )
+
+
 class StatusBroadcastMiddleware(Middleware):
     """Sends initial status messages to all variants"""
 
@@ -1229,8 +2291,10 @@ class StatusBroadcastMiddleware(Middleware):
 
         # Tell frontend how many variants we're using
         for page_index in page_indices:
-            await context.send_message("variantCount", str(NUM_VARIANTS), 0, page_index)
-            for i in range(NUM_VARIANTS):
+            await context.send_message(
+                "variantCount", str(context.variant_count), 0, page_index
+            )
+            for i in range(context.variant_count):
                 await context.send_message(
                     "status",
                     "Generating code...",
@@ -1241,6 +2305,26 @@ class StatusBroadcastMiddleware(Middleware):
         await next_func()
 
 
+class AdmissionMiddleware(Middleware):
+    """Picks the number of variants from current load and holds them as in flight"""
+
+    async def process(
+        self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
+    ) -> None:
+        assert context.extracted_params is not None
+        pages = max(len(context.prompt_batches), 1)
+        context.variant_count = admission_controller.choose_variant_count(pages)
+
+        # Video mode only ever generates the first variant
+        variants = (
+            1
+            if context.extracted_params.input_mode == "video"
+            else context.variant_count * pages
+        )
+        with admission_controller.admit(variants):
+            await next_func()
+
+
 class PromptCreationMiddleware(Middleware):
     """Handles prompt creation"""
 
@@ -1260,6 +2344,60 @@ class PromptCreationMiddleware(Middleware):
         await next_func()
 
 
+class WarmStartMiddleware(Middleware):
+    """Offers the HTML generated for a near-identical earlier screenshot
+
+    The client gets a warmStart message it can turn into an update request,
+    which is cheaper than creating the page from scratch. Once this request
+    is done, its screenshot and first completion are indexed in turn.
+    """
+
+    async def process(
+        self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
+    ) -> None:
+        params = context.extracted_params
+        assert params is not None
+        images = params.prompt["images"]
+        if not (
+            SCREENSHOT_INDEX_ENABLED
+            and params.generation_type == "create"
+            and params.input_mode == "image"
+            and images
+            and images[0].startswith("data:image")
+        ):
+            await next_func()
+            return
+
+        try:
+            screenshot = await run_image_task(screenshot_hash, images[0])
+        except Exception as e:
+            print(f"[WARM_START] Could not hash screenshot: {e}")
+            await next_func()
+            return
+
+        match = await asyncio.to_thread(screenshot_index.nearest, screenshot, params.stack)
+        if match is not None:
+            print(f"[WARM_START] Earlier screenshot {match.distance} bits away")
+            await context.send_message(
+                "warmStart", {"html": match.html, "distance": match.distance}, 0
+            )
+
+        await next_func()
+
+        completions = [
+            completion
+            for completion in context.batch_completions.get(0, [])
+            if completion
+        ]
+        if completions:
+            await asyncio.to_thread(
+                screenshot_index.add,
+                screenshot,
+                params.stack,
+                extract_html_content(completions[0]),
+            )
+
+
 class CodeGenerationMiddleware(Middleware):
     """Handles the main code generation logic"""
 
@@ -1316,6 +2454,7 @@ class CodeGenerationMiddleware(Middleware):
                         anthropic_api_key=context.extracted_params.anthropic_api_key,
                         include_engineering_variant=context.extracted_params.is_engineering_variant_enabled,
                         gemini_api_key=GEMINI_API_KEY,
+                        num_variants=context.variant_count,
                     )
 
                     async def generate_for_batch(
@@ -1354,7 +2493,7 @@ class CodeGenerationMiddleware(Middleware):
 
                     context.batch_completions = {}
                     for result in generation_results:
-                        if isinstance(result, Exception):
+                        if isinstance(result, BaseException):
                             raise result
                         page_index, variant_completions = result
                         if len(variant_completions) == 0:
@@ -1408,8 +2547,12 @@ async def stream_code(websocket: WebSocket):
 
     # Configure the pipeline
     pipeline.use(WebSocketSetupMiddleware())
+    pipeline.use(SessionMiddleware())
     pipeline.use(ParameterExtractionMiddleware())
+    pipeline.use(DisconnectMonitorMiddleware())
     pipeline.use(PromptCreationMiddleware())
+    pipeline.use(WarmStartMiddleware())
+    pipeline.use(AdmissionMiddleware())
     pipeline.use(StatusBroadcastMiddleware())
     pipeline.use(CodeGenerationMiddleware())
     pipeline.use(PostProcessingMiddleware())
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from metrics.core import render_prometheus
+
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        content=render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
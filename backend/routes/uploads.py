@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Request
+
+from uploads.core import UploadStorageFullError, UploadTooLargeError, upload_store
+
+router = APIRouter()
+
+
+@router.post("/uploads")
+async def create_upload(request: Request):
+    """Stream a video or screenshot to disk and return a reference to it
+
+    The returned `url` ("upload:<id>") can be sent in place of a data URL in
+    the prompt images of a generation request.
+    """
+    try:
+        content_length = int(request.headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header.")
+    if content_length > upload_store.max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds the {upload_store.max_bytes} byte limit.",
+        )
+    upload_store.evict_expired()
+    if upload_store.total_bytes + content_length > upload_store.max_total_bytes:
+        raise HTTPException(status_code=507, detail="Upload storage is full.")
+
+    media_type = request.headers.get("content-type", "application/octet-stream")
+    media_type = media_type.split(";")[0].strip()
+    try:
+        upload = await upload_store.save_stream(request.stream(), media_type)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadStorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    return {
+        "id": upload.id,
+        "url": upload.url,
+        "size": upload.size,
+        "mediaType": upload.media_type,
+    }
@@ -0,0 +1,272 @@
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Literal, Tuple
+
+from config import (
+    ROUTING_BREAKER_COOLDOWN_SECONDS,
+    ROUTING_BREAKER_FAILURES,
+    ROUTING_DEGRADED_COOLDOWN_SECONDS,
+    ROUTING_MAX_ERROR_RATE,
+    ROUTING_MIN_SAMPLES,
+    ROUTING_POLICY,
+    ROUTING_TELEMETRY_WINDOW_SECONDS,
+    ROUTING_TRACE_PATH,
+    ROUTING_TTFT_BUDGET_SECONDS,
+)
+from llm import MODEL_PROVIDER, Llm
+from metrics.core import counter, gauge
+from routing.telemetry import (
+    ModelStats,
+    ModelTelemetry,
+    RequestOutcome,
+    append_to_trace,
+)
+
+circuit_open = gauge(
+    "routing_circuit_open", "1 while a provider's circuit breaker is open", ("provider",)
+)
+circuit_trips = counter(
+    "routing_circuit_trips_total", "Times a provider's circuit breaker opened", ("provider",)
+)
+PROVIDER_BY_MODEL = {model.value: provider for model, provider in MODEL_PROVIDER.items()}
+
+models_skipped = counter(
+    "routing_models_skipped_total",
+    "Candidate models left out of a variant plan",
+    ("model", "reason"),
+)
+
+
+def classify_error(error: BaseException) -> Literal["rate_limited", "failure", "client"]:
+    """Whether a failed request says something about the provider's health
+
+    Client errors such as a wrong API key or an unknown model are specific to
+    the request and shouldn't count against the provider.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return "rate_limited"
+    if isinstance(status, int) and 400 <= status < 500:
+        return "client"
+    return "failure"
+
+
+class CircuitBreaker:
+    """Stops routing to a provider after `failure_threshold` failures in a row
+
+    The breaker stays open for `cooldown_seconds`. After that the provider is
+    tried again: one success closes the breaker, one failure reopens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = ROUTING_BREAKER_FAILURES,
+        cooldown_seconds: float = ROUTING_BREAKER_COOLDOWN_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+
+    def allows(self, provider: str) -> bool:
+        opened_at = self._opened_at.get(provider)
+        return opened_at is None or self.clock() - opened_at >= self.cooldown_seconds
+
+    def is_open(self, provider: str) -> bool:
+        return not self.allows(provider)
+
+    def record_success(self, provider: str) -> None:
+        self._failures[provider] = 0
+        if self._opened_at.pop(provider, None) is not None:
+            circuit_open.set(0, provider=provider)
+            print(f"[ROUTING] Circuit closed for {provider}")
+
+    def record_failure(self, provider: str) -> None:
+        failures = self._failures.get(provider, 0) + 1
+        self._failures[provider] = failures
+        # A failed trial after the cooldown reopens the breaker straight away
+        if failures >= self.failure_threshold or provider in self._opened_at:
+            if provider not in self._opened_at:
+                circuit_trips.inc(provider=provider)
+                print(f"[ROUTING] Circuit opened for {provider}")
+            self._opened_at[provider] = self.clock()
+            circuit_open.set(1, provider=provider)
+
+
+class RoutingPolicy(ABC):
+    """Orders candidate models for a variant plan"""
+
+    @abstractmethod
+    def rank(
+        self, candidates: List[Llm], telemetry: ModelTelemetry
+    ) -> List[Tuple[Llm, str | None]]:
+        """Candidates in order of preference, each with the reason it should be
+        avoided (None for healthy models)"""
+
+
+class StaticPolicy(RoutingPolicy):
+    """Keeps the configured order and ignores telemetry"""
+
+    def rank(
+        self, candidates: List[Llm], telemetry: ModelTelemetry
+    ) -> List[Tuple[Llm, str | None]]:
+        return [(model, None) for model in candidates]
+
+
+class LatencyAwarePolicy(RoutingPolicy):
+    """Avoids models whose recent TTFT is over budget, that keep failing or
+    whose latest request was rate limited
+
+    Models with fewer than `min_samples` recent requests count as healthy so
+    they keep getting traffic to measure. A degraded model that hasn't been
+    sent a request for `degraded_cooldown_seconds` is tried again, since it
+    would otherwise never get the traffic to recover. Healthy models keep
+    the configured order; unhealthy ones follow, fastest first.
+    """
+
+    def __init__(
+        self,
+        ttft_budget_seconds: float = ROUTING_TTFT_BUDGET_SECONDS,
+        max_error_rate: float = ROUTING_MAX_ERROR_RATE,
+        min_samples: int = ROUTING_MIN_SAMPLES,
+        degraded_cooldown_seconds: float = ROUTING_DEGRADED_COOLDOWN_SECONDS,
+    ):
+        self.ttft_budget_seconds = ttft_budget_seconds
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.degraded_cooldown_seconds = degraded_cooldown_seconds
+
+    def rank(
+        self, candidates: List[Llm], telemetry: ModelTelemetry
+    ) -> List[Tuple[Llm, str | None]]:
+        healthy: List[Tuple[Llm, str | None]] = []
+        degraded: List[Tuple[float, Llm, str]] = []
+        now = telemetry.clock()
+        for model in candidates:
+            stats = telemetry.stats(model.value)
+            degradation = self._degradation(stats)
+            if degradation is None or (
+                stats.last_request_at is not None
+                and now - stats.last_request_at >= self.degraded_cooldown_seconds
+            ):
+                healthy.append((model, None))
+            else:
+                degraded.append((degradation[0], model, degradation[1]))
+
+        degraded.sort(key=lambda item: item[0])
+        return healthy + [(model, reason) for _, model, reason in degraded]
+
+    def _degradation(self, stats: ModelStats) -> Tuple[float, str] | None:
+        """(sort key, reason) if the model should be avoided"""
+        if stats.throttled:
+            return float("inf"), "rate_limited"
+        if stats.requests < self.min_samples:
+            return None
+        if stats.error_rate > self.max_error_rate:
+            return float("inf"), "errors"
+        if stats.ttft_p50 is not None and stats.ttft_p50 > self.ttft_budget_seconds:
+            return stats.ttft_p50, "latency"
+        return None
+
+
+ROUTING_POLICIES: Dict[str, Callable[[], RoutingPolicy]] = {
+    "static": StaticPolicy,
+    "latency": LatencyAwarePolicy,
+}
+
+
+@dataclass
+class RoutingDecision:
+    timestamp: float
+    models: List[Llm]
+
+
+class ModelRouter:
+    """Plans variant models from live telemetry
+
+    Providers with an open circuit breaker are skipped, the policy ranks what
+    is left, and variants cycle through the healthy models. If no candidate
+    is healthy, variants cycle through all of them in ranked order instead.
+    """
+
+    def __init__(
+        self,
+        policy: RoutingPolicy,
+        telemetry: ModelTelemetry,
+        breaker: CircuitBreaker,
+        trace_path: str = "",
+    ):
+        self.policy = policy
+        self.telemetry = telemetry
+        self.breaker = breaker
+        self.trace_path = trace_path
+
+    def plan(self, candidates: List[Llm], count: int) -> List[Llm]:
+        available = [
+            model for model in candidates if self.breaker.allows(MODEL_PROVIDER[model])
+        ]
+        for model in candidates:
+            if model not in available:
+                models_skipped.inc(model=model.value, reason="circuit_open")
+        if not available:
+            # Every provider is tripped; a degraded answer beats none
+            available = candidates
+
+        ranked = self.policy.rank(available, self.telemetry)
+        healthy = [model for model, reason in ranked if reason is None]
+        for model, reason in ranked:
+            if reason is not None and healthy:
+                models_skipped.inc(model=model.value, reason=reason)
+        models = healthy or [model for model, _ in ranked]
+        return [models[i % len(models)] for i in range(count)]
+
+    def record(self, outcome: RequestOutcome) -> None:
+        self.telemetry.record(outcome)
+        provider = PROVIDER_BY_MODEL.get(outcome.model)
+        # A 429 means the provider is busy, not down; the policy handles those
+        if provider is not None and not outcome.rate_limited:
+            if outcome.error:
+                self.breaker.record_failure(provider)
+            else:
+                self.breaker.record_success(provider)
+        if self.trace_path:
+            append_to_trace(self.trace_path, outcome)
+
+
+def replay_trace(
+    outcomes: List[RequestOutcome],
+    candidates: List[Llm],
+    count: int,
+    policy: RoutingPolicy,
+    window_seconds: float = ROUTING_TELEMETRY_WINDOW_SECONDS,
+    failure_threshold: int = ROUTING_BREAKER_FAILURES,
+    cooldown_seconds: float = ROUTING_BREAKER_COOLDOWN_SECONDS,
+) -> List[RoutingDecision]:
+    """Plan variants after every outcome of a recorded trace
+
+    Lets a policy be evaluated offline against production telemetry.
+    """
+    now = [outcomes[0].timestamp if outcomes else 0.0]
+    clock = lambda: now[0]
+    router = ModelRouter(
+        policy,
+        ModelTelemetry(window_seconds, clock=clock),
+        CircuitBreaker(failure_threshold, cooldown_seconds, clock=clock),
+    )
+    decisions: List[RoutingDecision] = []
+    for outcome in outcomes:
+        now[0] = outcome.timestamp
+        router.record(outcome)
+        decisions.append(RoutingDecision(now[0], router.plan(candidates, count)))
+    return decisions
+
+
+model_router = ModelRouter(
+    ROUTING_POLICIES[ROUTING_POLICY](),
+    ModelTelemetry(ROUTING_TELEMETRY_WINDOW_SECONDS),
+    CircuitBreaker(),
+    ROUTING_TRACE_PATH,
+)
@@ -0,0 +1,102 @@
+import json
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Callable, Deque, Dict, Iterable, List
+
+
+@dataclass
+class RequestOutcome:
+    """One finished (or failed) provider request"""
+
+    model: str
+    timestamp: float
+    # Seconds from admission to the first streamed token; None if none arrived
+    ttft: float | None
+    duration: float
+    output_tokens: float
+    error: bool = False
+    rate_limited: bool = False
+
+
+@dataclass
+class ModelStats:
+    requests: int
+    errors: int
+    rate_limited: int
+    ttft_p50: float | None
+    ttft_p90: float | None
+    tokens_per_second: float | None
+    # Whether the latest request was rejected with a 429
+    throttled: bool = False
+    last_request_at: float | None = None
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelTelemetry:
+    """Rolling window of request outcomes per model"""
+
+    def __init__(
+        self, window_seconds: float, clock: Callable[[], float] = time.time
+    ):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._outcomes: Dict[str, Deque[RequestOutcome]] = {}
+
+    def record(self, outcome: RequestOutcome) -> None:
+        self._outcomes.setdefault(outcome.model, deque()).append(outcome)
+        self._expire(outcome.model)
+
+    def stats(self, model: str) -> ModelStats:
+        self._expire(model)
+        outcomes = self._outcomes.get(model, ())
+        ttfts = [o.ttft for o in outcomes if o.ttft is not None and not o.error]
+        streaming_seconds = sum(
+            o.duration - o.ttft for o in outcomes if o.ttft is not None and not o.error
+        )
+        output_tokens = sum(o.output_tokens for o in outcomes if not o.error)
+        return ModelStats(
+            requests=len(outcomes),
+            errors=sum(1 for o in outcomes if o.error),
+            rate_limited=sum(1 for o in outcomes if o.rate_limited),
+            ttft_p50=percentile(ttfts, 0.5) if ttfts else None,
+            ttft_p90=percentile(ttfts, 0.9) if ttfts else None,
+            tokens_per_second=(
+                output_tokens / streaming_seconds if streaming_seconds > 0 else None
+            ),
+            throttled=bool(outcomes) and outcomes[-1].rate_limited,
+            last_request_at=outcomes[-1].timestamp if outcomes else None,
+        )
+
+    def ttfts(self, model: str) -> List[float]:
+        self._expire(model)
+        return [
+            o.ttft
+            for o in self._outcomes.get(model, ())
+            if o.ttft is not None and not o.error
+        ]
+
+    def _expire(self, model: str) -> None:
+        outcomes = self._outcomes.get(model)
+        cutoff = self.clock() - self.window_seconds
+        while outcomes and outcomes[0].timestamp < cutoff:
+            outcomes.popleft()
+
+
+def append_to_trace(path: str, outcome: RequestOutcome) -> None:
+    with open(path, "a", encoding="utf-8") as trace_file:
+        trace_file.write(json.dumps(asdict(outcome)) + "\n")
+
+
+def load_trace(lines: Iterable[str]) -> List[RequestOutcome]:
+    """Outcomes recorded with `append_to_trace`, oldest first"""
+    outcomes = [RequestOutcome(**json.loads(line)) for line in lines if line.strip()]
+    return sorted(outcomes, key=lambda outcome: outcome.timestamp)
@@ -0,0 +1,53 @@
+# Compares the single-pass base64 placeholder restore in codegen.utils against
+# the old loop that called str.replace once per placeholder, on generated pages
+# with a growing number of images.
+#
+# Usage: poetry run python run_base64_placeholder_benchmark.py
+
+import time
+from typing import Dict, List, Tuple
+
+from codegen.utils import restore_base64_placeholders
+
+
+def restore_with_replace_loop(text: str, mapping: Dict[str, str]) -> str:
+    """The previous implementation: one full copy of the document per placeholder"""
+    restored = text
+    for placeholder, data_url in mapping.items():
+        restored = restored.replace(placeholder, data_url)
+    return restored
+
+
+def build_document(image_count: int, filler_size: int = 4000) -> Tuple[str, Dict[str, str]]:
+    filler = "<p>" + "x" * filler_size + "</p>"
+    parts: List[str] = []
+    mapping: Dict[str, str] = {}
+    for i in range(1, image_count + 1):
+        placeholder = f"__IMG_BASE64_{i}__"
+        mapping[placeholder] = "data:image/png;base64," + "A" * 20000
+        parts.append(f'{filler}<img src="{placeholder}" />')
+    return "<html><body>" + "".join(parts) + "</body></html>", mapping
+
+
+def main():
+    for image_count in [1, 10, 50, 200]:
+        text, mapping = build_document(image_count)
+
+        start_time = time.perf_counter()
+        expected = restore_with_replace_loop(text, mapping)
+        replace_loop_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        result = restore_base64_placeholders(text, mapping)
+        single_pass_time = time.perf_counter() - start_time
+
+        assert result == expected
+        print(
+            f"{image_count:>3} images, {len(result) / 1024 / 1024:5.1f} MB: "
+            f"replace loop {replace_loop_time * 1000:7.1f} ms, "
+            f"single pass {single_pass_time * 1000:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
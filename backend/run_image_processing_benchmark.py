@@ -0,0 +1,77 @@
+# Compares the JPEG compressor used by process_image against the old
+# "drop quality by 5 until it fits" loop on a few synthetic screenshots.
+#
+# Usage: poetry run python run_image_processing_benchmark.py
+
+import base64
+import io
+import time
+from typing import Callable, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_processing.utils import CLAUDE_IMAGE_MAX_SIZE, compress_jpeg_to_size
+
+
+def legacy_compress(img: Image.Image, max_size: int) -> Tuple[bytes, int]:
+    """The quality loop process_image used before the binary search"""
+    encode_count = 1
+    quality = 95
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    while len(base64.b64encode(output.getvalue())) > max_size and quality > 10:
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality)
+        encode_count += 1
+        quality -= 5
+    return output.getvalue(), encode_count
+
+
+def binary_search_compress(img: Image.Image, max_size: int) -> Tuple[bytes, int]:
+    result = compress_jpeg_to_size(img, max_size)
+    return result.data, result.encode_count
+
+
+def synthetic_screenshot(width: int, height: int, noise: float) -> Image.Image:
+    """Flat UI-like blocks with a configurable amount of high-frequency noise"""
+    rng = np.random.default_rng(0)
+    pixels = np.full((height, width, 3), 245, dtype=np.float32)
+    for _ in range(40):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        w, h = rng.integers(50, 600), rng.integers(20, 300)
+        pixels[y : y + h, x : x + w] = rng.integers(0, 255, size=3)
+    pixels += rng.normal(0, 255 * noise, size=pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def run_case(
+    name: str,
+    compress: Callable[[Image.Image, int], Tuple[bytes, int]],
+    img: Image.Image,
+    max_size: int,
+) -> None:
+    start_time = time.perf_counter()
+    data, encode_count = compress(img, max_size)
+    elapsed = time.perf_counter() - start_time
+    size = len(base64.b64encode(data))
+    print(
+        f"  {name:<14} encodes = {encode_count:>2}  time = {elapsed:6.2f}s  "
+        f"base64 size = {size / 1024 / 1024:5.2f} MB  fits = {size <= max_size}"
+    )
+
+
+def main():
+    cases = [
+        ("1920x1080 clean", synthetic_screenshot(1920, 1080, 0.02), 512 * 1024),
+        ("2560x8000 noisy", synthetic_screenshot(2560, 7900, 0.15), CLAUDE_IMAGE_MAX_SIZE),
+        ("4000x4000 noisy", synthetic_screenshot(4000, 4000, 0.3), CLAUDE_IMAGE_MAX_SIZE),
+    ]
+    for name, img, max_size in cases:
+        print(f"{name} (limit {max_size / 1024 / 1024:.2f} MB)")
+        run_case("legacy loop", legacy_compress, img, max_size)
+        run_case("binary search", binary_search_compress, img, max_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Compares single-pass frame sampling (with near-duplicate frames dropped) in
+# video.utils against the old "read every frame, keep every nth" loop on a few
+# synthetic screen recordings.
+#
+# Usage: poetry run python run_video_sampling_benchmark.py
+
+import math
+import os
+import tempfile
+import time
+from typing import Callable, Tuple
+
+import numpy as np
+from moviepy.editor import VideoClip, VideoFileClip  # type: ignore
+
+from video.utils import TARGET_NUM_SCREENSHOTS, sample_video_frames
+
+
+def legacy_sample(video_path: str) -> Tuple[int, int]:
+    """The iter_frames loop split_video_into_screenshots used before"""
+    clip = VideoFileClip(video_path)
+    total_frames = clip.reader.nframes
+    frame_skip = max(1, math.ceil(total_frames / TARGET_NUM_SCREENSHOTS))
+    kept = 0
+    read = 0
+    for i, _ in enumerate(clip.iter_frames()):
+        read += 1
+        if i % frame_skip == 0:
+            kept += 1
+            if kept >= TARGET_NUM_SCREENSHOTS:
+                break
+    clip.close()
+    return kept, read
+
+
+def select_sample(video_path: str) -> Tuple[int, int]:
+    sample = sample_video_frames(video_path)
+    return len(sample.images), sample.frames_read
+
+
+def synthetic_recording(path: str, width: int, height: int, fps: int, duration: float):
+    """Mostly static page with a cursor-sized block moving and a scroll every second"""
+    rng = np.random.default_rng(0)
+    page = np.full((height * 2, width, 3), 245, dtype=np.uint8)
+    for _ in range(60):
+        x, y = rng.integers(0, width), rng.integers(0, height * 2)
+        w, h = rng.integers(50, 600), rng.integers(20, 300)
+        page[y : y + h, x : x + w] = rng.integers(0, 255, size=3)
+
+    def make_frame(t: float) -> np.ndarray:
+        scroll = int(t) * height // 10
+        frame = page[scroll : scroll + height].copy()
+        x = int(t * 200) % (width - 20)
+        frame[100:120, x : x + 20] = 0
+        return frame
+
+    VideoClip(make_frame, duration=duration).write_videofile(
+        path, fps=fps, codec="libx264", audio=False, logger=None
+    )
+
+
+def run_case(
+    name: str, sample: Callable[[str], Tuple[int, int]], video_path: str
+) -> None:
+    start_time = time.perf_counter()
+    kept, read = sample(video_path)
+    elapsed = time.perf_counter() - start_time
+    print(f"  {name:<8} frames kept = {kept:>2}  read = {read:>5}  time = {elapsed:6.2f}s")
+
+
+def main():
+    cases = [
+        ("720p 30fps 10s", 1280, 720, 30, 10),
+        ("1080p 60fps 10s", 1920, 1080, 60, 10),
+        ("1080p 60fps 30s", 1920, 1080, 60, 30),
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, width, height, fps, duration in cases:
+            video_path = os.path.join(tmp_dir, "recording.mp4")
+            synthetic_recording(video_path, width, height, fps, duration)
+            print(name)
+            run_case("legacy", legacy_sample, video_path)
+            run_case("select", select_sample, video_path)
+
+
+if __name__ == "__main__":
+    main()
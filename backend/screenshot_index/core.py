@@ -0,0 +1,219 @@
+import base64
+import io
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from blobs.core import blob_store
+from config import (
+    SCREENSHOT_INDEX_MAX_DETAIL_DISTANCE,
+    SCREENSHOT_INDEX_MAX_DISTANCE,
+    SCREENSHOT_INDEX_MAX_ENTRIES,
+)
+from image_processing.cache import split_data_url
+from image_processing.hashing import dhash, hamming_distance
+from metrics.core import counter, gauge
+
+# Grid size of the detail hash (32 x 32 = 1024 bits). Unlike the 64-bit hash
+# it tells apart pages that share a layout but differ in their text
+DETAIL_HASH_SIZE = 32
+
+index_lookups = counter(
+    "screenshot_index_lookups_total",
+    "Near-duplicate screenshot lookups",
+    ("result",),
+)
+index_lookup_seconds = counter(
+    "screenshot_index_lookup_seconds_total",
+    "Time spent searching the near-duplicate screenshot index",
+)
+index_entries = gauge(
+    "screenshot_index_entries", "Screenshots in the near-duplicate index"
+)
+
+
+@dataclass(frozen=True)
+class ScreenshotHash:
+    # 64-bit difference hash, used to find candidates
+    coarse: int
+    # DETAIL_HASH_SIZE^2-bit difference hash, used to confirm a candidate
+    detail: int
+
+
+def screenshot_hash(image_data_url: str) -> ScreenshotHash:
+    """Difference hashes of a base64 data URL image"""
+    _, base64_data = split_data_url(image_data_url)
+    with Image.open(io.BytesIO(base64.b64decode(base64_data))) as image:
+        return ScreenshotHash(dhash(image), dhash(image, DETAIL_HASH_SIZE))
+
+
+class MultiIndexHash:
+    """64-bit hashes searchable within a fixed Hamming radius
+
+    Each hash is split into `radius + 1` bit ranges, and items are bucketed by
+    each range's value. Two hashes within `radius` bits of each other must
+    agree exactly on at least one range (pigeonhole), so a search only
+    compares against the items sharing a bucket with the query.
+    """
+
+    def __init__(self, radius: int, bits: int = 64):
+        self.radius = radius
+        parts = radius + 1
+        bounds = [bits * i // parts for i in range(parts + 1)]
+        self._ranges = [
+            (start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])
+        ]
+        self._tables: List[Dict[int, Dict[int, Tuple[int, Any]]]] = [
+            {} for _ in self._ranges
+        ]
+        self.size = 0
+
+    def add(self, key: int, value: int, item: Any) -> None:
+        """Index `item` under `value`; `key` identifies it for removal"""
+        for table, part in zip(self._tables, self._parts(value)):
+            table.setdefault(part, {})[key] = (value, item)
+        self.size += 1
+
+    def remove(self, key: int, value: int) -> None:
+        for table, part in zip(self._tables, self._parts(value)):
+            bucket = table.get(part)
+            if bucket is None or bucket.pop(key, None) is None:
+                continue
+            if not bucket:
+                del table[part]
+        self.size -= 1
+
+    def search(self, value: int, radius: int | None = None) -> List[Tuple[int, Any]]:
+        """(distance, item) pairs within `radius` of `value`, nearest first"""
+        radius = self.radius if radius is None else min(radius, self.radius)
+        seen: Dict[int, Tuple[int, Any]] = {}
+        for table, part in zip(self._tables, self._parts(value)):
+            for key, (candidate, item) in table.get(part, {}).items():
+                if key in seen:
+                    continue
+                distance = hamming_distance(value, candidate)
+                if distance <= radius:
+                    seen[key] = (distance, item)
+        return sorted(seen.values(), key=lambda result: result[0])
+
+    def _parts(self, value: int) -> List[int]:
+        return [(value >> start) & mask for start, mask in self._ranges]
+
+
+@dataclass(eq=False)
+class IndexedGeneration:
+    id: int
+    hash: int
+    detail: int
+    stack: str
+    # Blob store digest of the generated HTML
+    html_digest: str
+
+
+@dataclass
+class WarmStart:
+    html: str
+    distance: int
+
+
+class ScreenshotIndex:
+    """Earlier screenshots and the HTML generated for them, searchable by dHash
+
+    Candidates within `max_distance` bits of the coarse hash are only
+    matched if their detail hashes are within `max_detail_distance` bits
+    as well. Only digests are held here; the HTML itself lives in the blob
+    store, so async code calls `add` and `nearest` in a thread. Up to
+    `max_entries` screenshots are kept, least recently matched first out.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = SCREENSHOT_INDEX_MAX_DISTANCE,
+        max_detail_distance: int = SCREENSHOT_INDEX_MAX_DETAIL_DISTANCE,
+        max_entries: int = SCREENSHOT_INDEX_MAX_ENTRIES,
+    ):
+        self.max_distance = max_distance
+        self.max_detail_distance = max_detail_distance
+        self.max_entries = max_entries
+        self._hashes = MultiIndexHash(max_distance)
+        self._entries: "OrderedDict[int, IndexedGeneration]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, screenshot: ScreenshotHash, stack: str, html: str) -> None:
+        digest = blob_store.put(html)
+        with self._lock:
+            for _, entry in self._hashes.search(screenshot.coarse, 0):
+                if entry.stack == stack and self._same_content(entry, screenshot):
+                    # The same screenshot again: keep the latest generation
+                    entry.html_digest = digest
+                    self._entries.move_to_end(entry.id)
+                    return
+
+            entry = IndexedGeneration(
+                self._next_id, screenshot.coarse, screenshot.detail, stack, digest
+            )
+            self._next_id += 1
+            self._entries[entry.id] = entry
+            self._hashes.add(entry.id, screenshot.coarse, entry)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._hashes.remove(evicted.id, evicted.hash)
+            index_entries.set(len(self._entries))
+
+    def nearest(self, screenshot: ScreenshotHash, stack: str) -> WarmStart | None:
+        """HTML generated for the closest earlier screenshot in the same stack"""
+        started = time.perf_counter()
+        with self._lock:
+            candidates = [
+                (distance, entry)
+                for distance, entry in self._hashes.search(screenshot.coarse)
+                if entry.stack == stack
+            ]
+        matches = sorted(
+            (
+                (hamming_distance(entry.detail, screenshot.detail), distance, entry)
+                for distance, entry in candidates
+                if self._same_content(entry, screenshot)
+            ),
+            key=lambda match: match[:2],
+        )
+
+        match: WarmStart | None = None
+        for _, distance, entry in matches:
+            html = blob_store.get(entry.html_digest)
+            if html is None:
+                continue
+            with self._lock:
+                if entry.id in self._entries:
+                    self._entries.move_to_end(entry.id)
+            match = WarmStart(html, distance)
+            break
+        index_lookup_seconds.inc(time.perf_counter() - started)
+        if match is not None:
+            index_lookups.inc(result="hit")
+        elif candidates:
+            # Laid out alike, but the content differs
+            index_lookups.inc(result="mismatch")
+        else:
+            index_lookups.inc(result="miss")
+        return match
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hashes = MultiIndexHash(self.max_distance)
+            self._entries.clear()
+            index_entries.set(0)
+
+    def _same_content(self, entry: IndexedGeneration, screenshot: ScreenshotHash) -> bool:
+        return hamming_distance(entry.detail, screenshot.detail) <= self.max_detail_distance
+
+
+screenshot_index = ScreenshotIndex()
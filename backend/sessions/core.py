@@ -0,0 +1,225 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, List, Tuple
+
+from config import (
+    SESSION_BUFFER_MAX_BYTES,
+    SESSION_RESUME_GRACE_SECONDS,
+    SESSION_STORE_MAX_BYTES,
+    SESSION_TTL_SECONDS,
+)
+from metrics.core import counter, gauge
+
+sessions_resumed = counter(
+    "generation_sessions_resumed_total", "Generation sessions resumed by a client"
+)
+regenerations_avoided = counter(
+    "generation_regenerations_avoided_total",
+    "Resumes of generations that kept running while the client was away",
+)
+resume_failures = counter(
+    "generation_session_resume_failures_total",
+    "Resume attempts that could not be served",
+    ("reason",),
+)
+frames_replayed = counter(
+    "generation_session_frames_replayed_total", "Frames re-sent to resuming clients"
+)
+sessions_evicted = counter(
+    "generation_sessions_evicted_total",
+    "Generation sessions dropped before their client came back",
+    ("reason",),
+)
+session_buffer_bytes = gauge(
+    "generation_session_buffer_bytes", "Bytes held by session replay buffers"
+)
+sessions_open = gauge("generation_sessions", "Generation sessions held for resuming")
+
+
+class ResumeError(Exception):
+    pass
+
+
+class ReplayBuffer:
+    """Most recent frames sent for one variant, capped at `max_bytes`
+
+    Remembers the newest sequence number it had to drop, so a resume that
+    needs an evicted frame can be refused instead of replaying with a gap.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evicted_through = 0
+        self._frames: Deque[Tuple[int, str]] = deque()
+
+    def append(self, seq: int, frame: str) -> int:
+        """Add a frame and return the change in buffered bytes"""
+        self._frames.append((seq, frame))
+        added = len(frame)
+        self.bytes += added
+        while self.bytes > self.max_bytes and len(self._frames) > 1:
+            evicted_seq, evicted = self._frames.popleft()
+            self.bytes -= len(evicted)
+            added -= len(evicted)
+            self.evicted_through = evicted_seq
+        return added
+
+    def ack(self, seq: int) -> int:
+        """Drop frames the client has confirmed; returns the bytes freed"""
+        freed = 0
+        while self._frames and self._frames[0][0] <= seq:
+            freed += len(self._frames.popleft()[1])
+        self.bytes -= freed
+        return freed
+
+    def frames_after(self, seq: int) -> List[Tuple[int, str]]:
+        if self.evicted_through > seq:
+            raise ResumeError("Frames needed to resume were evicted")
+        return [(frame_seq, frame) for frame_seq, frame in self._frames if frame_seq > seq]
+
+
+class GenerationSession:
+    """Frames sent for one generation, kept so a reconnecting client can catch up
+
+    `communicator` is the WebSocketCommunicator of the connection that started
+    the generation; a resumed connection is attached to it.
+    """
+
+    def __init__(self, store: "SessionStore", buffer_max_bytes: int):
+        self.id = uuid.uuid4().hex
+        self.store = store
+        self.buffer_max_bytes = buffer_max_bytes
+        self.communicator: Any = None
+        self.last_seq = 0
+        self.acked_seq = 0
+        self.bytes = 0
+        self.evicted = False
+        self.finished = asyncio.Event()
+        # Set once the communicator has sent its last frame and closed
+        self.closed = asyncio.Event()
+        self.reattached = asyncio.Event()
+        self.updated_at = time.monotonic()
+        self.detached_at: float | None = None
+        self._buffers: Dict[Hashable, ReplayBuffer] = {}
+
+    def next_seq(self) -> int:
+        self.last_seq += 1
+        return self.last_seq
+
+    def record(self, key: Hashable, seq: int, frame: str) -> None:
+        if self.evicted:
+            return
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = ReplayBuffer(self.buffer_max_bytes)
+        self._resize(buffer.append(seq, frame))
+        self.updated_at = time.monotonic()
+
+    def ack(self, seq: int) -> None:
+        self.acked_seq = max(self.acked_seq, seq)
+        self._resize(-sum(buffer.ack(seq) for buffer in self._buffers.values()))
+
+    def frames_after(self, seq: int) -> List[str]:
+        """Frames with a sequence number above `seq`, in the order they were sent"""
+        if self.evicted:
+            raise ResumeError("Session was evicted")
+        frames = [
+            frame
+            for buffer in self._buffers.values()
+            for frame in buffer.frames_after(seq)
+        ]
+        return [frame for _, frame in sorted(frames)]
+
+    def detach(self) -> None:
+        self.detached_at = time.monotonic()
+        self.reattached.clear()
+
+    def reattach(self) -> None:
+        self.detached_at = None
+        self.reattached.set()
+
+    async def wait_for_reattach(
+        self, timeout: float = SESSION_RESUME_GRACE_SECONDS
+    ) -> bool:
+        try:
+            await asyncio.wait_for(self.reattached.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def finish(self) -> None:
+        self.finished.set()
+        self.updated_at = time.monotonic()
+
+    def _resize(self, delta: int) -> None:
+        self.bytes += delta
+        self.store.resize(delta)
+
+
+class SessionStore:
+    """Generation sessions by id, bounded by total buffered bytes and a TTL
+
+    A session is dropped `ttl_seconds` after it last changed, as long as no
+    client is attached to it. When buffers exceed `max_bytes`, the sessions
+    that changed least recently are dropped first.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = SESSION_STORE_MAX_BYTES,
+        buffer_max_bytes: int = SESSION_BUFFER_MAX_BYTES,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+    ):
+        self.max_bytes = max_bytes
+        self.buffer_max_bytes = buffer_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._sessions: "OrderedDict[str, GenerationSession]" = OrderedDict()
+
+    def create(self) -> GenerationSession:
+        self.evict_expired()
+        session = GenerationSession(self, self.buffer_max_bytes)
+        self._sessions[session.id] = session
+        sessions_open.set(len(self._sessions))
+        return session
+
+    def get(self, session_id: str) -> GenerationSession | None:
+        self.evict_expired()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def resize(self, delta: int) -> None:
+        self.total_bytes += delta
+        while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+            _, session = next(iter(self._sessions.items()))
+            self._evict(session, "memory")
+        session_buffer_bytes.set(self.total_bytes)
+
+    def evict_expired(self) -> None:
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            idle = session.finished.is_set() or session.detached_at is not None
+            if idle and now - session.updated_at > self.ttl_seconds:
+                self._evict(session, "expired")
+
+    def clear(self) -> None:
+        for session in list(self._sessions.values()):
+            self._evict(session, "shutdown")
+
+    def _evict(self, session: GenerationSession, reason: str) -> None:
+        self._sessions.pop(session.id, None)
+        session.evicted = True
+        self.total_bytes -= session.bytes
+        session.bytes = 0
+        session._buffers.clear()
+        sessions_evicted.inc(reason=reason)
+        sessions_open.set(len(self._sessions))
+        session_buffer_bytes.set(self.total_bytes)
+
+
+session_store = SessionStore()
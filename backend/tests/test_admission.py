@@ -0,0 +1,62 @@
+from typing import Dict
+
+from admission.core import AdmissionController
+
+
+class FakeScheduler:
+    def __init__(self, queued: int = 0):
+        self.queued = queued
+
+    def total_stats(self) -> Dict[str, int]:
+        return {"in_flight": 0, "queued": self.queued}
+
+
+def make_controller(**kwargs) -> AdmissionController:
+    options = dict(
+        max_variants=4,
+        min_variants=2,
+        load_target=10,
+        max_queue_depth=0,
+        enabled=True,
+        scheduler=FakeScheduler(),
+    )
+    options.update(kwargs)
+    return AdmissionController(**options)  # type: ignore
+
+
+def test_full_fan_out_while_there_is_headroom():
+    controller = make_controller()
+
+    assert controller.choose_variant_count() == 4
+
+
+def test_fan_out_shrinks_as_load_approaches_target():
+    controller = make_controller()
+    counts = []
+    with controller.admit(controller.choose_variant_count()):
+        with controller.admit(controller.choose_variant_count()):
+            counts.append(controller.choose_variant_count())
+            with controller.admit(counts[-1]):
+                counts.append(controller.choose_variant_count())
+
+    # 4 + 4 in flight leaves room for 2; beyond the target the minimum applies
+    assert counts == [2, 2]
+    assert controller.in_flight == 0
+
+
+def test_multi_page_requests_split_the_headroom():
+    controller = make_controller()
+
+    assert controller.choose_variant_count(pages=3) == 3
+
+
+def test_provider_queue_sheds_to_minimum():
+    controller = make_controller(scheduler=FakeScheduler(queued=1))
+
+    assert controller.choose_variant_count() == 2
+
+
+def test_disabled_controller_always_uses_max_variants():
+    controller = make_controller(enabled=False, scheduler=FakeScheduler(queued=5))
+    with controller.admit(100):
+        assert controller.choose_variant_count() == 4
@@ -1,4 +1,8 @@
-from codegen.utils import replace_base64_data_urls, restore_base64_placeholders
+from codegen.utils import (
+    StreamingPlaceholderRestorer,
+    replace_base64_data_urls,
+    restore_base64_placeholders,
+)
 
 
 def test_replace_and_restore_multiple_base64_images() -> None:
@@ -47,3 +51,35 @@ def test_replace_reuses_placeholders_for_duplicate_data_urls() -> None:
 
     assert scrubbed_html.count("__IMG_BASE64_1__") == 2
     assert mapping == {"__IMG_BASE64_1__": "data:image/png;base64,AAA111"}
+
+
+def test_streaming_restorer_handles_placeholders_split_across_chunks() -> None:
+    mapping = {
+        "__IMG_BASE64_1__": "data:image/png;base64,AAA111",
+        "__IMG_BASE64_12__": "data:image/png;base64,BBB222",
+    }
+    text = '<img src="__IMG_BASE64_1__" /><img src="__IMG_BASE64_12__" /> snake_case'
+    restorer = StreamingPlaceholderRestorer(mapping)
+
+    streamed = [restorer.feed(text[i : i + 3]) for i in range(0, len(text), 3)]
+    streamed.append(restorer.flush())
+
+    assert "".join(streamed) == restore_base64_placeholders(text, mapping)
+    # Nothing containing a raw placeholder fragment is ever emitted
+    assert not any("__IMG" in chunk for chunk in streamed)
+
+
+def test_streaming_restorer_emits_plain_text_immediately() -> None:
+    restorer = StreamingPlaceholderRestorer({"__IMG_BASE64_1__": "data:image/png;base64,A"})
+
+    assert restorer.feed("<div>hello</div>") == "<div>hello</div>"
+    assert restorer.feed('<img src="__IMG') == '<img src="'
+    assert restorer.feed('_BASE64_1__">') == 'data:image/png;base64,A">'
+    assert restorer.flush() == ""
+
+
+def test_streaming_restorer_flushes_incomplete_placeholder_as_is() -> None:
+    restorer = StreamingPlaceholderRestorer({"__IMG_BASE64_1__": "data:image/png;base64,A"})
+
+    assert restorer.feed("end __IMG_BA") == "end "
+    assert restorer.flush() == "__IMG_BA"
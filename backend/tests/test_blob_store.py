@@ -0,0 +1,136 @@
+import asyncio
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+import blobs.core
+import prompts
+from blobs.core import BlobMissingError, BlobStore, blob_digest, blob_ref
+from routes.generate_code import ParameterExtractionStage, WebSocketCommunicator
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> BlobStore:
+    store = BlobStore(max_memory_bytes=10, directory=str(tmp_path), max_disk_bytes=20)
+    monkeypatch.setattr(blobs.core, "blob_store", store)
+    monkeypatch.setattr(prompts, "blob_store", store)
+    monkeypatch.setattr("routes.generate_code.blob_store", store)
+    return store
+
+
+def test_blobs_spill_to_disk_and_come_back(store):
+    first = store.put("a" * 6)
+    store.put("b" * 6)
+
+    assert store.stats()["memory_entries"] == 1
+    assert os.path.exists(os.path.join(store.directory, first))
+
+    assert store.get(first) == "a" * 6
+    assert store.stats() == {
+        "memory_entries": 1,
+        "memory_bytes": 6,
+        "disk_entries": 1,
+        "disk_bytes": 6,
+    }
+
+
+def test_disk_tier_evicts_least_recently_spilled(store):
+    digests = [store.put(letter * 6) for letter in "abcde"]
+
+    # Memory holds the newest, disk the three before it
+    assert store.get(digests[0]) is None
+    assert store.missing(digests) == [digests[0]]
+    assert store.stats()["disk_bytes"] == 18
+
+
+def test_resolve_raises_for_unknown_references(store):
+    assert store.resolve("plain text") == "plain text"
+    with pytest.raises(BlobMissingError) as exc_info:
+        store.resolve(blob_ref("never stored"))
+    assert exc_info.value.digests == [blob_digest("never stored")]
+
+
+def test_history_items_resolve_blob_references(store):
+    html = "<html>previous</html>"
+    store.put(html)
+
+    message = prompts.create_message_from_history_item(
+        {"text": blob_ref(html), "images": []}, "assistant"
+    )
+
+    assert message["content"] == html
+
+
+async def throw_error(message: str) -> None:
+    pass
+
+
+@pytest.mark.asyncio
+async def test_parameter_extraction_negotiates_missing_blobs(store):
+    html = "<p>v1</p>"
+    screenshot = "data:image/png;base64,AAAA"
+    requested: List[List[str]] = []
+
+    async def request_blobs(digests: List[str]) -> Dict[str, str]:
+        requested.append(digests)
+        return {blob_digest(html): html}
+
+    store.max_memory_bytes = 1024
+    store.put(screenshot)
+    params = {
+        "generatedCodeConfig": "html_tailwind",
+        "inputMode": "image",
+        "generationType": "update",
+        "prompt": {"text": "", "images": [blob_ref(screenshot)]},
+        "history": [{"text": blob_ref(html), "images": []}, {"text": "Make it blue"}],
+    }
+
+    extracted = await ParameterExtractionStage(throw_error, request_blobs).extract_and_validate(
+        params  # type: ignore
+    )
+
+    assert requested == [[blob_digest(html)]]
+    assert extracted.prompt["images"] == [screenshot]
+    assert extracted.history[0]["text"] == html
+    # Content sent in full is remembered for the next turn
+    assert blob_digest("Make it blue") in store
+
+
+@pytest.mark.asyncio
+async def test_parameter_extraction_fails_when_client_cannot_supply_blobs(store):
+    async def request_blobs(digests: List[str]) -> Dict[str, str]:
+        return {digests[0]: "content that doesn't match the digest"}
+
+    params = {
+        "generatedCodeConfig": "html_tailwind",
+        "inputMode": "image",
+        "prompt": {"text": "", "images": [blob_ref("lost screenshot")]},
+    }
+
+    with pytest.raises(BlobMissingError):
+        await ParameterExtractionStage(throw_error, request_blobs).extract_and_validate(
+            params  # type: ignore
+        )
+
+
+class SilentWebSocket:
+    def __init__(self) -> None:
+        self.frames: List[Any] = []
+
+    async def send_text(self, text: str) -> None:
+        self.frames.append(text)
+
+    async def receive_json(self) -> Dict[str, Any]:
+        await asyncio.Event().wait()
+        return {}
+
+
+@pytest.mark.asyncio
+async def test_blob_request_fails_when_the_client_never_answers(monkeypatch):
+    monkeypatch.setattr("routes.generate_code.BLOB_REQUEST_TIMEOUT_SECONDS", 0.01)
+    comm = WebSocketCommunicator(SilentWebSocket(), flush_interval=0)  # type: ignore
+
+    with pytest.raises(BlobMissingError) as exc_info:
+        await comm.request_blobs(["abc"])
+    assert exc_info.value.digests == ["abc"]
@@ -0,0 +1,158 @@
+import random
+import re
+import time
+
+import pytest
+
+from codegen.block_updates import (
+    BlockUpdateError,
+    BlockUpdateStreamProcessor,
+    replace_first_occurrence,
+    replace_tag_by_data_cid,
+)
+from codegen.html_document import IndexedHtmlDocument
+from codegen.piece_table import PieceTable
+
+
+def make_page(sections: int) -> str:
+    body = "".join(
+        f'<section data-cid="s{i}">\n  <div class="card"><p data-cid="p{i}">Text {i}</p>'
+        f'<img data-cid="img{i}" src="a.png"></div>\n</section>\n'
+        for i in range(sections)
+    )
+    return f"<html><body>\n{body}</body></html>"
+
+
+def indexed_cids(document: IndexedHtmlDocument) -> list[tuple[int, str]]:
+    return [
+        (document._span_start(index), span.data_cid)
+        for index, span in enumerate(document._spans)
+    ]
+
+
+def scanned_cids(html: str) -> list[tuple[int, str]]:
+    return [
+        (match.start(), match.group(1))
+        for match in re.finditer(r"<[a-zA-Z][\w:-]*\b[^>]*\bdata-cid=[\"']([^\"']*)[\"'][^>]*>", html)
+    ]
+
+
+def test_replace_tag_by_data_cid_replaces_whole_element():
+    html = '<div data-cid="a"><div>inner</div></div><p>after</p>'
+
+    updated, end = replace_tag_by_data_cid(html, "a", '<div data-cid="a">new</div>')
+
+    assert updated == '<div data-cid="a">new</div><p>after</p>'
+    assert updated[:end] == '<div data-cid="a">new</div>'
+
+
+def test_replace_tag_by_data_cid_rejects_duplicates_and_partial_html():
+    html = '<p data-cid="a">1</p><p data-cid="a">2</p>'
+    with pytest.raises(BlockUpdateError, match="Multiple"):
+        replace_tag_by_data_cid(html, "a", '<p data-cid="a">x</p>')
+    with pytest.raises(BlockUpdateError, match="does not fully cover"):
+        replace_tag_by_data_cid('<p data-cid="b">1</p>', "b", "<span>x</span>")
+
+
+def test_replace_first_occurrence_falls_back_to_whitespace_insensitive_match():
+    html = "<div>\n  <p>Hello   world</p>\n</div>"
+
+    updated, end = replace_first_occurrence(html, "<p>Hello world</p>", "<p>Hi</p>")
+
+    assert updated == "<div>\n  <p>Hi</p>\n</div>"
+    assert updated[:end] == "<div>\n  <p>Hi</p>"
+
+
+def test_index_stays_consistent_after_random_splices():
+    rng = random.Random(0)
+    document = IndexedHtmlDocument(make_page(20))
+    snippets = ['<span data-cid="new">x</span>', "<b>", "</b>", "text", ""]
+
+    for step in range(300):
+        if step % 3 == 0:
+            # Rewrite an attribute inside an indexed tag
+            index = rng.randrange(len(document._spans))
+            attribute = document.text.find("data-cid=", document._span_start(index))
+            document.splice(attribute, attribute + 9, f'id="x{step}" data-cid=')
+        else:
+            # Replace markup between tag boundaries
+            boundaries = [match.end() for match in re.finditer(">", document.text)]
+            start = rng.choice(boundaries)
+            end = min(rng.choice(boundaries), start + 200)
+            if end < start or (end != start and end not in boundaries):
+                end = start
+            document.splice(start, end, rng.choice(snippets))
+        assert indexed_cids(document) == scanned_cids(document.text)
+
+
+def test_piece_table_matches_string_edits():
+    rng = random.Random(1)
+    expected = make_page(5)
+    table = PieceTable(expected)
+
+    for _ in range(200):
+        start = rng.randrange(len(expected) + 1)
+        end = min(len(expected), start + rng.randrange(8))
+        new_text = rng.choice(["", "<b>", "data-cid", "x" * rng.randrange(10)])
+        table.splice(start, end, new_text)
+        expected = expected[:start] + new_text + expected[end:]
+
+        a, b = sorted(rng.randrange(len(expected) + 1) for _ in range(2))
+        assert table.slice(a, b) == expected[a:b]
+        for sub in ["data-cid", "<b>", "</p>", ">", "missing"]:
+            assert table.find(sub, a) == expected.find(sub, a)
+        assert table.rfind("<", 0, b) == expected.rfind("<", 0, b)
+
+    assert table.piece_count > 1
+    assert table.text == expected
+
+
+def test_element_end_is_found_across_pieces():
+    document = IndexedHtmlDocument('<div data-cid="a"><div>x</div></div><p>tail</p>')
+    document.splice(23, 24, "<div>y</div>")
+    document.splice(20, 21, "i")
+
+    span = document.find_data_cid("a")[0]
+    end = document.find_element_end(span)
+
+    assert document.slice(span.start, end) == '<div data-cid="a"><div><div>y</div></div></div>'
+
+
+@pytest.mark.asyncio
+async def test_processor_applies_ops_and_streams_deltas():
+    sent: list[str] = []
+
+    async def send_chunk(delta: str) -> None:
+        sent.append(delta)
+
+    processor = BlockUpdateStreamProcessor(make_page(3), send_chunk)
+    await processor.process_chunk('```toml\ndataCid = "p1"\nhtml = "<p data-cid=\\"p1\\">Changed</p>"\n```')
+    await processor.process_full_response(
+        '```toml\nold = "<p data-cid=\\"p2\\">Text 2</p>"\nnew = "<p>Gone</p>"\n```'
+    )
+
+    assert processor.applied_ops == 2
+    assert '<p data-cid="p1">Changed</p>' in processor.current_html
+    assert "<p>Gone</p>" in processor.current_html
+    assert processor.current_html.startswith("".join(sent))
+
+
+@pytest.mark.asyncio
+async def test_many_ops_on_large_page_scale_linearly():
+    async def send_chunk(delta: str) -> None:
+        pass
+
+    page = make_page(2500)
+    assert len(page) > 250_000
+    ops = "".join(
+        f'```toml\ndataCid = "p{i * 50}"\nhtml = "<p data-cid=\\"p{i * 50}\\">Updated</p>"\n```\n'
+        for i in range(50)
+    )
+    processor = BlockUpdateStreamProcessor(page, send_chunk)
+
+    start_time = time.perf_counter()
+    await processor.process_full_response(ops)
+    elapsed = time.perf_counter() - start_time
+
+    assert processor.applied_ops == 50
+    assert elapsed < 1.0
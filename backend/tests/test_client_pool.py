@@ -0,0 +1,72 @@
+import pytest
+from models.clients import ProviderClientPool
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_clients_per_key():
+    pool = ProviderClientPool(idle_ttl=60)
+    stats_before = pool.stats()
+
+    async with pool._lease(("openai", "key", None), FakeClient) as first:
+        pass
+    async with pool._lease(("openai", "key", None), FakeClient) as second:
+        pass
+    async with pool._lease(("openai", "other-key", None), FakeClient) as third:
+        pass
+
+    assert first is second
+    assert third is not first
+    stats = pool.stats()
+    assert stats["clients"] == 2
+    assert stats["hits"] - stats_before["hits"] == 1
+    assert stats["misses"] - stats_before["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_evicts_only_idle_clients():
+    pool = ProviderClientPool(idle_ttl=0)
+
+    async with pool._lease(("anthropic", "key", None), FakeClient) as in_use:
+        # A client that is leased must survive eviction
+        await pool.evict_idle()
+        assert not in_use.closed
+
+    await pool.evict_idle()
+    assert in_use.closed
+    assert pool.stats()["clients"] == 0
+
+
+class BrokenClient(FakeClient):
+    async def close(self):
+        raise RuntimeError("connection pool is gone")
+
+
+@pytest.mark.asyncio
+async def test_failed_idle_close_does_not_fail_the_next_lease():
+    pool = ProviderClientPool(idle_ttl=0)
+    async with pool._lease(("anthropic", "key", None), BrokenClient):
+        pass
+
+    async with pool._lease(("openai", "key", None), FakeClient) as client:
+        assert not client.closed
+    assert pool.stats()["clients"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pool_aclose_closes_everything():
+    pool = ProviderClientPool()
+    async with pool._lease(("openai", "key", "http://localhost"), FakeClient) as client:
+        pass
+
+    await pool.aclose()
+
+    assert client.closed
+    assert pool.stats()["clients"] == 0
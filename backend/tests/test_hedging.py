@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from unittest.mock import AsyncMock
+
+import httpx
+import openai
+import pytest
+
+from llm import Llm
+from routes.generate_code import ParallelGenerationStage, VariantErrorAlreadySent
+
+PRIMARY = Llm.CLAUDE_4_5_SONNET_2025_09_29
+FALLBACK = Llm.GEMINI_3_FLASH_PREVIEW
+
+
+def make_stage(
+    streams: Dict[Llm, Tuple[float, str]],
+) -> Tuple[ParallelGenerationStage, List[str], List[Llm]]:
+    """Stage whose models answer after the given delay; records started/cancelled"""
+    stage = ParallelGenerationStage(
+        send_message=AsyncMock(),
+        openai_api_key=None,
+        openai_base_url=None,
+        anthropic_api_key="key",
+        should_generate_images=False,
+        vlm_temperature=0.0,
+        hedge_first_variant=True,
+    )
+    sent: List[str] = []
+    cancelled: List[Llm] = []
+
+    async def send_chunk(content: str, variant_index: int) -> None:
+        sent.append(content)
+
+    async def fake_stream(model: Llm, callback: Callable[[str], Awaitable[None]]):
+        delay, text = streams[model]
+        try:
+            await asyncio.sleep(delay)
+            await callback(text)
+            return {"duration": delay, "code": text}
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+
+    def stream_model(model: Llm, *args: Any, **kwargs: Any) -> Any:
+        return fake_stream(model, args[-1])
+
+    stage._send_chunk = send_chunk  # type: ignore
+    stage._stream_model = stream_model  # type: ignore
+    stage._hedge_delay = lambda model: 0.05  # type: ignore
+    return stage, sent, cancelled
+
+
+async def run_hedged(stage: ParallelGenerationStage) -> Any:
+    return await stage._hedged_generation(
+        0, PRIMARY, [PRIMARY, FALLBACK], [], None  # type: ignore
+    )
+
+
+@pytest.mark.asyncio
+async def test_stalled_variant_is_hedged_and_the_loser_cancelled():
+    stage, sent, cancelled = make_stage(
+        {PRIMARY: (5, "primary"), FALLBACK: (0.01, "fallback")}
+    )
+
+    completion = await run_hedged(stage)
+    await asyncio.sleep(0)
+
+    assert completion["code"] == "fallback"
+    assert sent == ["fallback"]
+    assert cancelled == [PRIMARY]
+    # Telemetry for the variant is attributed to the model that answered
+    assert stage._hedge_winners == {0: FALLBACK}
+
+
+@pytest.mark.asyncio
+async def test_fast_variant_is_not_hedged():
+    stage, sent, cancelled = make_stage(
+        {PRIMARY: (0.01, "primary"), FALLBACK: (0.01, "fallback")}
+    )
+
+    completion = await run_hedged(stage)
+
+    assert completion["code"] == "primary"
+    assert sent == ["primary"]
+    assert cancelled == []
+
+
+@pytest.mark.asyncio
+async def test_primary_can_still_win_after_hedging():
+    stage, sent, cancelled = make_stage(
+        {PRIMARY: (0.08, "primary"), FALLBACK: (5, "fallback")}
+    )
+
+    completion = await run_hedged(stage)
+    await asyncio.sleep(0)
+
+    assert completion["code"] == "primary"
+    assert sent == ["primary"]
+    assert cancelled == [FALLBACK]
+    assert stage._hedge_winners == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_the_other_attempt():
+    stage, sent, _ = make_stage({PRIMARY: (0.1, "primary")})
+
+    async def failing_stream(callback: Callable[[str], Awaitable[None]]):
+        raise RuntimeError("provider down")
+
+    original = stage._stream_model
+
+    def stream_model(model: Llm, *args: Any, **kwargs: Any) -> Any:
+        if model == FALLBACK:
+            return failing_stream(args[-1])
+        return original(model, *args, **kwargs)
+
+    stage._stream_model = stream_model  # type: ignore
+
+    completion = await run_hedged(stage)
+
+    assert completion["code"] == "primary"
+    assert sent == ["primary"]
+
+
+OPENAI_MODEL = Llm.GPT_4_1_2025_04_14
+
+
+def authentication_error() -> openai.AuthenticationError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.AuthenticationError(
+        "Incorrect API key", response=httpx.Response(401, request=request), body=None
+    )
+
+
+def make_provider_stage(monkeypatch, claude_delay: float) -> ParallelGenerationStage:
+    """Stage using the real provider paths, with OpenAI rejecting the key"""
+
+    async def stream_openai_response(*args: Any, **kwargs: Any) -> Any:
+        raise authentication_error()
+
+    async def stream_claude_response(messages: Any, callback: Any, **kwargs: Any) -> Any:
+        await asyncio.sleep(claude_delay)
+        await callback("claude")
+        return {"duration": claude_delay, "code": "claude"}
+
+    monkeypatch.setattr(
+        "routes.generate_code.stream_openai_response", stream_openai_response
+    )
+    monkeypatch.setattr(
+        "routes.generate_code.stream_claude_response", stream_claude_response
+    )
+    stage = ParallelGenerationStage(
+        send_message=AsyncMock(),
+        openai_api_key="key",
+        openai_base_url=None,
+        anthropic_api_key="key",
+        should_generate_images=False,
+        vlm_temperature=0.0,
+        hedge_first_variant=True,
+    )
+    stage._hedge_delay = lambda model: 0.01  # type: ignore
+    stage._hedge_model = lambda model, variant_models: OPENAI_MODEL  # type: ignore
+    return stage
+
+
+def variant_errors(stage: ParallelGenerationStage) -> List[Any]:
+    return [
+        call.args
+        for call in stage.send_message.await_args_list  # type: ignore
+        if call.args[0] == "variantError"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_openai_hedge_does_not_report_an_error(monkeypatch):
+    stage = make_provider_stage(monkeypatch, claude_delay=0.05)
+    extracted_params = type("Params", (), {"generation_type": "create"})()
+
+    completion = await stage._hedged_generation(
+        0, PRIMARY, [PRIMARY, OPENAI_MODEL], [], extracted_params  # type: ignore
+    )
+
+    assert completion["code"] == "claude"
+    assert variant_errors(stage) == []
+
+
+@pytest.mark.asyncio
+async def test_openai_error_is_reported_once_when_the_race_fails(monkeypatch):
+    stage = make_provider_stage(monkeypatch, claude_delay=0.05)
+    stage._hedge_delay = lambda model: None  # type: ignore
+    extracted_params = type("Params", (), {"generation_type": "create"})()
+
+    with pytest.raises(VariantErrorAlreadySent):
+        await stage._hedged_generation(
+            0, OPENAI_MODEL, [OPENAI_MODEL, PRIMARY], [], extracted_params  # type: ignore
+        )
+
+    assert len(variant_errors(stage)) == 1
+    assert "Incorrect OpenAI key" in variant_errors(stage)[0][1]
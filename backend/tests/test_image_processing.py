@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_processing.cache import ImageEncodingCache
+from image_processing.executor import offloaded_tasks, run_image_task
+from image_processing.utils import base64_size, compress_jpeg_to_size, process_image
+
+
+def make_data_url(width: int, height: int, format: str = "PNG") -> str:
+    image = Image.new("RGB", (width, height), color=(200, 30, 30))
+    buffered = io.BytesIO()
+    image.save(buffered, format=format)
+    mime_type = "image/png" if format == "PNG" else "image/jpeg"
+    return f"data:{mime_type};base64," + base64.b64encode(buffered.getvalue()).decode()
+
+
+def test_small_image_is_passed_through():
+    data_url = make_data_url(100, 100)
+
+    media_type, base64_data = process_image(data_url)
+
+    assert media_type == "image/png"
+    assert base64_data == data_url.split(",")[1]
+
+
+def test_oversized_image_is_resized_to_jpeg():
+    data_url = make_data_url(8200, 100)
+
+    media_type, base64_data = process_image(data_url)
+
+    assert media_type == "image/jpeg"
+    image = Image.open(io.BytesIO(base64.b64decode(base64_data)))
+    assert max(image.size) < 8000
+
+
+@pytest.mark.asyncio
+async def test_run_image_task_offloads_and_counts():
+    tasks_before = offloaded_tasks.value(task="process_image")
+    data_url = make_data_url(50, 50)
+
+    result = await run_image_task(process_image, data_url)
+
+    assert result == process_image(data_url)
+    assert offloaded_tasks.value(task="process_image") == tasks_before + 1
+
+
+def noisy_image(width: int, height: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def test_base64_size_matches_encoding():
+    for length in range(0, 20):
+        assert base64_size(length) == len(base64.b64encode(b"x" * length))
+
+
+def test_compressor_returns_best_quality_that_fits():
+    img = noisy_image(400, 400)
+    full_size = base64_size(len(compress_jpeg_to_size(img, 10**9).data))
+    limit = full_size // 2
+
+    result = compress_jpeg_to_size(img, limit, downscale_threshold=None)
+
+    assert base64_size(len(result.data)) <= limit
+    assert 10 <= result.quality < 95
+    assert (result.width, result.height) == (400, 400)
+    # A binary search needs far fewer encodes than stepping quality by 5
+    assert result.encode_count <= 7
+
+
+def test_compressor_downscales_before_dropping_quality_too_far():
+    img = noisy_image(400, 400)
+    limit = base64_size(len(compress_jpeg_to_size(img, 10**9, max_quality=40).data)) // 2
+
+    result = compress_jpeg_to_size(img, limit, downscale_threshold=60)
+
+    assert base64_size(len(result.data)) <= limit
+    assert result.width < 400
+    assert result.quality >= 60
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = ImageEncodingCache(max_bytes=10)
+    cache.put("a", "raw", b"aaaa", 4)
+    cache.put("b", "raw", b"bbbb", 4)
+    assert cache.get("a", "raw") == b"aaaa"
+
+    cache.put("c", "raw", b"cccc", 4)
+
+    assert cache.get("b", "raw") is None
+    assert cache.get("a", "raw") == b"aaaa"
+    assert cache.stats()["bytes"] == 8
+
+
+@pytest.mark.asyncio
+async def test_cache_processes_each_image_once_across_variants():
+    cache = ImageEncodingCache(max_bytes=1024)
+    calls: list[str] = []
+
+    async def compute() -> str:
+        calls.append("computed")
+        await asyncio.sleep(0.01)
+        return "encoded"
+
+    results = await asyncio.gather(
+        *[cache.get_or_compute_async("digest", "claude", compute, len) for _ in range(4)]
+    )
+    results.append(await cache.get_or_compute_async("digest", "claude", compute, len))
+
+    assert results == ["encoded"] * 5
+    assert calls == ["computed"]
+    assert cache.stats()["hits"] == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_requester_does_not_cancel_shared_encoding():
+    cache = ImageEncodingCache(max_bytes=1024)
+    started = asyncio.Event()
+
+    async def compute() -> str:
+        started.set()
+        await asyncio.sleep(0.01)
+        return "encoded"
+
+    first = asyncio.create_task(cache.get_or_compute_async("digest", "claude", compute, len))
+    await started.wait()
+    second = asyncio.create_task(cache.get_or_compute_async("digest", "claude", compute, len))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "encoded"
+    assert first.cancelled()
+    assert cache.get("digest", "claude") == "encoded"
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from loop_monitor.core import (
+    LoopMonitor,
+    blocked_seconds,
+    loop_lag_seconds,
+    slow_callbacks,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def watched_monitor(clock: FakeClock, slow_callback_seconds: float) -> LoopMonitor:
+    """Monitor whose watchdog checks are run by hand on this thread"""
+    monitor = LoopMonitor(
+        interval=0.01,
+        warn_seconds=0.05,
+        slow_callback_seconds=slow_callback_seconds,
+        clock=clock,
+    )
+    monitor._loop_thread_id = threading.get_ident()
+    monitor._beat(clock.now)
+    return monitor
+
+
+def test_stall_is_reported_once_with_the_blocking_stack():
+    clock = FakeClock()
+    monitor = watched_monitor(clock, slow_callback_seconds=0.05)
+    slow_before = slow_callbacks.value()
+    blocked_before = blocked_seconds.value()
+
+    def block_the_loop() -> None:
+        clock.now = 0.3
+        monitor._check()
+        # Still the same stall
+        clock.now = 0.4
+        monitor._check()
+
+    block_the_loop()
+    monitor._beat(0.5)
+
+    assert slow_callbacks.value() == slow_before + 1
+    assert blocked_seconds.value() == blocked_before + 1
+    assert monitor.last_stack is not None
+    assert "block_the_loop" in monitor.last_stack
+
+
+def test_sampler_within_the_threshold_is_not_reported():
+    clock = FakeClock()
+    monitor = watched_monitor(clock, slow_callback_seconds=0.2)
+    slow_before = slow_callbacks.value()
+
+    for beat in range(1, 20):
+        clock.now = beat * 0.1
+        monitor._check()
+        monitor._beat(clock.now)
+
+    assert slow_callbacks.value() == slow_before
+    assert monitor.last_stack is None
+
+
+def block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_blocking_call_on_a_running_loop_is_measured():
+    monitor = LoopMonitor(interval=0.01, warn_seconds=0.05, slow_callback_seconds=0.05)
+    lag_before = loop_lag_seconds.sum()
+    slow_before = slow_callbacks.value()
+    blocked_before = blocked_seconds.value()
+
+    monitor.start()
+    await asyncio.sleep(0.03)
+    block_the_loop(0.3)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    # Other stalls (e.g. garbage collection) may be reported as well
+    assert loop_lag_seconds.sum() - lag_before >= 0.2
+    assert slow_callbacks.value() >= slow_before + 1
+    assert blocked_seconds.value() >= blocked_before + 1
+    assert monitor.last_stack is not None
+    assert "block_the_loop" in monitor.last_stack
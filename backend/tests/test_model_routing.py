@@ -0,0 +1,161 @@
+from typing import List
+
+from llm import Llm
+from routing.core import (
+    CircuitBreaker,
+    LatencyAwarePolicy,
+    ModelRouter,
+    StaticPolicy,
+    classify_error,
+    replay_trace,
+)
+from routing.telemetry import (
+    ModelTelemetry,
+    RequestOutcome,
+    append_to_trace,
+    load_trace,
+)
+
+GEMINI = Llm.GEMINI_3_FLASH_PREVIEW
+SONNET = Llm.CLAUDE_4_5_SONNET_2025_09_29
+OPUS = Llm.CLAUDE_4_5_OPUS_2025_11_01
+CANDIDATES = [GEMINI, SONNET, OPUS]
+
+
+def outcome(model: Llm, timestamp: float, ttft: float, **kwargs) -> RequestOutcome:
+    return RequestOutcome(
+        model=model.value,
+        timestamp=timestamp,
+        ttft=ttft,
+        duration=ttft + 10,
+        output_tokens=1000,
+        **kwargs,
+    )
+
+
+def make_router(policy=None, now=None) -> ModelRouter:
+    now = now or [0.0]
+    clock = lambda: now[0]
+    return ModelRouter(
+        policy or LatencyAwarePolicy(ttft_budget_seconds=5, min_samples=2),
+        ModelTelemetry(300, clock=clock),
+        CircuitBreaker(failure_threshold=3, cooldown_seconds=60, clock=clock),
+    )
+
+
+def test_without_telemetry_variants_cycle_in_configured_order():
+    router = make_router()
+
+    assert router.plan([SONNET, OPUS], 5) == [SONNET, OPUS, SONNET, OPUS, SONNET]
+
+
+def test_slow_model_is_left_out_of_the_plan():
+    router = make_router()
+    for t in range(3):
+        router.record(outcome(GEMINI, t, ttft=12))
+        router.record(outcome(SONNET, t, ttft=2))
+
+    assert router.plan(CANDIDATES, 4) == [SONNET, OPUS, SONNET, OPUS]
+    stats = router.telemetry.stats(GEMINI.value)
+    assert stats.ttft_p50 == 12
+    assert stats.tokens_per_second == 100
+
+
+def test_all_degraded_models_are_used_fastest_first():
+    router = make_router()
+    for t in range(3):
+        router.record(outcome(GEMINI, t, ttft=12))
+        router.record(outcome(SONNET, t, ttft=8))
+
+    assert router.plan([GEMINI, SONNET], 3) == [SONNET, GEMINI, SONNET]
+
+
+def test_rate_limited_model_is_skipped_until_it_recovers():
+    router = make_router()
+    router.record(outcome(GEMINI, 0, ttft=1, error=True, rate_limited=True))
+    assert GEMINI not in router.plan(CANDIDATES, 3)
+
+    router.record(outcome(GEMINI, 1, ttft=1))
+    assert router.plan(CANDIDATES, 3)[0] == GEMINI
+
+
+def test_degraded_model_is_probed_after_the_cooldown():
+    now = [0.0]
+    router = make_router(
+        policy=LatencyAwarePolicy(
+            ttft_budget_seconds=5, min_samples=2, degraded_cooldown_seconds=30
+        ),
+        now=now,
+    )
+    router.record(outcome(GEMINI, 0, ttft=1, error=True, rate_limited=True))
+    for t in range(2):
+        router.record(outcome(SONNET, t, ttft=1, error=True))
+
+    now[0] = 10
+    assert router.plan(CANDIDATES, 2) == [OPUS, OPUS]
+    # No traffic reached them, so they're tried again once the cooldown is over
+    now[0] = 31
+    assert router.plan(CANDIDATES, 3) == [GEMINI, SONNET, OPUS]
+
+
+def test_rate_limits_do_not_open_the_circuit_breaker():
+    router = make_router(policy=StaticPolicy())
+    for t in range(5):
+        router.record(outcome(SONNET, t, ttft=1, error=True, rate_limited=True))
+
+    assert router.breaker.allows("anthropic")
+
+
+def test_circuit_breaker_skips_failing_provider_until_cooldown():
+    now = [0.0]
+    router = make_router(policy=StaticPolicy(), now=now)
+    for t in range(3):
+        router.record(outcome(SONNET, t, ttft=1, error=True))
+
+    assert router.plan(CANDIDATES, 2) == [GEMINI, GEMINI]
+
+    # After the cooldown one trial request is let through; a failure reopens
+    now[0] = 63
+    assert router.plan(CANDIDATES, 3) == [GEMINI, SONNET, OPUS]
+    router.record(outcome(OPUS, 63, ttft=1, error=True))
+    assert router.plan(CANDIDATES, 2) == [GEMINI, GEMINI]
+
+    now[0] = 124
+    router.record(outcome(OPUS, 124, ttft=1))
+    assert router.plan(CANDIDATES, 3) == [GEMINI, SONNET, OPUS]
+
+
+def test_client_errors_do_not_count_against_provider():
+    class FakeError(Exception):
+        def __init__(self, status_code: int):
+            self.status_code = status_code
+
+    assert classify_error(FakeError(401)) == "client"
+    assert classify_error(FakeError(429)) == "rate_limited"
+    assert classify_error(FakeError(529)) == "failure"
+    assert classify_error(TimeoutError()) == "failure"
+
+
+def test_policies_can_be_compared_offline_on_a_recorded_trace(tmp_path):
+    trace_path = str(tmp_path / "trace.jsonl")
+    # Gemini degrades half way through the trace, then recovers
+    ttfts = [2, 2, 2, 14, 15, 16, 2, 2, 2, 2]
+    for t, ttft in enumerate(ttfts):
+        append_to_trace(trace_path, outcome(GEMINI, t * 60, ttft=ttft))
+        append_to_trace(trace_path, outcome(SONNET, t * 60 + 1, ttft=3))
+    with open(trace_path) as trace_file:
+        trace = load_trace(trace_file)
+
+    def first_variants(policy) -> List[Llm]:
+        decisions = replay_trace(
+            trace, [GEMINI, SONNET], 2, policy, window_seconds=150
+        )
+        return [decision.models[0] for decision in decisions[1::2]]
+
+    latency_aware = first_variants(
+        LatencyAwarePolicy(ttft_budget_seconds=5, min_samples=2)
+    )
+    static = first_variants(StaticPolicy())
+
+    assert static == [GEMINI] * 10
+    assert latency_aware == [GEMINI] * 4 + [SONNET] * 3 + [GEMINI] * 3
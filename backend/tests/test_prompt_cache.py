@@ -0,0 +1,118 @@
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from models.claude import record_claude_usage
+from models.openai_client import stream_openai_response
+from models.prompt_cache import (
+    EPHEMERAL,
+    add_claude_history_breakpoint,
+    cached_input_tokens,
+    claude_system_blocks,
+    input_tokens,
+    openai_prompt_cache_key,
+    split_static_prefix,
+)
+from prompts import assemble_imported_code_prompt, assemble_prompt
+from prompts.imported_code_prompts import IMPORTED_CODE_SYSTEM_PROMPTS
+
+
+def test_imported_code_is_split_from_the_shared_system_prompt():
+    messages = assemble_imported_code_prompt("<p>mine</p>", "html_tailwind")
+    system = str(messages[0]["content"])
+
+    static, rest = split_static_prefix(system)
+    assert static == IMPORTED_CODE_SYSTEM_PROMPTS["html_tailwind"]
+    assert rest.endswith("<p>mine</p>")
+
+    blocks = claude_system_blocks(system)
+    assert blocks[0] == {"type": "text", "text": static, "cache_control": EPHEMERAL}
+    assert "cache_control" not in blocks[1]
+
+
+def test_unknown_system_prompt_is_cached_whole():
+    assert claude_system_blocks("Custom prompt") == [
+        {"type": "text", "text": "Custom prompt", "cache_control": EPHEMERAL}
+    ]
+
+
+def test_history_breakpoint_goes_on_the_last_user_turn():
+    messages: List[Dict[str, Any]] = [
+        {"role": "user", "content": [{"type": "image"}, {"type": "text", "text": "a"}]},
+        {"role": "assistant", "content": "<html>"},
+        {"role": "user", "content": "Continue"},
+        {"role": "assistant", "content": "<html><body>"},
+    ]
+
+    add_claude_history_breakpoint(messages)
+
+    assert messages[2]["content"] == [
+        {"type": "text", "text": "Continue", "cache_control": EPHEMERAL}
+    ]
+    assert "cache_control" not in messages[0]["content"][-1]
+
+
+def test_openai_cache_key_only_depends_on_model_and_system_prompt():
+    first = assemble_prompt("data:image/png;base64,AAA", "html_tailwind")
+    second = assemble_prompt("data:image/png;base64,BBB", "html_tailwind")
+
+    assert openai_prompt_cache_key(first, "gpt-4.1") == openai_prompt_cache_key(
+        second, "gpt-4.1"
+    )
+    assert openai_prompt_cache_key(first, "gpt-4.1") != openai_prompt_cache_key(
+        first, "gpt-4o"
+    )
+    assert openai_prompt_cache_key(
+        assemble_prompt("data:image/png;base64,AAA", "react_tailwind"), "gpt-4.1"
+    ) != openai_prompt_cache_key(first, "gpt-4.1")
+
+
+def test_claude_usage_counts_cached_and_written_tokens():
+    total_before = input_tokens.value(provider="anthropic")
+    cached_before = cached_input_tokens.value(provider="anthropic")
+
+    record_claude_usage(
+        "claude",
+        SimpleNamespace(
+            input_tokens=100, cache_read_input_tokens=2000, cache_creation_input_tokens=50
+        ),
+    )
+
+    assert input_tokens.value(provider="anthropic") - total_before == 2150
+    assert cached_input_tokens.value(provider="anthropic") - cached_before == 2000
+
+
+@pytest.mark.asyncio
+async def test_openai_prompt_cache_key_is_sent_in_the_request_body(monkeypatch):
+    requests: List[Dict[str, Any]] = []
+
+    async def create(**params: Any) -> Any:
+        requests.append(params)
+        message = SimpleNamespace(content="<html></html>")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    @asynccontextmanager
+    async def openai(api_key: str, base_url: str | None):
+        yield SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+
+    monkeypatch.setattr("models.openai_client.provider_clients.openai", openai)
+    messages = assemble_imported_code_prompt("<p>mine</p>", "html_tailwind")
+
+    async def callback(content: str) -> None:
+        pass
+
+    for base_url in [None, "https://proxy.example/v1"]:
+        await stream_openai_response(
+            messages, "key", base_url, callback, "o1-2024-12-17", None
+        )
+
+    # The pinned SDK rejects unknown keyword arguments
+    assert "prompt_cache_key" not in requests[0]
+    assert requests[0]["extra_body"] == {
+        "prompt_cache_key": openai_prompt_cache_key(messages, "o1-2024-12-17")
+    }
+    assert "extra_body" not in requests[1]
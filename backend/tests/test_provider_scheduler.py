@@ -0,0 +1,205 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from models.scheduler import (
+    ProviderLimits,
+    ProviderScheduler,
+    QueueStatus,
+    TokenBucket,
+    current_client,
+    estimate_prompt_tokens,
+    queue_listener,
+)
+
+
+async def run_request(
+    scheduler: ProviderScheduler,
+    client: str,
+    name: str,
+    order: List[str],
+    release: asyncio.Event,
+    model: str = "model",
+) -> None:
+    current_client.set(client)
+    async with scheduler.slot("openai", model):
+        order.append(name)
+        await release.wait()
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_concurrency_and_reports_queue_position():
+    scheduler = ProviderScheduler({"openai": ProviderLimits(max_concurrency=1)})
+    statuses: List[QueueStatus] = []
+
+    async def listener(status: QueueStatus) -> None:
+        statuses.append(status)
+
+    async def queued_request(order: List[str], release: asyncio.Event) -> None:
+        queue_listener.set(listener)
+        await run_request(scheduler, "b", "second", order, release)
+
+    order: List[str] = []
+    release = asyncio.Event()
+    first = asyncio.create_task(run_request(scheduler, "a", "first", order, release))
+    await settle()
+    second = asyncio.create_task(queued_request(order, release))
+    await settle()
+
+    assert order == ["first"]
+    assert scheduler.stats("openai") == {"in_flight": 1, "queued": 1}
+    assert statuses[0].ahead == 0 and not statuses[0].started
+
+    release.set()
+    await asyncio.gather(first, second)
+
+    assert order == ["first", "second"]
+    assert statuses[-1].started
+    assert scheduler.stats("openai") == {"in_flight": 0, "queued": 0}
+
+
+@pytest.mark.asyncio
+async def test_scheduler_is_fair_across_clients():
+    scheduler = ProviderScheduler({"openai": ProviderLimits(max_concurrency=1)})
+    order: List[str] = []
+    releases = {name: asyncio.Event() for name in ["a1", "a2", "a3", "b1"]}
+
+    tasks = [
+        asyncio.create_task(run_request(scheduler, "a", name, order, releases[name]))
+        for name in ["a1", "a2", "a3"]
+    ]
+    await settle()
+    tasks.append(
+        asyncio.create_task(run_request(scheduler, "b", "b1", order, releases["b1"]))
+    )
+    await settle()
+
+    for name in ["a1", "b1", "a2", "a3"]:
+        assert order[-1] == name
+        releases[name].set()
+        await settle()
+
+    await asyncio.gather(*tasks)
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_concurrency_per_model():
+    scheduler = ProviderScheduler(
+        {"openai": ProviderLimits(max_concurrency=4)}, model_max_concurrency=1
+    )
+    order: List[str] = []
+    release = asyncio.Event()
+    tasks = [
+        asyncio.create_task(
+            run_request(scheduler, "a", "slow-1", order, release, model="slow")
+        ),
+        asyncio.create_task(
+            run_request(scheduler, "a", "slow-2", order, release, model="slow")
+        ),
+        asyncio.create_task(
+            run_request(scheduler, "a", "fast-1", order, release, model="fast")
+        ),
+    ]
+    await settle()
+
+    # The second request for the busy model doesn't hold up other models
+    assert order == ["slow-1", "fast-1"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == ["slow-1", "fast-1", "slow-2"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = ProviderScheduler({"openai": ProviderLimits(max_concurrency=1)})
+    order: List[str] = []
+    release = asyncio.Event()
+    first = asyncio.create_task(run_request(scheduler, "a", "first", order, release))
+    await settle()
+    waiting = asyncio.create_task(run_request(scheduler, "b", "never", order, release))
+    await settle()
+
+    waiting.cancel()
+    await settle()
+    assert scheduler.stats("openai") == {"in_flight": 1, "queued": 0}
+
+    release.set()
+    await first
+    assert order == ["first"]
+    assert scheduler.stats("openai") == {"in_flight": 0, "queued": 0}
+
+
+@pytest.mark.asyncio
+async def test_scheduler_waits_for_rate_budget():
+    scheduler = ProviderScheduler(
+        {"openai": ProviderLimits(max_concurrency=8, requests_per_minute=60)}
+    )
+    # Start with an empty bucket that refills one request per second
+    scheduler._budget_delay("openai", 0)
+    scheduler._request_buckets["openai"].tokens = 0.98
+
+    order: List[str] = []
+    release = asyncio.Event()
+    release.set()
+    task = asyncio.create_task(run_request(scheduler, "a", "limited", order, release))
+    await settle()
+    assert order == []
+
+    await asyncio.wait_for(task, timeout=1)
+    assert order == ["limited"]
+
+
+@pytest.mark.asyncio
+async def test_zero_concurrency_limits_mean_unlimited():
+    scheduler = ProviderScheduler(
+        {"openai": ProviderLimits(max_concurrency=0)}, model_max_concurrency=0
+    )
+    order: List[str] = []
+    release = asyncio.Event()
+    tasks = [
+        asyncio.create_task(run_request(scheduler, "a", str(index), order, release))
+        for index in range(50)
+    ]
+    await settle()
+
+    assert len(order) == 50
+    assert scheduler.stats("openai") == {"in_flight": 50, "queued": 0}
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+def test_token_bucket_refills_over_time():
+    now = [0.0]
+    bucket = TokenBucket(600, clock=lambda: now[0])
+
+    bucket.take(600)
+    assert bucket.delay(100) == pytest.approx(10)
+
+    now[0] = 5
+    assert bucket.delay(100) == pytest.approx(5)
+    # Requests larger than the bucket only wait for a full bucket
+    now[0] = 60
+    assert bucket.delay(10_000) == 0
+
+
+def test_estimate_prompt_tokens_counts_text_and_images():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": "data:image/png;base64,"}},
+                {"type": "text", "text": "y" * 40},
+            ],
+        },
+    ]
+
+    assert estimate_prompt_tokens(messages) == 110 + 1500
@@ -0,0 +1,160 @@
+import os
+from types import SimpleNamespace
+from typing import Any, List
+from unittest.mock import AsyncMock
+
+import pytest
+
+from llm import Llm
+from response_cache.core import ResponseCache, cache_key, replay_completion
+from routes.generate_code import ParallelGenerationStage
+
+
+def messages(image: str) -> List[Any]:
+    return [
+        {"role": "system", "content": "You are an expert"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image, "detail": "high"}},
+                {"type": "text", "text": "Generate code"},
+            ],
+        },
+    ]
+
+
+def test_cache_key_is_canonical_and_hashes_images():
+    key = cache_key("model", "html_tailwind", 0.0, messages("data:image/png;base64,AAA"))
+
+    assert key == cache_key(
+        "model", "html_tailwind", 0.0, messages("data:image/png;base64,AAA")
+    )
+    assert key != cache_key(
+        "model", "html_tailwind", 0.0, messages("data:image/png;base64,BBB")
+    )
+    assert key != cache_key("model", "react_tailwind", 0.0, messages("data:image/png;base64,AAA"))
+    assert key != cache_key(
+        "model", "html_tailwind", 0.0, messages("data:image/png;base64,AAA"), variant=1
+    )
+    assert key != cache_key(
+        "model",
+        "html_tailwind",
+        0.0,
+        messages("data:image/png;base64,AAA"),
+        base_url="https://proxy.example/v1",
+    )
+
+
+def test_memory_tier_spills_to_disk_and_survives_restart(tmp_path):
+    path = os.path.join(tmp_path, "cache.sqlite3")
+    cache = ResponseCache(max_memory_bytes=10, path=path, max_disk_bytes=1000)
+    cache.put("a", "x" * 8)
+    cache.put("b", "y" * 8)
+
+    # "a" no longer fits in memory but is still on disk
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a") == "x" * 8
+    assert cache.get("missing") is None
+    assert cache.stats()["hit_ratio"] == pytest.approx(0.5)
+    cache.close()
+
+    reopened = ResponseCache(path=path)
+    assert reopened.get("b") == "y" * 8
+    reopened.close()
+
+
+def test_entries_expire_and_disk_stays_within_budget(tmp_path):
+    now = [1000.0]
+    path = os.path.join(tmp_path, "cache.sqlite3")
+    cache = ResponseCache(
+        max_memory_bytes=0, path=path, max_disk_bytes=20, ttl_seconds=60, clock=lambda: now[0]
+    )
+    cache.put("old", "o" * 10)
+    now[0] += 1
+    cache.put("newer", "n" * 10)
+    now[0] += 1
+    cache.put("newest", "w" * 10)
+
+    assert cache.get("old") is None
+    assert cache.get("newer") == "n" * 10
+    assert cache.stats()["disk_bytes"] == 20
+
+    now[0] += 120
+    assert cache.get("newest") is None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_replay_streams_in_chunks():
+    chunks: List[str] = []
+
+    async def callback(content: str) -> None:
+        chunks.append(content)
+
+    await replay_completion("a" * 150, callback, chars_per_second=1_000_000)
+
+    assert [len(chunk) for chunk in chunks] == [64, 64, 22]
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_replays_without_calling_the_provider():
+    cache = ResponseCache(path="")
+    stage = ParallelGenerationStage(
+        send_message=AsyncMock(),
+        openai_api_key=None,
+        openai_base_url=None,
+        anthropic_api_key="key",
+        should_generate_images=False,
+        vlm_temperature=0.0,
+        cache=cache,
+    )
+    extracted_params = SimpleNamespace(generation_type="create", stack="html_tailwind")
+    model = Llm.CLAUDE_4_5_SONNET_2025_09_29
+    calls: List[str] = []
+
+    async def generation() -> Any:
+        calls.append("provider")
+        return {"duration": 1.0, "code": "<html></html>"}
+
+    first = await stage._cached_generation(
+        0, model, [], extracted_params, generation()  # type: ignore
+    )
+    second = await stage._cached_generation(
+        0, model, [], extracted_params, generation()  # type: ignore
+    )
+
+    assert calls == ["provider"]
+    assert first["code"] == second["code"] == "<html></html>"
+    assert stage._cache_hits == {0}
+    stage.send_message.assert_awaited()  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_hedged_completion_is_stored_under_the_winning_model():
+    cache = ResponseCache(path="")
+    stage = ParallelGenerationStage(
+        send_message=AsyncMock(),
+        openai_api_key=None,
+        openai_base_url=None,
+        anthropic_api_key="key",
+        should_generate_images=False,
+        vlm_temperature=0.0,
+        cache=cache,
+    )
+    extracted_params = SimpleNamespace(generation_type="create", stack="html_tailwind")
+    primary = Llm.CLAUDE_4_5_SONNET_2025_09_29
+    fallback = Llm.GEMINI_3_FLASH_PREVIEW
+
+    async def hedged_generation() -> Any:
+        stage._hedge_winners[0] = fallback
+        return {"duration": 1.0, "code": "<html>fallback</html>"}
+
+    await stage._cached_generation(
+        0, primary, [], extracted_params, hedged_generation()  # type: ignore
+    )
+
+    def key(model: Llm) -> str:
+        return stage._completion_cache_key(0, model, [], extracted_params)  # type: ignore
+
+    assert cache.get(key(primary)) is None
+    assert cache.get(key(fallback)) == "<html>fallback</html>"
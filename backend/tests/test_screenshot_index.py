@@ -0,0 +1,122 @@
+import base64
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from image_processing.hashing import hamming_distance
+from screenshot_index.core import (
+    MultiIndexHash,
+    ScreenshotHash,
+    ScreenshotIndex,
+    screenshot_hash,
+)
+
+
+def data_url(image: Image.Image) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def page(offset: int, text: str = "") -> Image.Image:
+    image = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 400, 40), fill="navy")
+    for row in range(5):
+        top = 60 + row * 45 - offset
+        draw.rectangle((20, top, 380, top + 25), fill="gray")
+        draw.text((30, top + 8), text, fill="black")
+    return image
+
+
+def shot(coarse: int, detail: int = 0) -> ScreenshotHash:
+    return ScreenshotHash(coarse, detail)
+
+
+def test_multi_index_hash_matches_brute_force_search():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    # Plant neighbours at every distance up to the radius and just beyond it
+    hashes += [hashes[0] ^ ((1 << bits) - 1) for bits in range(1, 7)]
+    index = MultiIndexHash(radius=5)
+    for key, value in enumerate(hashes):
+        index.add(key, value, value)
+
+    found = sorted(item for _, item in index.search(hashes[0]))
+    expected = sorted(value for value in hashes if hamming_distance(hashes[0], value) <= 5)
+    assert found == expected
+    assert [distance for distance, _ in index.search(hashes[0])] == [0, 1, 2, 3, 4, 5]
+
+    index.remove(0, hashes[0])
+    assert index.search(hashes[0])[0][0] == 1
+
+
+def test_index_returns_nearest_html_for_the_same_stack():
+    index = ScreenshotIndex(max_distance=4, max_detail_distance=2)
+    index.add(shot(0b1111), "html_tailwind", "<html>near</html>")
+    index.add(shot(0b0000), "react_tailwind", "<html>other stack</html>")
+
+    match = index.nearest(shot(0b0111), "html_tailwind")
+    assert match is not None
+    assert (match.html, match.distance) == ("<html>near</html>", 1)
+
+    assert index.nearest(shot(0b1111_0000_0000), "html_tailwind") is None
+    assert index.nearest(shot(0b0111), "vue_tailwind") is None
+
+
+def test_index_requires_matching_detail_hashes():
+    index = ScreenshotIndex(max_distance=4, max_detail_distance=2)
+    index.add(shot(0b1111, detail=0b0000), "html_tailwind", "<p>theirs</p>")
+
+    # Same layout, different content
+    assert index.nearest(shot(0b1111, detail=0b0111), "html_tailwind") is None
+
+    # Adding it doesn't overwrite the other page's HTML
+    index.add(shot(0b1111, detail=0b0111), "html_tailwind", "<p>mine</p>")
+    assert len(index) == 2
+    match = index.nearest(shot(0b1111, detail=0b0001), "html_tailwind")
+    assert match is not None and match.html == "<p>theirs</p>"
+
+
+def test_index_evicts_least_recently_matched_entries():
+    index = ScreenshotIndex(max_distance=0, max_detail_distance=0, max_entries=2)
+    index.add(shot(1), "html_tailwind", "<p>1</p>")
+    index.add(shot(2), "html_tailwind", "<p>2</p>")
+    assert index.nearest(shot(1), "html_tailwind") is not None
+    index.add(shot(3), "html_tailwind", "<p>3</p>")
+
+    assert len(index) == 2
+    assert index.nearest(shot(2), "html_tailwind") is None
+    assert index.nearest(shot(1), "html_tailwind") is not None
+    # Re-adding the same screenshot replaces its HTML instead of growing the index
+    index.add(shot(3), "html_tailwind", "<p>3 again</p>")
+    assert len(index) == 2
+    match = index.nearest(shot(3), "html_tailwind")
+    assert match is not None and match.html == "<p>3 again</p>"
+
+
+def test_scrolled_screenshot_hashes_close_to_the_original():
+    original = screenshot_hash(data_url(page(0)))
+    scrolled = screenshot_hash(data_url(page(3)))
+    different = screenshot_hash(data_url(page(0).rotate(90)))
+
+    assert hamming_distance(original.coarse, scrolled.coarse) < hamming_distance(
+        original.coarse, different.coarse
+    )
+
+
+def test_same_layout_with_other_text_is_not_offered():
+    index = ScreenshotIndex()
+    acme = screenshot_hash(data_url(page(0, "Acme invoices")))
+    index.add(acme, "html_tailwind", "<p>acme</p>")
+
+    same_page = index.nearest(
+        screenshot_hash(data_url(page(2, "Acme invoices"))), "html_tailwind"
+    )
+    other_page = index.nearest(
+        screenshot_hash(data_url(page(0, "Payroll for Jane Doe"))), "html_tailwind"
+    )
+
+    assert same_page is not None and same_page.html == "<p>acme</p>"
+    assert other_page is None
@@ -0,0 +1,187 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from routes.generate_code import (
+    DisconnectMonitorMiddleware,
+    PipelineContext,
+    SessionMiddleware,
+    WebSocketCommunicator,
+)
+from sessions.core import ReplayBuffer, ResumeError, SessionStore, session_store
+
+
+class FakeWebSocket:
+    def __init__(self, incoming: List[Dict[str, Any]] | None = None):
+        self.frames: List[Dict[str, Any]] = []
+        self.incoming = list(incoming or [])
+        self.gone = asyncio.Event()
+        self.closed = False
+        self.close_code: int | None = None
+
+    async def send_text(self, text: str) -> None:
+        self.frames.append(json.loads(text))
+
+    async def send_json(self, data: Any) -> None:
+        self.frames.append(data)
+
+    async def receive_json(self) -> Dict[str, Any]:
+        return self.incoming.pop(0)
+
+    async def receive(self) -> Dict[str, Any]:
+        if self.incoming:
+            return {"type": "websocket.receive", "text": json.dumps(self.incoming.pop(0))}
+        await self.gone.wait()
+        return {"type": "websocket.disconnect", "code": 1001}
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+        self.close_code = code
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_replay_buffer_refuses_resume_across_evicted_frames():
+    buffer = ReplayBuffer(max_bytes=10)
+    buffer.append(1, "aaaa")
+    buffer.append(2, "bbbb")
+    buffer.append(3, "cccc")
+
+    assert buffer.bytes == 8
+    assert buffer.frames_after(1) == [(2, "bbbb"), (3, "cccc")]
+    with pytest.raises(ResumeError):
+        buffer.frames_after(0)
+
+    assert buffer.ack(2) == 4
+    assert buffer.frames_after(2) == [(3, "cccc")]
+
+
+def test_store_evicts_expired_and_oldest_sessions():
+    store = SessionStore(max_bytes=10, buffer_max_bytes=10, ttl_seconds=0)
+    first = store.create()
+    second = store.create()
+    first.record(0, first.next_seq(), "x" * 6)
+    second.record(0, second.next_seq(), "y" * 6)
+
+    # Over the store budget: the session that changed least recently goes
+    assert store.get(first.id) is None
+    assert first.evicted
+    assert store.total_bytes == 6
+
+    second.finish()
+    assert store.get(second.id) is None
+    assert store.total_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_missed_frames_without_regenerating():
+    old_socket = FakeWebSocket()
+    context = PipelineContext(websocket=old_socket)  # type: ignore
+    comm = context.ws_comm = WebSocketCommunicator(old_socket, flush_interval=0)  # type: ignore
+    session = session_store.create()
+    await comm.start_session(session)
+    generated = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def generation() -> None:
+        await comm.send_message("chunk", "<html>", 0, 0)
+        await comm.send_message("chunk", "<body>", 1, 0)
+        generated.set()
+        await finish.wait()
+        await comm.send_message("setCode", "<html></html>", 0, 0)
+
+    async def run_generation() -> None:
+        try:
+            await DisconnectMonitorMiddleware().process(context, generation)
+        finally:
+            await comm.close()
+
+    task = asyncio.create_task(run_generation())
+    await generated.wait()
+    assert [frame["seq"] for frame in old_socket.frames[1:]] == [1, 2]
+
+    # The client drops after seeing the first chunk; the generation carries on
+    old_socket.gone.set()
+    await settle()
+    assert comm.detached
+    await comm.send_message("chunk", "</body>", 1, 0)
+    assert len(old_socket.frames) == 3
+
+    new_socket = FakeWebSocket(
+        [{"type": "resume", "sessionId": session.id, "lastSeq": 1}]
+    )
+    resume_context = PipelineContext(websocket=new_socket)  # type: ignore
+    resume_context.ws_comm = WebSocketCommunicator(new_socket)  # type: ignore
+    resume = asyncio.create_task(
+        SessionMiddleware().process(resume_context, generation)
+    )
+    await settle()
+
+    assert [frame["value"] for frame in new_socket.frames] == ["<body>", "</body>"]
+    assert not task.done()
+
+    finish.set()
+    await asyncio.wait_for(asyncio.gather(task, resume), timeout=1)
+    assert new_socket.frames[-1]["type"] == "setCode"
+    assert new_socket.closed
+
+
+@pytest.mark.asyncio
+async def test_newer_resume_closes_the_connection_it_replaces():
+    first_socket = FakeWebSocket()
+    comm = WebSocketCommunicator(first_socket, flush_interval=0)  # type: ignore
+    await comm.start_session(session_store.create())
+    await comm.send_message("chunk", "<html>", 0, 0)
+
+    second_socket = FakeWebSocket()
+    assert await comm.reattach(second_socket, 0) == 1  # type: ignore
+    third_socket = FakeWebSocket()
+    assert await comm.reattach(third_socket, 0) == 1  # type: ignore
+    await comm.send_message("chunk", "<body>", 0, 0)
+
+    assert first_socket.close_code == second_socket.close_code == 4333
+    assert not third_socket.closed
+    assert [frame["value"] for frame in second_socket.frames] == ["<html>"]
+    assert [frame["value"] for frame in third_socket.frames] == ["<html>", "<body>"]
+
+
+@pytest.mark.asyncio
+async def test_session_finishes_after_the_last_chunks_are_buffered():
+    comm = WebSocketCommunicator(FakeWebSocket(), flush_interval=10)  # type: ignore
+    session = session_store.create()
+    await comm.start_session(session)
+    comm._detach()
+    await comm.send_message("chunk", "<html>", 0, 0)
+    buffered_at_finish: List[int] = []
+    finish = session.finish
+
+    def record_finish() -> None:
+        buffered_at_finish.append(len(session.frames_after(0)))
+        finish()
+
+    session.finish = record_finish  # type: ignore
+
+    await comm.close()
+
+    assert buffered_at_finish == [1]
+    assert session.finished.is_set() and session.closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_resume_of_unknown_session_is_an_error():
+    websocket = FakeWebSocket([{"type": "resume", "sessionId": "missing", "lastSeq": 0}])
+    context = PipelineContext(websocket=websocket)  # type: ignore
+    context.ws_comm = WebSocketCommunicator(websocket)  # type: ignore
+
+    async def generation() -> None:
+        raise AssertionError("a resume never starts a new generation")
+
+    await SessionMiddleware().process(context, generation)
+
+    assert websocket.frames[-1]["type"] == "error"
+    assert websocket.closed
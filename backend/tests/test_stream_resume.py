@@ -0,0 +1,144 @@
+from typing import Any, Awaitable, Callable, List
+
+import pytest
+
+from models.resume import OverlapTrimmer, continuation_messages, stream_with_resume
+
+PAGE = "<html><body>" + "".join(
+    f"<div class='row-{i}'>Row {i}</div>" for i in range(40)
+) + "</body></html>"
+
+MESSAGES: List[Any] = [
+    {"role": "system", "content": "system"},
+    {"role": "user", "content": "make a page"},
+]
+
+
+class FlakyProvider:
+    """Local stand-in for a provider whose streams drop part way
+
+    Each call streams PAGE (or the rest of it, after the partial output found
+    in a continuation request) in small chunks and fails after `drop_after`
+    characters. A continuation repeats `overlap` characters before going on,
+    like models often do.
+    """
+
+    def __init__(self, drop_after: List[int], overlap: int = 0, error=None):
+        self.drop_after = drop_after
+        self.overlap = overlap
+        self.error = error or ConnectionError("stream dropped")
+        self.requests: List[List[Any]] = []
+
+    async def stream(
+        self, messages: List[Any], callback: Callable[[str], Awaitable[None]]
+    ) -> Any:
+        self.requests.append(messages)
+        assistant = [m for m in messages if m["role"] == "assistant"]
+        offset = len(assistant[-1]["content"]) if assistant else 0
+        text = PAGE[max(0, offset - self.overlap if offset else 0) :]
+        drop = (
+            self.drop_after[len(self.requests) - 1]
+            if len(self.requests) <= len(self.drop_after)
+            else None
+        )
+
+        sent = 0
+        for i in range(0, len(text), 7):
+            chunk = text[i : i + 7]
+            if drop is not None and sent + len(chunk) > drop:
+                raise self.error
+            await callback(chunk)
+            sent += len(chunk)
+        return {"duration": 0.1, "code": text}
+
+
+async def no_sleep(delay: float) -> None:
+    pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefill", [True, False])
+async def test_dropped_stream_is_resumed_and_spliced(prefill: bool):
+    provider = FlakyProvider(drop_after=[200, 300], overlap=40)
+    streamed: List[str] = []
+
+    async def callback(text: str) -> None:
+        streamed.append(text)
+
+    completion = await stream_with_resume(
+        provider.stream, MESSAGES, callback, prefill=prefill, sleep=no_sleep
+    )
+
+    assert completion["code"] == PAGE
+    assert "".join(streamed) == PAGE
+    assert len(provider.requests) == 3
+    continuation = provider.requests[1]
+    assert continuation[: len(MESSAGES)] == MESSAGES
+    if prefill:
+        assert continuation[-1]["role"] == "assistant"
+        assert PAGE.startswith(continuation[-1]["content"])
+    else:
+        assert continuation[-2]["role"] == "assistant"
+        assert continuation[-1]["role"] == "user"
+
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded_with_jittered_backoff():
+    provider = FlakyProvider(drop_after=[10, 10, 10, 10])
+    delays: List[float] = []
+
+    async def record_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    async def callback(text: str) -> None:
+        pass
+
+    with pytest.raises(ConnectionError):
+        await stream_with_resume(
+            provider.stream,
+            MESSAGES,
+            callback,
+            prefill=True,
+            max_retries=2,
+            backoff_seconds=1,
+            sleep=record_sleep,
+        )
+
+    assert len(provider.requests) == 3
+    assert 0.5 <= delays[0] <= 1.5
+    assert 1 <= delays[1] <= 3
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    class AuthError(Exception):
+        status_code = 401
+
+    provider = FlakyProvider(drop_after=[0], error=AuthError())
+
+    async def callback(text: str) -> None:
+        pass
+
+    with pytest.raises(AuthError):
+        await stream_with_resume(
+            provider.stream, MESSAGES, callback, prefill=True, sleep=no_sleep
+        )
+    assert len(provider.requests) == 1
+
+
+def test_overlap_trimmer_drops_repeated_prefix_only():
+    trimmer = OverlapTrimmer("<div class='hero'>Welcome</div>\n")
+    assert trimmer.feed("Welcome</div>\n<foot") == ""
+    assert trimmer.feed("er>Contact</footer>") == "<footer>Contact</footer>"
+    assert trimmer.feed(" more") == " more"
+
+    # Short coincidental matches are kept
+    trimmer = OverlapTrimmer("</p>")
+    assert trimmer.feed(">") == ""
+    assert trimmer.flush() == ">"
+
+
+def test_prefill_continuation_strips_trailing_whitespace():
+    messages = continuation_messages(MESSAGES, "<div>\n  ", prefill=True)
+
+    assert messages[-1] == {"role": "assistant", "content": "<div>"}
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from typing import Awaitable, Callable
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics.core import counter, histogram, render_prometheus
+from routes import metrics
+from routes.generate_code import Middleware, Pipeline, PipelineContext
+import tracing.core
+from tracing.core import RequestTrace, stage_seconds
+
+
+def test_histogram_renders_cumulative_buckets():
+    latency = histogram(
+        "test_tracing_latency_seconds", "Test latency", ("stage",), buckets=(0.1, 1)
+    )
+    for value in [0.05, 0.5, 0.5, 3]:
+        latency.observe(value, stage='a"b')
+
+    text = render_prometheus()
+
+    assert "# TYPE test_tracing_latency_seconds histogram" in text
+    assert 'test_tracing_latency_seconds_bucket{stage="a\\"b",le="0.1"} 1' in text
+    assert 'test_tracing_latency_seconds_bucket{stage="a\\"b",le="1"} 3' in text
+    assert 'test_tracing_latency_seconds_bucket{stage="a\\"b",le="+Inf"} 4' in text
+    assert 'test_tracing_latency_seconds_sum{stage="a\\"b"} 4.05' in text
+    assert 'test_tracing_latency_seconds_count{stage="a\\"b"} 4' in text
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    counter("test_tracing_requests_total", "Test requests").inc(3)
+    app = FastAPI()
+    app.include_router(metrics.router)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "test_tracing_requests_total 3" in response.text
+
+
+class SleepMiddleware(Middleware):
+    def __init__(self, before: float, after: float = 0):
+        self.before = before
+        self.after = after
+
+    async def process(
+        self, context: PipelineContext, next_func: Callable[[], Awaitable[None]]
+    ) -> None:
+        await asyncio.sleep(self.before)
+        await next_func()
+        await asyncio.sleep(self.after)
+
+
+class OuterMiddleware(SleepMiddleware):
+    pass
+
+
+class InnerMiddleware(SleepMiddleware):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_pipeline_records_each_stage_without_its_downstream_time(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(tracing.core, "PIPELINE_TRACE_DIR", str(tmp_path))
+    pipeline = Pipeline()
+    pipeline.use(OuterMiddleware(0.02, after=0.02)).use(InnerMiddleware(0.1))
+    inner_before = stage_seconds.value(stage="Inner")
+
+    await pipeline.execute(None)  # type: ignore
+
+    assert stage_seconds.value(stage="Inner") == inner_before + 1
+    [trace_path] = tmp_path.iterdir()
+    with open(trace_path) as trace_file:
+        spans = json.load(trace_file)["spans"]
+    assert [span["name"] for span in spans] == ["Outer", "Inner"]
+    assert spans[1]["duration"] >= 0.1
+    assert 0.04 <= spans[0]["duration"] < 0.1
+
+
+def test_variant_trace_derives_tokens_per_second():
+    trace = RequestTrace(directory="unused")
+
+    trace.variant(0, "model", 0, 12, queue_wait=1, ttft=1, output_tokens=500, error=False)
+
+    assert trace.spans[0]["tokens_per_second"] == pytest.approx(50)
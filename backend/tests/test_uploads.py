@@ -0,0 +1,137 @@
+import base64
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.uploads
+import uploads.core
+from uploads.core import UploadError, UploadStore, resolve_image_url
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> UploadStore:
+    store = UploadStore(
+        directory=str(tmp_path / "uploads"),
+        max_bytes=1024,
+        ttl_seconds=60,
+        max_total_bytes=2048,
+    )
+    monkeypatch.setattr(routes.uploads, "upload_store", store)
+    monkeypatch.setattr(uploads.core, "upload_store", store)
+    return store
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(routes.uploads.router)
+    return TestClient(app)
+
+
+def chunked(data: bytes, size: int = 100):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def test_upload_streams_to_disk(store, client):
+    response = client.post(
+        "/uploads", content=chunked(b"x" * 1000), headers={"content-type": "video/mp4"}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["url"] == f"upload:{body['id']}"
+    assert body["size"] == 1000
+    upload = store.get(body["url"])
+    assert upload.media_type == "video/mp4"
+    assert os.path.getsize(upload.path) == 1000
+    assert store.total_bytes == 1000
+
+
+def test_upload_over_the_cap_is_rejected_without_leaving_a_file(store, client):
+    response = client.post(
+        "/uploads", content=chunked(b"x" * 2000), headers={"content-type": "video/mp4"}
+    )
+
+    assert response.status_code == 413
+    assert os.listdir(store.directory) == []
+    assert store.total_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_failure_to_open_the_file_is_not_masked(store, monkeypatch):
+    def failing_open(*args, **kwargs):
+        raise OSError(24, "Too many open files")
+
+    async def chunks():
+        yield b"x" * 100
+
+    monkeypatch.setattr(uploads.core, "open", failing_open, raising=False)
+
+    with pytest.raises(OSError) as exc_info:
+        await store.save_stream(chunks(), "video/mp4")
+    assert exc_info.value.errno == 24
+    assert store.total_bytes == 0
+
+
+def test_uploads_are_rejected_once_storage_is_full(store, client):
+    for _ in range(2):
+        response = client.post(
+            "/uploads", content=chunked(b"x" * 1000), headers={"content-type": "video/mp4"}
+        )
+        assert response.status_code == 200
+
+    # Streamed without a Content-Length, so only the running total can stop it
+    response = client.post(
+        "/uploads", content=chunked(b"x" * 100), headers={"content-type": "video/mp4"}
+    )
+    assert response.status_code == 507
+    assert store.total_bytes == 2000
+    assert len(os.listdir(store.directory)) == 2
+
+    response = client.post("/uploads", content=b"x" * 100)
+    assert response.status_code == 507
+
+
+def test_malformed_content_length_is_a_bad_request(store, client):
+    response = client.post(
+        "/uploads", content=b"data", headers={"content-length": "four"}
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_image_references_resolve_to_data_urls(store, client):
+    url = client.post(
+        "/uploads", content=b"\x89PNG", headers={"content-type": "image/png"}
+    ).json()["url"]
+
+    assert await resolve_image_url(url) == "data:image/png;base64," + base64.b64encode(
+        b"\x89PNG"
+    ).decode()
+    assert await resolve_image_url("data:image/png;base64,AAAA") == "data:image/png;base64,AAAA"
+
+
+@pytest.mark.asyncio
+async def test_non_image_uploads_are_not_inlined(store, client):
+    url = client.post(
+        "/uploads", content=b"<svg/>", headers={"content-type": "text/html"}
+    ).json()["url"]
+
+    with pytest.raises(UploadError):
+        await resolve_image_url(url)
+
+
+def test_expired_uploads_are_deleted(store, client):
+    url = client.post("/uploads", content=b"data").json()["url"]
+    upload = store.get(url)
+    store.ttl_seconds = -1
+
+    store.evict_expired()
+
+    with pytest.raises(UploadError):
+        store.get(url)
+    assert not os.path.exists(upload.path)
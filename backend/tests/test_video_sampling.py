@@ -0,0 +1,133 @@
+import subprocess
+
+import imageio_ffmpeg  # type: ignore
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from video.frame_selection import FrameSelector
+from video.utils import sample_frame_indices, sample_video_frames
+
+
+FPS = 30
+
+
+def write_video(path: str, frames: list[np.ndarray]) -> None:
+    height, width = frames[0].shape[:2]
+    writer = imageio_ffmpeg.write_frames(path, (width, height), fps=FPS, codec="libx264")
+    writer.send(None)
+    for frame in frames:
+        writer.send(frame.tobytes())
+    writer.close()
+
+
+def write_counter_video(path: str, num_frames: int) -> None:
+    """Each frame's gray level encodes its index, so sampled frames can be checked"""
+    write_video(
+        path,
+        [np.full((48, 64, 3), index * 2 % 256, dtype=np.uint8) for index in range(num_frames)],
+    )
+
+
+def scene(seed: int) -> np.ndarray:
+    """A static 'page' of coarse random blocks"""
+    blocks = np.random.default_rng(seed).integers(0, 255, size=(6, 8, 3), dtype=np.uint8)
+    return np.kron(blocks, np.ones((16, 16, 1), dtype=np.uint8))
+
+
+@pytest.fixture
+def counter_video(tmp_path) -> str:
+    path = str(tmp_path / "counter.mp4")
+    write_counter_video(path, num_frames=4 * FPS)
+    return path
+
+
+def test_sample_frame_indices_spreads_target_over_video():
+    assert sample_frame_indices(100, 20) == list(range(0, 100, 5))
+    assert sample_frame_indices(7, 20) == list(range(7))
+
+
+def test_only_sampled_frames_are_read(counter_video):
+    sample = sample_video_frames(counter_video, target_num_screenshots=5, dedup_threshold=0)
+
+    assert sample.frame_indices == [0, 25, 50, 75, 100]
+    assert sample.frames_read == 5
+    assert sample.total_frames == 121
+    levels = [int(np.asarray(image)[0, 0, 0]) for image in sample.images]
+    assert levels == pytest.approx([index * 2 for index in sample.frame_indices], abs=3)
+
+
+def test_sampled_frames_match_legacy_selection(counter_video):
+    sample = sample_video_frames(counter_video, target_num_screenshots=20, dedup_threshold=0)
+
+    # The last index from nframes lies past the end of the video
+    assert sample.frame_indices == list(range(0, 120, 7))
+    assert sample.frames_read == len(sample.images) == len(sample.frame_indices)
+    levels = [int(np.asarray(image)[0, 0, 0]) for image in sample.images]
+    assert levels == pytest.approx([index * 2 % 256 for index in sample.frame_indices], abs=3)
+
+
+def test_webm_without_header_duration_is_sampled(counter_video, tmp_path):
+    # Streamed WebM (like MediaRecorder output) has no duration in its header
+    path = str(tmp_path / "recording.webm")
+    webm = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-v", "error", "-i", counter_video]
+        + ["-c:v", "libvpx", "-f", "webm", "-"],
+        capture_output=True,
+        check=True,
+    )
+    with open(path, "wb") as webm_file:
+        webm_file.write(webm.stdout)
+
+    sample = sample_video_frames(path, target_num_screenshots=5, dedup_threshold=0)
+
+    assert sample.total_frames == 120
+    assert sample.frame_indices == [0, 24, 48, 72, 96]
+
+
+def test_video_that_yields_no_frames_raises(counter_video, monkeypatch):
+    real_read_frames = imageio_ffmpeg.read_frames
+
+    def header_only(path: str, **kwargs):
+        # ffmpeg reports the stream but the select filter matches nothing
+        reader = real_read_frames(path)
+        yield next(reader)
+        reader.close()
+
+    monkeypatch.setattr(imageio_ffmpeg, "read_frames", header_only)
+
+    with pytest.raises(ValueError):
+        sample_video_frames(counter_video, target_num_screenshots=5, dedup_threshold=0)
+
+
+def test_static_frames_are_deduplicated_around_scene_changes(tmp_path):
+    path = str(tmp_path / "scenes.mp4")
+    scene_starts = {0: 1, 30: 2, 45: 3, 90: 4}
+    frames = []
+    for index in range(4 * FPS):
+        seed = scene_starts.get(index)
+        frames.append(scene(seed) if seed else frames[-1])
+    write_video(path, frames)
+
+    sample = sample_video_frames(path, target_num_screenshots=5, dedup_threshold=6)
+
+    # One frame per scene, from the denser candidate grid (every 7th frame)
+    assert sample.frame_indices == [0, 35, 49, 91]
+    assert sample.baseline_frames == 5
+    assert sample.duplicates_dropped == sample.frames_read - 4
+
+
+def test_selector_keeps_biggest_changes_within_budget():
+    base = scene(1)
+    small_change = base.copy()
+    small_change[:16, :64] = 255 - small_change[:16, :64]
+    selector = FrameSelector(budget=2, threshold=0)
+
+    selector.add(0, Image.fromarray(base))
+    selector.add(1, Image.fromarray(base))
+    selector.add(2, Image.fromarray(small_change))
+    selector.add(3, Image.fromarray(scene(2)))
+
+    assert selector.duplicates_dropped == 1
+    assert selector.frame_indices == [0, 3]
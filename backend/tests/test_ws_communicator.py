@@ -0,0 +1,124 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from routes.generate_code import (
+    DisconnectMonitorMiddleware,
+    PipelineContext,
+    WebSocketCommunicator,
+)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames: List[Dict[str, Any]] = []
+        self.closed = False
+
+    async def send_text(self, text: str) -> None:
+        self.frames.append(json.loads(text))
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_merged_per_variant_and_page():
+    websocket = FakeWebSocket()
+    comm = WebSocketCommunicator(websocket, flush_interval=0.01)  # type: ignore
+
+    for text in ["<html>", "<body>", "</body>"]:
+        await comm.send_message("chunk", text, 0, 0)
+    await comm.send_message("chunk", "<svg>", 1, 0)
+    await asyncio.sleep(0.05)
+
+    assert websocket.frames == [
+        {"type": "chunk", "value": "<html><body></body>", "variantIndex": 0, "pageIndex": 0},
+        {"type": "chunk", "value": "<svg>", "variantIndex": 1, "pageIndex": 0},
+    ]
+    assert comm.stats()["chunks_received"] == 4
+    assert comm.stats()["frames_sent"] == 2
+
+
+@pytest.mark.asyncio
+async def test_set_code_flushes_pending_chunks_first():
+    websocket = FakeWebSocket()
+    comm = WebSocketCommunicator(websocket, flush_interval=10)  # type: ignore
+
+    await comm.send_message("chunk", "partial", 0, 0)
+    await comm.send_message("setCode", "<html></html>", 0, 0)
+
+    assert [frame["type"] for frame in websocket.frames] == ["chunk", "setCode"]
+    await comm.close()
+
+
+@pytest.mark.asyncio
+async def test_size_limit_triggers_immediate_flush():
+    websocket = FakeWebSocket()
+    comm = WebSocketCommunicator(websocket, flush_interval=10, flush_max_bytes=8)  # type: ignore
+
+    await comm.send_message("chunk", "1234", 0, 0)
+    assert websocket.frames == []
+    await comm.send_message("chunk", "5678", 0, 0)
+
+    assert websocket.frames[0]["value"] == "12345678"
+    await comm.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_buffered_chunks():
+    websocket = FakeWebSocket()
+    comm = WebSocketCommunicator(websocket, flush_interval=10)  # type: ignore
+
+    await comm.send_message("chunk", "tail", 2, 1)
+    await comm.close()
+
+    assert websocket.frames[-1]["value"] == "tail"
+    assert websocket.closed
+
+
+class DisconnectingWebSocket(FakeWebSocket):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    async def receive(self) -> Dict[str, Any]:
+        await asyncio.sleep(self.delay)
+        return {"type": "websocket.disconnect", "code": 1001}
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_rest_of_pipeline():
+    websocket = DisconnectingWebSocket(delay=0.01)
+    context = PipelineContext(websocket=websocket)  # type: ignore
+    context.ws_comm = WebSocketCommunicator(websocket)  # type: ignore
+    cancelled = asyncio.Event()
+
+    async def slow_generation() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    await DisconnectMonitorMiddleware().process(context, slow_generation)
+
+    assert cancelled.is_set()
+    assert context.ws_comm.client_disconnected
+    assert context.ws_comm.is_closed
+
+
+@pytest.mark.asyncio
+async def test_pipeline_finishing_first_is_not_cancelled():
+    websocket = DisconnectingWebSocket(delay=10)
+    context = PipelineContext(websocket=websocket)  # type: ignore
+    context.ws_comm = WebSocketCommunicator(websocket)  # type: ignore
+    finished: List[bool] = []
+
+    async def fast_generation() -> None:
+        finished.append(True)
+
+    await DisconnectMonitorMiddleware().process(context, fast_generation)
+
+    assert finished == [True]
+    assert not context.ws_comm.client_disconnected
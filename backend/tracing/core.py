@@ -0,0 +1,155 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List
+
+from config import PIPELINE_TRACE_DIR
+from metrics.core import histogram
+
+# Output tokens per second, from a slow reasoning model to a fast small one
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800)
+
+stage_seconds = histogram(
+    "generation_stage_seconds",
+    "Time spent in each pipeline stage, excluding the stages it wraps",
+    ("stage",),
+)
+span_seconds = histogram(
+    "generation_span_seconds",
+    "Duration of timed steps within a generation",
+    ("span",),
+)
+variant_queue_seconds = histogram(
+    "generation_variant_queue_seconds",
+    "Time variant requests waited for a provider slot",
+    ("model",),
+)
+variant_ttft_seconds = histogram(
+    "generation_variant_ttft_seconds",
+    "Time from a variant's provider request to its first token",
+    ("model",),
+)
+variant_seconds = histogram(
+    "generation_variant_seconds", "Total time to generate a variant", ("model",)
+)
+variant_tokens_per_second = histogram(
+    "generation_variant_tokens_per_second",
+    "Output tokens per second after a variant's first token",
+    ("model",),
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+
+
+class RequestTrace:
+    """Timed spans of one generation request
+
+    Spans always feed the latency histograms. They are only kept, and written
+    to `directory` as JSON, when a directory is set, so tracing can stay on
+    in production.
+    """
+
+    def __init__(self, directory: str | None = None):
+        self.id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.directory = PIPELINE_TRACE_DIR if directory is None else directory
+        self.keep_spans = bool(self.directory)
+        self.spans: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    def stage(self, name: str, start: float, duration: float) -> None:
+        """Record a pipeline stage's own time (perf_counter start)"""
+        stage_seconds.observe(duration, stage=name)
+        self._keep("stage", name, start, duration)
+
+    def variant(
+        self,
+        index: int,
+        model: str,
+        start: float,
+        duration: float,
+        queue_wait: float,
+        ttft: float | None,
+        output_tokens: float,
+        error: bool,
+    ) -> None:
+        variant_seconds.observe(duration, model=model)
+        variant_queue_seconds.observe(queue_wait, model=model)
+        tokens_per_second = None
+        if ttft is not None:
+            variant_ttft_seconds.observe(ttft, model=model)
+            streaming = duration - queue_wait - ttft
+            if streaming > 0 and output_tokens:
+                tokens_per_second = output_tokens / streaming
+                variant_tokens_per_second.observe(tokens_per_second, model=model)
+        self._keep(
+            "variant",
+            f"variant {index}",
+            start,
+            duration,
+            model=model,
+            queue_wait=queue_wait,
+            ttft=ttft,
+            tokens_per_second=tokens_per_second,
+            error=error,
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            span_seconds.observe(duration, span=name)
+            self._keep("span", name, start, duration, **attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "started_at": self.started_at,
+            "duration": time.perf_counter() - self._start,
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+    def write(self) -> str:
+        """Write the trace as JSON and return the file path"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.id}.json")
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump(self.to_dict(), trace_file, indent=2)
+        return path
+
+    def _keep(
+        self, kind: str, name: str, start: float, duration: float, **attributes: Any
+    ) -> None:
+        if self.keep_spans:
+            self.spans.append(
+                {
+                    "kind": kind,
+                    "name": name,
+                    # Seconds since the request started
+                    "start": round(start - self._start, 6),
+                    "duration": round(duration, 6),
+                    **attributes,
+                }
+            )
+
+
+# The trace of the request being handled, for code outside the pipeline classes
+current_trace: ContextVar[RequestTrace | None] = ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time a step of the current request; a no-op outside of one"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attributes):
+        yield
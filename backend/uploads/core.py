@@ -0,0 +1,177 @@
+import asyncio
+import base64
+import contextlib
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict
+
+from config import (
+    UPLOAD_DIR,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_MAX_TOTAL_BYTES,
+    UPLOAD_TTL_SECONDS,
+)
+from metrics.core import counter, gauge
+
+# Prefix of the references clients send in place of a data URL
+UPLOAD_URL_PREFIX = "upload:"
+
+# Media types an upload may have to be inlined as a prompt image
+IMAGE_MEDIA_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp"})
+
+uploads_stored = counter("uploads_stored_total", "Files uploaded to disk")
+uploads_rejected = counter(
+    "uploads_rejected_total",
+    "Uploads rejected for exceeding a size cap",
+    ("reason",),
+)
+uploads_expired = counter("uploads_expired_total", "Uploads deleted after their TTL")
+upload_bytes = gauge("upload_bytes", "Bytes held on disk by uploads")
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLargeError(UploadError):
+    pass
+
+
+class UploadStorageFullError(UploadError):
+    pass
+
+
+@dataclass
+class Upload:
+    id: str
+    path: str
+    media_type: str
+    size: int
+    created_at: float
+
+    @property
+    def url(self) -> str:
+        return UPLOAD_URL_PREFIX + self.id
+
+
+def is_upload_url(url: str) -> bool:
+    return url.startswith(UPLOAD_URL_PREFIX)
+
+
+class UploadStore:
+    """Files streamed to disk in chunks, so an upload never sits in memory whole
+
+    Each upload is capped at `max_bytes` and deleted `ttl_seconds` after it
+    was written. Uploads are rejected while the ones on disk, including those
+    still being written, add up to more than `max_total_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: str = UPLOAD_DIR,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        ttl_seconds: float = UPLOAD_TTL_SECONDS,
+        max_total_bytes: int = UPLOAD_MAX_TOTAL_BYTES,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._uploads: Dict[str, Upload] = {}
+
+    async def save_stream(
+        self, chunks: AsyncIterator[bytes], media_type: str
+    ) -> Upload:
+        self.evict_expired()
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, upload_id)
+        size = 0
+        try:
+            with open(path, "wb") as upload_file:
+                async for chunk in chunks:
+                    if size + len(chunk) > self.max_bytes:
+                        uploads_rejected.inc(reason="size")
+                        raise UploadTooLargeError(
+                            f"Upload exceeds the {self.max_bytes} byte limit."
+                        )
+                    size += len(chunk)
+                    # Reserve the space as it's written, so concurrent uploads
+                    # can't overshoot the total together
+                    self.total_bytes += len(chunk)
+                    if self.total_bytes > self.max_total_bytes:
+                        uploads_rejected.inc(reason="storage")
+                        raise UploadStorageFullError("Upload storage is full.")
+                    await asyncio.to_thread(upload_file.write, chunk)
+        except BaseException:
+            self.total_bytes -= size
+            # open() itself may have failed, leaving nothing to clean up
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            raise
+
+        upload = Upload(upload_id, path, media_type, size, time.monotonic())
+        self._uploads[upload_id] = upload
+        upload_bytes.set(self.total_bytes)
+        uploads_stored.inc()
+        return upload
+
+    def get(self, upload_url: str) -> Upload:
+        """Look up an upload by its "upload:<id>" reference"""
+        upload_id = upload_url[len(UPLOAD_URL_PREFIX) :]
+        upload = self._uploads.get(upload_id)
+        if upload is None or self._is_expired(upload):
+            raise UploadError(f"Upload {upload_id} not found or expired.")
+        return upload
+
+    def delete(self, upload_id: str) -> None:
+        upload = self._uploads.pop(upload_id, None)
+        if upload is None:
+            return
+        self.total_bytes -= upload.size
+        upload_bytes.set(self.total_bytes)
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass
+
+    def evict_expired(self) -> None:
+        for upload in list(self._uploads.values()):
+            if self._is_expired(upload):
+                self.delete(upload.id)
+                uploads_expired.inc()
+
+    def clear(self) -> None:
+        for upload_id in list(self._uploads):
+            self.delete(upload_id)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _is_expired(self, upload: Upload) -> bool:
+        return time.monotonic() - upload.created_at > self.ttl_seconds
+
+
+upload_store = UploadStore()
+
+
+def _read_data_url(upload: Upload) -> str:
+    with open(upload.path, "rb") as upload_file:
+        data = base64.b64encode(upload_file.read()).decode("ascii")
+    return f"data:{upload.media_type};base64,{data}"
+
+
+async def resolve_image_url(url: str) -> str:
+    """Data URL for an "upload:<id>" reference; other URLs are returned as is
+
+    Providers need images inline, so uploaded screenshots are read back and
+    encoded once the request that references them arrives.
+    """
+    if not is_upload_url(url):
+        return url
+    upload = upload_store.get(url)
+    if upload.media_type not in IMAGE_MEDIA_TYPES:
+        raise UploadError(f"Upload {upload.id} is not an image ({upload.media_type}).")
+    return await asyncio.to_thread(_read_data_url, upload)
@@ -0,0 +1,67 @@
+import math
+from dataclasses import dataclass
+
+from PIL import Image
+
+from image_processing.hashing import dhash, hamming_distance
+
+# Bits per side of the difference hash; UI changes like an opened menu or a
+# line of typed text are too small to show up in the usual 8x8 hash
+FRAME_HASH_SIZE = 16
+
+
+@dataclass
+class KeptFrame:
+    index: int
+    image: Image.Image
+    hash: int
+    # Hamming distance to the previous kept frame, i.e. how much changed
+    change: float
+
+
+class FrameSelector:
+    """Keeps informative frames from a stream of candidate frames in video order
+
+    A candidate within `threshold` bits of the last kept frame is dropped as a
+    near-duplicate. When more than `budget` distinct frames arrive, the one
+    that changed least from its predecessor is merged away, so the frames
+    that remain sit around the biggest scene changes. At most budget + 1
+    images are held at a time.
+    """
+
+    def __init__(self, budget: int, threshold: int, hash_size: int = FRAME_HASH_SIZE):
+        self.budget = budget
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.kept: list[KeptFrame] = []
+        self.duplicates_dropped = 0
+
+    def add(self, index: int, image: Image.Image) -> None:
+        frame_hash = dhash(image, self.hash_size)
+        if not self.kept:
+            self.kept.append(KeptFrame(index, image, frame_hash, math.inf))
+            return
+
+        change = hamming_distance(frame_hash, self.kept[-1].hash)
+        if change <= self.threshold:
+            self.duplicates_dropped += 1
+            return
+        self.kept.append(KeptFrame(index, image, frame_hash, change))
+
+        if len(self.kept) > self.budget:
+            # The first frame is always kept (its change is infinite)
+            position = min(range(len(self.kept)), key=lambda i: self.kept[i].change)
+            del self.kept[position]
+            if position < len(self.kept):
+                successor = self.kept[position]
+                successor.change = hamming_distance(
+                    successor.hash, self.kept[position - 1].hash
+                )
+
+    @property
+    def frame_indices(self) -> list[int]:
+        return [frame.index for frame in self.kept]
+
+    @property
+    def images(self) -> list[Image.Image]:
+        return [frame.image for frame in self.kept]
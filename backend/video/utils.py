@@ -4,21 +4,50 @@ import io
 import mimetypes
 import os
 import tempfile
+import time
 import uuid
-from typing import Any, Union, cast
-from moviepy.editor import VideoFileClip  # type: ignore
+from dataclasses import dataclass
+from typing import Any, Union
+import imageio_ffmpeg  # type: ignore
 from PIL import Image
 import math
 
+from config import VIDEO_FRAME_DEDUP_THRESHOLD, VIDEO_FRAME_OVERSAMPLE
+from image_processing.executor import run_image_task
+from metrics.core import counter
+from uploads.core import is_upload_url, upload_store
+from video.frame_selection import FrameSelector
+
 
 DEBUG = True
 TARGET_NUM_SCREENSHOTS = (
     20  # Should be max that Claude supports (20) - reduce to save tokens on testing
 )
 
+frames_read = counter(
+    "video_frames_read_total", "Video frames converted to RGB and read from ffmpeg"
+)
+frames_sampled = counter(
+    "video_frames_sampled_total", "Video frames kept as screenshots"
+)
+frames_deduplicated = counter(
+    "video_frames_deduplicated_total", "Sampled video frames dropped as near-duplicates"
+)
+frame_bytes_saved = counter(
+    "video_frame_bytes_saved_total",
+    "Estimated base64 bytes not sent because fewer frames were needed",
+)
+
 
 async def assemble_claude_prompt_video(video_data_url: str) -> list[Any]:
-    images = split_video_into_screenshots(video_data_url)
+    # Decoding runs in the image executor so it doesn't block the event loop
+    if is_upload_url(video_data_url):
+        # Uploaded videos are already on disk; read frames straight from there
+        upload = upload_store.get(video_data_url)
+        sample = await run_image_task(sample_video_file, upload.path)
+    else:
+        sample = await run_image_task(sample_video_data_url, video_data_url)
+    images = sample.images
 
     # Save images to tmp if we're debugging
     if DEBUG:
@@ -30,16 +59,13 @@ async def assemble_claude_prompt_video(video_data_url: str) -> list[Any]:
         print(f"Too many screenshots: {len(images)}")
         raise ValueError("Too many screenshots extracted from video")
 
+    # JPEG-encode the frames off the event loop
+    encoded_images = await run_image_task(encode_images_as_jpeg, images)
+    record_dedup_stats(sample, encoded_images)
+
     # Convert images to the message format for Claude
     content_messages: list[dict[str, Union[dict[str, str], str]]] = []
-    for image in images:
-
-        # Convert Image to buffer
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-
-        # Encode bytes as base64
-        base64_data = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    for base64_data in encoded_images:
         media_type = "image/jpeg"
 
         content_messages.append(
@@ -61,10 +87,118 @@ async def assemble_claude_prompt_video(video_data_url: str) -> list[Any]:
     ]
 
 
+@dataclass
+class FrameSample:
+    images: list[Image.Image]
+    frame_indices: list[int]
+    frames_read: int
+    total_frames: int
+    # Frames the plain every-nth sampler would have sent
+    baseline_frames: int = 0
+    duplicates_dropped: int = 0
+
+
+# Indices of the frames to keep: every nth frame, up to the target number
+def sample_frame_indices(total_frames: int, target_num_screenshots: int) -> list[int]:
+    # Calculate frame skip interval by dividing total frames by the target number of screenshots
+    # Ensuring a minimum skip of 1 frame
+    frame_skip = max(1, math.ceil(total_frames / target_num_screenshots))
+    return list(range(0, total_frames, frame_skip))[:target_num_screenshots]
+
+
+# Pulls the candidate frames out of ffmpeg in a single pass and keeps the
+# informative ones
+def sample_video_frames(
+    video_path: str,
+    target_num_screenshots: int = TARGET_NUM_SCREENSHOTS,
+    dedup_threshold: int = VIDEO_FRAME_DEDUP_THRESHOLD,
+    oversample: int = VIDEO_FRAME_OVERSAMPLE,
+) -> FrameSample:
+    fps, duration = _probe_video(video_path)
+    if duration > 0 and fps > 0:
+        # Same frame count estimate moviepy used for the old iter_frames loop
+        total_frames = int(duration * fps) + 1
+    else:
+        # WebM recorded by MediaRecorder has no duration in its header, so
+        # decode the video once to count its frames
+        total_frames, _ = imageio_ffmpeg.count_frames_and_secs(video_path)
+        fps = fps if fps > 0 else 1.0
+        duration = total_frames / fps
+
+    def playable_indices(num_frames: int) -> list[int]:
+        # The estimate can overshoot by one; only keep frames that start before the end
+        return [
+            index
+            for index in sample_frame_indices(total_frames, num_frames)
+            if index / fps < duration
+        ]
+
+    baseline_indices = playable_indices(target_num_screenshots)
+    dedup = dedup_threshold > 0
+    # Hash more candidates than there are slots, so frames around scene
+    # changes can replace the near-duplicates that get dropped
+    candidate_indices = (
+        playable_indices(target_num_screenshots * max(1, oversample))
+        if dedup
+        else baseline_indices
+    )
+    selector = FrameSelector(target_num_screenshots, dedup_threshold)
+    images: list[Image.Image] = []
+    read_indices: list[int] = []
+    if not candidate_indices:
+        raise ValueError("No frames found in video")
+
+    # The select filter drops every other frame right after decoding, so only
+    # the sampled frames are scaled, converted to RGB and piped back to us
+    select = "+".join(rf"eq(n\,{index})" for index in candidate_indices)
+    reader = imageio_ffmpeg.read_frames(
+        video_path, output_params=["-vf", f"select='{select}'", "-vsync", "0"]
+    )
+    try:
+        meta = next(reader)
+        for index, frame in zip(candidate_indices, reader):
+            image = Image.frombytes("RGB", meta["size"], frame)
+            read_indices.append(index)
+            if dedup:
+                selector.add(index, image)
+            else:
+                images.append(image)
+    finally:
+        reader.close()
+
+    read_count = len(read_indices)
+    if not read_count:
+        raise ValueError("No frames could be extracted from video")
+    if dedup:
+        images = selector.images
+        read_indices = selector.frame_indices
+
+    return FrameSample(
+        images=images,
+        frame_indices=read_indices,
+        frames_read=read_count,
+        total_frames=total_frames,
+        baseline_frames=len(baseline_indices),
+        duplicates_dropped=selector.duplicates_dropped,
+    )
+
+
+def _probe_video(video_path: str) -> tuple[float, float]:
+    """(fps, duration) of a video, read from ffmpeg's header output"""
+    reader = imageio_ffmpeg.read_frames(video_path)
+    try:
+        meta = next(reader)
+    finally:
+        reader.close()
+    return meta["fps"], meta["duration"]
+
+
 # Returns a list of images/frame (RGB format)
 def split_video_into_screenshots(video_data_url: str) -> list[Image.Image]:
-    target_num_screenshots = TARGET_NUM_SCREENSHOTS
+    return sample_video_data_url(video_data_url).images
 
+
+def sample_video_data_url(video_data_url: str) -> FrameSample:
     # Decode the base64 URL to get the video bytes
     video_encoded_data = video_data_url.split(",")[1]
     video_bytes = base64.b64decode(video_encoded_data)
@@ -76,28 +210,46 @@ def split_video_into_screenshots(video_data_url: str) -> list[Image.Image]:
         print(temp_video_file.name)
         temp_video_file.write(video_bytes)
         temp_video_file.flush()
-        clip = VideoFileClip(temp_video_file.name)
-        images: list[Image.Image] = []
-        total_frames = cast(int, clip.reader.nframes)  # type: ignore
-
-        # Calculate frame skip interval by dividing total frames by the target number of screenshots
-        # Ensuring a minimum skip of 1 frame
-        frame_skip = max(1, math.ceil(total_frames / target_num_screenshots))
-
-        # Iterate over each frame in the clip
-        for i, frame in enumerate(clip.iter_frames()):
-            # Save every nth frame
-            if i % frame_skip == 0:
-                frame_image = Image.fromarray(frame)  # type: ignore
-                images.append(frame_image)
-                # Ensure that we don't capture more than the desired number of frames
-                if len(images) >= target_num_screenshots:
-                    break
-
-        # Close the video file to release resources
-        clip.close()
-
-        return images
+        return sample_video_file(temp_video_file.name)
+
+
+def sample_video_file(video_path: str) -> FrameSample:
+    start_time = time.perf_counter()
+    sample = sample_video_frames(video_path)
+    frames_read.inc(sample.frames_read)
+    frames_sampled.inc(len(sample.images))
+    print(
+        f"[VIDEO] Kept {len(sample.images)} frames, decoding "
+        f"{sample.frames_read} of {sample.total_frames} "
+        f"in {time.perf_counter() - start_time:.2f}s"
+    )
+    return sample
+
+
+def record_dedup_stats(sample: FrameSample, encoded_images: list[str]) -> None:
+    frames_deduplicated.inc(sample.duplicates_dropped)
+    frames_saved = sample.baseline_frames - len(encoded_images)
+    if frames_saved <= 0 or not encoded_images:
+        return
+    # Dropped frames are never encoded; assume they'd be as big as the rest
+    average_size = sum(len(data) for data in encoded_images) / len(encoded_images)
+    bytes_saved = int(frames_saved * average_size)
+    frame_bytes_saved.inc(bytes_saved)
+    print(
+        f"[VIDEO] Dropped {sample.duplicates_dropped} near-duplicate frames, sending "
+        f"{len(encoded_images)} instead of {sample.baseline_frames} "
+        f"(~{bytes_saved / 1024:.0f} KB saved)"
+    )
+
+
+# Returns the base64-encoded JPEG bytes of each image
+def encode_images_as_jpeg(images: list[Image.Image]) -> list[str]:
+    encoded_images: list[str] = []
+    for image in images:
+        buffered = io.BytesIO()
+        image.save(buffered, format="JPEG")
+        encoded_images.append(base64.b64encode(buffered.getvalue()).decode("utf-8"))
+    return encoded_images
 
 
 # Save a list of PIL images to a random temporary directory
@@ -1,2 +1,4 @@
 # WebSocket protocol (RFC 6455) allows for the use of custom close codes in the range 4000-4999
 APP_ERROR_WEB_SOCKET_CODE = 4332
+# Sent to a connection whose resumable session was taken over by a newer resume
+SESSION_SUPERSEDED_WEB_SOCKET_CODE = 4333